@@ -0,0 +1,340 @@
+"""
+Cgroup v2 správa VMM procesů.
+Každý Firecracker proces běží ve vlastní cgroup pod společným kořenem
+s limity memory.max, cpu.max/cpu.weight, pids.max a io.max odvozenými
+ze SecurityPolicy. Využití (memory.current, cpu.stat, io.stat) se čte
+přes trvale otevřené deskriptory jedním průchodem za vzorkovací interval,
+takže dotaz na statistiky sandboxu nestojí žádný subprocess ani open().
+
+Kořen je konfigurovatelný - lze použít i delegovanou uživatelskou cgroup
+(např. systemd služba s Delegate=yes), control-plane pak nepotřebuje root.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CGROUP_ROOT = "/sys/fs/cgroup/novasandbox"
+CONTROLLERS = ("cpu", "memory", "pids", "io")
+STAT_FILES = ("memory.current", "cpu.stat", "io.stat")
+
+CPU_PERIOD_US = 100_000
+# Paměť VMM procesu nad rámec paměti guestu (kód, buffery zařízení)
+VMM_MEMORY_OVERHEAD_MB = 64
+# Vlákna VMM mimo vCPU (vmm, api, pomocná vlákna)
+VMM_BASE_THREADS = 16
+_READ_CHUNK = 65536
+
+
+@dataclass
+class CgroupLimits:
+    """Limity jedné cgroup ve formátu cgroup v2"""
+    memory_max: int                      # Bajty
+    cpu_quota_us: Optional[int] = None   # None = bez omezení
+    cpu_period_us: int = CPU_PERIOD_US
+    cpu_weight: int = 100
+    pids_max: Optional[int] = None
+    io_max: Dict[str, Dict[str, int]] = field(default_factory=dict)  # "maj:min" -> limity
+
+    def to_files(self) -> Dict[str, str]:
+        """Obsah řídicích souborů (víceřádkové hodnoty se zapisují po řádcích)"""
+        files = {
+            "memory.max": str(self.memory_max),
+            "cpu.max": f"{self.cpu_quota_us if self.cpu_quota_us else 'max'} {self.cpu_period_us}",
+            "cpu.weight": str(self.cpu_weight),
+            "pids.max": str(self.pids_max) if self.pids_max else "max",
+        }
+        if self.io_max:
+            files["io.max"] = "\n".join(
+                device + "".join(f" {key}={value}" for key, value in sorted(limits.items()))
+                for device, limits in sorted(self.io_max.items())
+            )
+        return files
+
+
+def block_device_of(path: str, sys_dev_block: str = "/sys/dev/block") -> Optional[str]:
+    """
+    Číslo blokového zařízení ("maj:min") s daným souborem. Oddíl se převede
+    na celý disk (io.max přijímá jen disky); pro souborové systémy bez
+    blokového zařízení (tmpfs, overlay) vrací None.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    device = f"{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+    sys_path = Path(sys_dev_block) / device
+    if not sys_path.exists():
+        return None
+    if (sys_path / "partition").exists():
+        try:
+            device = (sys_path.resolve().parent / "dev").read_text().strip()
+        except OSError:
+            return None
+    return device
+
+
+def limits_from_policy(policy, config=None, io_device: Optional[str] = None) -> CgroupLimits:
+    """
+    Limity VMM procesu z politiky. Paměť a vCPU konfigurace sandboxu jsou
+    shora omezeny politikou; io.max se nastaví jen se známým zařízením.
+    """
+    memory_mb = policy.max_memory_mb
+    vcpus = policy.max_vcpus
+    if config is not None:
+        memory_mb = min(config.memory_mb, memory_mb)
+        vcpus = min(config.vcpus, vcpus)
+
+    io_max: Dict[str, Dict[str, int]] = {}
+    if io_device is not None:
+        limits = {}
+        if policy.max_disk_mbps:
+            limits["rbps"] = limits["wbps"] = policy.max_disk_mbps * 1024 * 1024
+        if policy.max_disk_iops:
+            limits["riops"] = limits["wiops"] = policy.max_disk_iops
+        if limits:
+            io_max[io_device] = limits
+
+    return CgroupLimits(
+        memory_max=(memory_mb + VMM_MEMORY_OVERHEAD_MB) * 1024 * 1024,
+        cpu_quota_us=vcpus * CPU_PERIOD_US,
+        cpu_weight=policy.cpu_weight,
+        pids_max=min(policy.max_processes, vcpus + VMM_BASE_THREADS),
+        io_max=io_max,
+    )
+
+
+def _read_fd(fd: int) -> bytes:
+    chunk = os.pread(fd, _READ_CHUNK, 0)
+    if len(chunk) < _READ_CHUNK:
+        return chunk
+    chunks = [chunk]
+    offset = len(chunk)
+    while chunk:
+        chunk = os.pread(fd, _READ_CHUNK, offset)
+        chunks.append(chunk)
+        offset += len(chunk)
+    return b"".join(chunks)
+
+
+def _parse_flat_keyed(data: bytes) -> Dict[str, int]:
+    """cpu.stat: řádky 'klíč hodnota'"""
+    values = {}
+    for line in data.split(b"\n"):
+        key, _, value = line.partition(b" ")
+        if value:
+            values[key.decode()] = int(value)
+    return values
+
+
+def _parse_io_stat(data: bytes) -> Dict[str, int]:
+    """io.stat: 'maj:min rbytes=.. wbytes=..' - součet přes zařízení"""
+    totals = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+    for line in data.split(b"\n"):
+        for item in line.split(b" ")[1:]:
+            key, _, value = item.partition(b"=")
+            name = key.decode()
+            if name in totals:
+                totals[name] += int(value)
+    return totals
+
+
+class _Group:
+    __slots__ = ("path", "fds")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fds: Dict[str, int] = {}
+
+    def read(self) -> Dict[str, bytes]:
+        """Přečte statistické soubory; deskriptory se otevírají jen poprvé"""
+        data = {}
+        for name in STAT_FILES:
+            fd = self.fds.get(name)
+            if fd is None:
+                try:
+                    fd = self.fds[name] = os.open(self.path / name, os.O_RDONLY | os.O_CLOEXEC)
+                except OSError:
+                    continue  # Controller není povolen
+            try:
+                data[name] = _read_fd(fd)
+            except OSError:
+                os.close(self.fds.pop(name))
+        return data
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds.clear()
+
+
+class CgroupManager:
+    """Cgroup v2 pro VMM procesy s levným vzorkováním využití"""
+
+    def __init__(self, root: str = DEFAULT_CGROUP_ROOT, sample_interval_s: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.root = Path(root)
+        self.sample_interval_s = sample_interval_s
+        self._clock = clock
+        self.controllers: Optional[Set[str]] = None  # Po setup(): povolené controllery
+        self._groups: Dict[str, _Group] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._sampled_at: Optional[float] = None
+
+    def setup(self) -> Set[str]:
+        """Vytvoří kořen a povolí controllery pro podřízené cgroup"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        try:
+            available = set((self.root / "cgroup.controllers").read_text().split())
+        except OSError:
+            available = set()
+        wanted = [name for name in CONTROLLERS if name in available]
+        if wanted:
+            try:
+                self._write(self.root / "cgroup.subtree_control",
+                            " ".join(f"+{name}" for name in wanted))
+            except OSError as e:
+                logger.warning(f"Cannot enable cgroup controllers in {self.root}: {e}")
+                wanted = []
+        missing = set(CONTROLLERS) - set(wanted)
+        if missing:
+            logger.warning(f"Cgroup controllers not available in {self.root}: {sorted(missing)}")
+        self.controllers = set(wanted)
+        return self.controllers
+
+    @staticmethod
+    def _write(path: Path, value: str):
+        with open(path, "w") as f:
+            f.write(value)
+
+    def __contains__(self, sandbox_id: str) -> bool:
+        return sandbox_id in self._groups
+
+    def path(self, sandbox_id: str) -> Path:
+        return self.root / sandbox_id
+
+    def create(self, sandbox_id: str, limits: CgroupLimits) -> Path:
+        """Vytvoří cgroup sandboxu a zapíše limity dostupných controllerů"""
+        if self.controllers is None:
+            self.setup()
+        path = self.path(sandbox_id)
+        path.mkdir(exist_ok=True)
+        for name, value in limits.to_files().items():
+            if name.partition(".")[0] not in self.controllers:
+                continue
+            # io.max přijímá jedno zařízení na zápis
+            for line in value.split("\n"):
+                try:
+                    self._write(path / name, line)
+                except OSError as e:
+                    logger.warning(f"Cannot set {name}={line!r} for {sandbox_id}: {e}")
+        self._groups[sandbox_id] = _Group(path)
+        return path
+
+    def adopt(self, sandbox_id: str) -> bool:
+        """Převezme existující cgroup (po restartu control-plane)"""
+        path = self.path(sandbox_id)
+        if not path.is_dir():
+            return False
+        self._groups.setdefault(sandbox_id, _Group(path))
+        return True
+
+    @contextmanager
+    def spawn_into(self, sandbox_id: str) -> Iterator[Optional[Callable[[], None]]]:
+        """
+        Vrací preexec_fn, který potomka přesune do cgroup ještě před exec,
+        takže limity platí od první alokace VMM. Deskriptor cgroup.procs se
+        otevírá v rodiči, potomek jen zapisuje.
+        """
+        try:
+            fd = os.open(self.path(sandbox_id) / "cgroup.procs", os.O_WRONLY | os.O_CLOEXEC)
+        except OSError as e:
+            logger.warning(f"Cannot open cgroup of {sandbox_id}, spawning unconfined: {e}")
+            yield None
+            return
+        try:
+            # "0" = zapisující proces
+            yield lambda: os.write(fd, b"0")
+        finally:
+            os.close(fd)
+
+    def attach(self, sandbox_id: str, pid: int):
+        """Přesune běžící proces do cgroup sandboxu"""
+        self._write(self.path(sandbox_id) / "cgroup.procs", str(pid))
+
+    def remove(self, sandbox_id: str, kill: bool = False):
+        """Zruší cgroup; s kill=True nejdřív ukončí zbylé procesy (cgroup.kill)"""
+        group = self._groups.pop(sandbox_id, None)
+        if group is not None:
+            group.close()
+        self._stats.pop(sandbox_id, None)
+        path = self.path(sandbox_id)
+        if kill:
+            try:
+                self._write(path / "cgroup.kill", "1")
+            except OSError:
+                pass
+        try:
+            os.rmdir(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"Cannot remove cgroup {path}: {e}")
+
+    def sample(self) -> Dict[str, Dict[str, Any]]:
+        """Jeden průchod čtením statistik všech cgroup"""
+        now = self._clock()
+        elapsed = now - self._sampled_at if self._sampled_at is not None else 0.0
+        previous = self._stats
+        stats: Dict[str, Dict[str, Any]] = {}
+        for sandbox_id, group in self._groups.items():
+            raw = group.read()
+            cpu = _parse_flat_keyed(raw.get("cpu.stat", b""))
+            io = _parse_io_stat(raw.get("io.stat", b""))
+            memory = int(raw.get("memory.current") or 0)
+            usage_us = cpu.get("usage_usec", 0)
+
+            cpu_percent = 0.0
+            before = previous.get(sandbox_id)
+            if before is not None and elapsed > 0:
+                delta = usage_us - before["cpu_usage_us"]
+                cpu_percent = max(0.0, delta / (elapsed * 1e6) * 100)
+
+            stats[sandbox_id] = {
+                "memory_bytes": memory,
+                "memory_usage_mb": memory / (1024 * 1024),
+                "cpu_usage_us": usage_us,
+                "cpu_user_us": cpu.get("user_usec", 0),
+                "cpu_system_us": cpu.get("system_usec", 0),
+                "cpu_throttled_us": cpu.get("throttled_usec", 0),
+                "nr_throttled": cpu.get("nr_throttled", 0),
+                "cpu_percent": cpu_percent,
+                "io_read_bytes": io["rbytes"],
+                "io_write_bytes": io["wbytes"],
+                "io_read_ops": io["rios"],
+                "io_write_ops": io["wios"],
+            }
+        self._stats = stats
+        self._sampled_at = now
+        return stats
+
+    def stats(self, sandbox_id: str) -> Dict[str, Any]:
+        """Statistiky sandboxu z posledního vzorku (nový vzorek jednou za interval)"""
+        if sandbox_id not in self._groups:
+            return {}
+        if (self._sampled_at is None or sandbox_id not in self._stats
+                or self._clock() - self._sampled_at >= self.sample_interval_s):
+            self.sample()
+        return self._stats.get(sandbox_id, {})
+
+    def close(self):
+        """Zavře deskriptory všech cgroup (cgroup samotné zůstávají)"""
+        for group in self._groups.values():
+            group.close()
+        self._groups.clear()
+        self._stats.clear()
@@ -0,0 +1,255 @@
+"""
+In-process pub/sub sběrnice událostí sandboxů.
+Témata: změny stavu (`state`), fáze bootu (`boot`), porušení politik
+(`violation`) a periodické statistiky (`stats`). Každý odběratel má
+vlastní omezenou frontu s politikou zahazování, takže pomalý odběratel
+nezpomalí publikující kód ani ostatní odběratele. Odběry jsou indexované
+podle tématu a sandboxu; bez odběratelů publikace nic nealokuje.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("state", "boot", "violation", "stats")
+
+DROP_OLDEST = "drop_oldest"  # Plná fronta zahodí nejstarší událost
+DROP_NEWEST = "drop_newest"  # Plná fronta zahodí příchozí událost
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+_SubscriptionKey = Tuple[Optional[str], Optional[str]]  # (téma, sandbox_id)
+
+
+@dataclass(frozen=True)
+class BusEvent:
+    """Událost na sběrnici"""
+    topic: str
+    sandbox_id: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    labels: Mapping[str, str] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+class SubscriptionClosed(Exception):
+    """Odběr byl zrušen"""
+
+
+class Subscription:
+    """Odběr s omezenou frontou; čte se přes `await get()` nebo `async for`"""
+
+    def __init__(self, bus: "EventBus", topics: Optional[Tuple[str, ...]],
+                 sandbox_id: Optional[str], labels: Optional[Dict[str, str]],
+                 maxsize: int, drop_policy: str):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self._bus = bus
+        self.topics = topics
+        self.sandbox_id = sandbox_id
+        self.labels = labels
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._events: Deque[BusEvent] = deque()
+        self._waiter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def _keys(self) -> List[_SubscriptionKey]:
+        return [(topic, self.sandbox_id) for topic in (self.topics or (None,))]
+
+    def _offer(self, event: BusEvent):
+        if self.labels:
+            for key, value in self.labels.items():
+                if event.labels.get(key) != value:
+                    return
+        if len(self._events) >= self.maxsize:
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return
+            self._events.popleft()
+        self._events.append(event)
+        self.delivered += 1
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def get_nowait(self) -> Optional[BusEvent]:
+        """Další událost nebo None"""
+        return self._events.popleft() if self._events else None
+
+    def drain(self) -> List[BusEvent]:
+        """Vybere všechny čekající události"""
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    async def get(self) -> BusEvent:
+        """Počká na další událost; po close() vyhodí SubscriptionClosed"""
+        while not self._events:
+            if self.closed:
+                raise SubscriptionClosed()
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._events.popleft()
+
+    def close(self):
+        """Zruší odběr; čekající get() skončí"""
+        if self.closed:
+            return
+        self.closed = True
+        self._bus._unsubscribe(self)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> BusEvent:
+        if self.closed and not self._events:
+            raise StopAsyncIteration
+        try:
+            return await self.get()
+        except SubscriptionClosed:
+            raise StopAsyncIteration from None
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    """Sběrnice událostí; publish() je synchronní a nikdy neblokuje"""
+
+    def __init__(self, default_maxsize: int = 1024):
+        self.default_maxsize = default_maxsize
+        self._subscriptions: Dict[_SubscriptionKey, List[Subscription]] = {}
+        self._topic_counts: Dict[Optional[str], int] = {}
+        self.published = 0
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None, sandbox_id: Optional[str] = None,
+                  labels: Optional[Dict[str, str]] = None, maxsize: Optional[int] = None,
+                  drop_policy: str = DROP_OLDEST) -> Subscription:
+        """
+        Přihlásí odběr. Bez `topics` odebírá všechna témata, bez `sandbox_id`
+        všechny sandboxy; `labels` musí všechny souhlasit s labely sandboxu.
+        """
+        subscription = Subscription(
+            self, tuple(topics) if topics is not None else None, sandbox_id,
+            dict(labels) if labels else None, maxsize or self.default_maxsize, drop_policy
+        )
+        for key in subscription._keys():
+            self._subscriptions.setdefault(key, []).append(subscription)
+            self._topic_counts[key[0]] = self._topic_counts.get(key[0], 0) + 1
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        for key in subscription._keys():
+            subscriptions = self._subscriptions.get(key)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                if not subscriptions:
+                    del self._subscriptions[key]
+                self._topic_counts[key[0]] -= 1
+
+    def has_subscribers(self, topic: str) -> bool:
+        """Má téma nějakého odběratele (včetně odběrů všech témat)"""
+        return bool(self._topic_counts.get(topic) or self._topic_counts.get(None))
+
+    def publish(self, topic: str, sandbox_id: str, data: Optional[Dict[str, Any]] = None,
+                labels: Optional[Mapping[str, str]] = None,
+                timestamp: Optional[float] = None) -> int:
+        """Doručí událost odpovídajícím odběrům; vrací počet kandidátů"""
+        if not self._subscriptions:
+            return 0
+        subscriptions = self._subscriptions
+        candidates = []
+        for key in ((topic, sandbox_id), (topic, None), (None, sandbox_id), (None, None)):
+            matched = subscriptions.get(key)
+            if matched:
+                candidates.extend(matched)
+        if not candidates:
+            return 0
+
+        event = BusEvent(
+            topic=topic,
+            sandbox_id=sandbox_id,
+            data=data if data is not None else {},
+            labels=labels if labels is not None else {},
+            timestamp=time.time() if timestamp is None else timestamp
+        )
+        self.published += 1
+        for subscription in candidates:
+            subscription._offer(event)
+        return len(candidates)
+
+    def get_metrics(self) -> Dict[str, int]:
+        subscriptions = {id(s): s for group in self._subscriptions.values() for s in group}
+        return {
+            "subscriptions": len(subscriptions),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in subscriptions.values()),
+        }
+
+
+class StatsTicker:
+    """
+    Periodicky publikuje statistiky sandboxů do tématu `stats`.
+    Statistiky se čtou, jen pokud má téma odběratele.
+    """
+
+    def __init__(self, hypervisor, bus: EventBus, interval_s: float = 1.0):
+        self.hypervisor = hypervisor
+        self.bus = bus
+        self.interval_s = interval_s
+        self._task: Optional[asyncio.Task] = None
+
+    async def tick(self) -> int:
+        """Jeden průchod; vrací počet publikovaných statistik"""
+        if not self.bus.has_subscribers("stats"):
+            return 0
+        published = 0
+        for sandbox_id, sandbox in list(self.hypervisor._sandboxes.items()):
+            stats = await self.hypervisor.get_sandbox_stats(sandbox_id)
+            if stats:
+                self.bus.publish("stats", sandbox_id, stats, labels=sandbox.config.labels)
+                published += 1
+        return published
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Stats tick failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        """Spustí publikaci na pozadí v aktuální event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Zastaví publikaci"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,439 @@
+"""
+Trvalý append-only log událostí (porušení politik, změny stavu, exec).
+Události jsou binární rámce v segmentových souborech; zápis je
+group-commit - rámce se sbírají v paměti a vlastní vlákno je zapíše
+a fsyncne jednou za `flush_interval_ms` nebo po `flush_bytes`.
+`append()` jen vloží rámec do fronty, takže audit nikdy neblokuje
+operace sandboxu (při přeplnění fronty se událost zahodí a započítá).
+
+Rámec:   <u32 délka payloadu><u32 crc32><f64 čas><u8 typ><u16 délka id>
+         <sandbox_id><payload JSON>
+Index:   ke každému segmentu `.idx` se záznamem na blok ~`block_bytes`:
+         <u64 offset><u32 délka><f64 min čas><f64 max čas><u64 maska sandboxů>
+Čtení přeskočí bloky mimo časový rozsah nebo bez bitu hledaného sandboxu;
+konec segmentu za posledním indexovaným blokem se čte sekvenčně.
+"""
+import copy
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {"violation": 1, "state": 2, "exec": 3, "lifecycle": 4}
+_EVENT_NAMES = {code: name for name, code in EVENT_TYPES.items()}
+
+_FRAME = struct.Struct("<IIdBH")
+_FRAME_TAIL = struct.Struct("<dBH")  # Část hlavičky pokrytá CRC
+_INDEX = struct.Struct("<QIddQ")
+SEGMENT_PATTERN = "events-{:08d}.log"
+
+
+def sandbox_bit(sandbox_id: str) -> int:
+    """Bit sandboxu v 64bitové masce bloku (Bloom filtr s jednou hash funkcí)"""
+    return 1 << (zlib.crc32(sandbox_id.encode()) & 63)
+
+
+def encode_frame(timestamp: float, event_type: str, sandbox_id: str,
+                 data: Optional[Dict[str, Any]] = None) -> bytes:
+    """Zakóduje událost do rámce"""
+    try:
+        code = EVENT_TYPES[event_type]
+    except KeyError:
+        raise ValueError(f"Unknown event type: {event_type}") from None
+    sid = sandbox_id.encode()
+    payload = json.dumps(data or {}, separators=(",", ":"), default=str).encode()
+    tail = _FRAME_TAIL.pack(timestamp, code, len(sid))
+    crc = zlib.crc32(payload, zlib.crc32(sid, zlib.crc32(tail)))
+    return b"".join((struct.pack("<II", len(payload), crc), tail, sid, payload))
+
+
+def iter_frames(buffer: bytes, offset: int = 0) -> Iterator[Tuple[int, int, float, int, bytes, bytes]]:
+    """
+    Projde rámce v bufferu; vrací (offset, konec, čas, typ, sandbox_id, payload).
+    Skončí na prvním neúplném nebo poškozeném rámci.
+    """
+    size = len(buffer)
+    header_size = _FRAME.size
+    while offset + header_size <= size:
+        length, crc, timestamp, code, sid_length = _FRAME.unpack_from(buffer, offset)
+        start = offset + header_size
+        end = start + sid_length + length
+        if end > size:
+            return
+        if zlib.crc32(buffer[offset + 8:end]) != crc:
+            return
+        yield offset, end, timestamp, code, buffer[start:start + sid_length], buffer[start + sid_length:end]
+        offset = end
+
+
+@dataclass
+class Event:
+    """Událost přečtená z logu"""
+    timestamp: float
+    event_type: str
+    sandbox_id: str
+    data: Dict[str, Any]
+
+
+@dataclass
+class EventLogMetrics:
+    """Metriky zapisovače"""
+    appended: int = 0
+    dropped: int = 0
+    committed: int = 0
+    batches: int = 0
+    fsyncs: int = 0
+    bytes_written: int = 0
+    errors: int = 0
+    last_commit_ms: float = 0.0
+
+
+class _Block:
+    """Statistiky rozpracovaného bloku pro sparse index"""
+    __slots__ = ("offset", "length", "min_ts", "max_ts", "mask")
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        self.length = 0
+        self.min_ts = float("inf")
+        self.max_ts = float("-inf")
+        self.mask = 0
+
+    def add(self, length: int, timestamp: float, bit: int):
+        self.length += length
+        if timestamp < self.min_ts:
+            self.min_ts = timestamp
+        if timestamp > self.max_ts:
+            self.max_ts = timestamp
+        self.mask |= bit
+
+    def pack(self) -> bytes:
+        return _INDEX.pack(self.offset, self.length, self.min_ts, self.max_ts, self.mask)
+
+
+def _segment_paths(directory: Path) -> List[Path]:
+    return sorted(directory.glob("events-*.log"))
+
+
+def _read_index(index_path: Path, data_size: int) -> List[Tuple[int, int, float, float, int]]:
+    """Platné záznamy indexu (neúplný záznam a bloky za koncem dat se ignorují)"""
+    try:
+        raw = index_path.read_bytes()
+    except FileNotFoundError:
+        return []
+    entries = []
+    for i in range(len(raw) // _INDEX.size):
+        entry = _INDEX.unpack_from(raw, i * _INDEX.size)
+        if entry[0] + entry[1] > data_size:
+            break
+        entries.append(entry)
+    return entries
+
+
+class EventLog:
+    """Zapisovač logu událostí s group commitem ve vlastním vlákně"""
+
+    def __init__(self, directory: str, flush_interval_ms: float = 20.0,
+                 flush_bytes: int = 256 * 1024, block_bytes: int = 64 * 1024,
+                 segment_bytes: int = 64 * 1024 * 1024,
+                 max_pending_bytes: int = 32 * 1024 * 1024, fsync: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.flush_bytes = flush_bytes
+        self.block_bytes = block_bytes
+        self.segment_bytes = segment_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self.fsync = fsync
+        self.metrics = EventLogMetrics()
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._committed = threading.Condition(self._lock)
+        self._pending: List[Tuple[bytes, float, int]] = []
+        self._pending_bytes = 0
+        self._appended_seq = 0
+        self._committed_seq = 0
+        self._failed_seq = 0  # Poslední sekvence dávky, jejíž zápis selhal
+        self._flush_requested = False
+        self._closed = False
+
+        # Stav segmentu vlastní jen vlákno zapisovače (a _recover před jeho startem)
+        self._segment_no = 0
+        self._data_fd = -1
+        self._index_fd = -1
+        self._offset = 0
+        self._block: Optional[_Block] = None
+        self._recover()
+
+        self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+        self._thread.start()
+
+    # --- API pro producenty -------------------------------------------------
+
+    def append(self, event_type: str, sandbox_id: str, data: Optional[Dict[str, Any]] = None,
+               timestamp: Optional[float] = None) -> bool:
+        """
+        Zařadí událost k zápisu, nikdy neblokuje na I/O. Vrací False,
+        pokud byla událost zahozena (log zavřen nebo fronta plná).
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        frame = encode_frame(timestamp, event_type, sandbox_id, data)
+        bit = sandbox_bit(sandbox_id)
+        with self._lock:
+            if self._closed or self._pending_bytes + len(frame) > self.max_pending_bytes:
+                self.metrics.dropped += 1
+                return False
+            self._pending.append((frame, timestamp, bit))
+            self._pending_bytes += len(frame)
+            self._appended_seq += 1
+            self.metrics.appended += 1
+            if self._pending_bytes >= self.flush_bytes:
+                self._wakeup.notify()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Počká, až budou trvale zapsány všechny dosud přijaté události.
+        Vrací False při vypršení timeoutu nebo pokud se část z nich
+        nepodařilo zapsat.
+        """
+        with self._lock:
+            target = self._appended_seq
+            durable = self._committed_seq
+            self._flush_requested = True
+            self._wakeup.notify()
+            if not self._committed.wait_for(lambda: self._committed_seq >= target, timeout):
+                return False
+            return self._failed_seq <= durable
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Zapíše frontu a ukončí zapisovač"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join(timeout)
+        if self._data_fd >= 0:
+            os.close(self._data_fd)
+            os.close(self._index_fd)
+            self._data_fd = self._index_fd = -1
+
+    def reader(self) -> "EventLogReader":
+        return EventLogReader(str(self.directory))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return asdict(self.metrics)
+
+    # --- Vlákno zapisovače --------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if (not self._closed and not self._flush_requested
+                        and self._pending_bytes < self.flush_bytes):
+                    self._wakeup.wait(self.flush_interval_s)
+                batch = self._pending
+                self._pending = []
+                self._pending_bytes = 0
+                self._flush_requested = False
+                target = self._appended_seq
+                closing = self._closed
+            failed = False
+            if batch:
+                try:
+                    self._commit(batch)
+                except OSError as e:
+                    failed = True
+                    self.metrics.errors += 1
+                    logger.error(f"Event log commit of {len(batch)} events failed: {e}")
+            with self._lock:
+                if failed:
+                    self._failed_seq = target
+                self._committed_seq = target
+                self._committed.notify_all()
+            if closing:
+                return
+
+    def _commit(self, batch: List[Tuple[bytes, float, int]]):
+        start = time.perf_counter()
+        chunk: List[bytes] = []
+        index_entries: List[bytes] = []
+        checkpoint = self._checkpoint()
+        for frame, timestamp, bit in batch:
+            if self._offset > 0 and self._offset + len(frame) > self.segment_bytes:
+                self._write_out(chunk, index_entries, checkpoint)
+                chunk, index_entries = [], []
+                self._rotate()
+                checkpoint = self._checkpoint()
+            chunk.append(frame)
+            self._account(len(frame), timestamp, bit, index_entries)
+        self._write_out(chunk, index_entries, checkpoint)
+
+        self.metrics.committed += len(batch)
+        self.metrics.batches += 1
+        self.metrics.last_commit_ms = (time.perf_counter() - start) * 1000
+
+    def _account(self, length: int, timestamp: float, bit: int, index_entries: List[bytes]):
+        """Započte rámec do bloku; plný blok uzavře do indexu"""
+        if self._block is None:
+            self._block = _Block(self._offset)
+        self._block.add(length, timestamp, bit)
+        self._offset += length
+        if self._block.length >= self.block_bytes:
+            index_entries.append(self._block.pack())
+            self._block = None
+
+    def _checkpoint(self) -> Tuple[int, int, Optional[_Block]]:
+        """Stav segmentu před zápisem, ke kterému se vrací neúspěšný zápis"""
+        return self._offset, os.fstat(self._index_fd).st_size, copy.copy(self._block)
+
+    def _write_out(self, chunk: List[bytes], index_entries: List[bytes],
+                   checkpoint: Tuple[int, int, Optional[_Block]]):
+        try:
+            if chunk:
+                data = b"".join(chunk)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self._data_fd, view):]
+                self.metrics.bytes_written += len(data)
+                if self.fsync:
+                    os.fdatasync(self._data_fd)
+                    self.metrics.fsyncs += 1
+            if index_entries:
+                # Index se zapisuje až po datech a je obnovitelný - bez fsync
+                os.write(self._index_fd, b"".join(index_entries))
+        except OSError:
+            self._rollback(checkpoint)
+            raise
+
+    def _rollback(self, checkpoint: Tuple[int, int, Optional[_Block]]):
+        """
+        Vrátí segment do stavu před neúspěšným zápisem. Částečný rámec
+        by jinak zůstal uprostřed segmentu a další zápisy by za ním
+        čtení (i obnova po restartu) už nenašlo.
+        """
+        offset, index_size, block = checkpoint
+        try:
+            os.ftruncate(self._data_fd, offset)
+            os.ftruncate(self._index_fd, index_size)
+        except OSError as e:
+            logger.error(f"Event log rollback of segment {self._segment_no} failed: {e}")
+        self._offset = offset
+        self._block = block
+
+    def _rotate(self):
+        """Uzavře segment (včetně posledního bloku v indexu) a otevře další"""
+        if self._block is not None:
+            os.write(self._index_fd, self._block.pack())
+            self._block = None
+        os.close(self._data_fd)
+        os.close(self._index_fd)
+        self._open_segment(self._segment_no + 1)
+
+    def _open_segment(self, number: int):
+        self._segment_no = number
+        path = self.directory / SEGMENT_PATTERN.format(number)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | os.O_CLOEXEC
+        self._data_fd = os.open(path, flags, 0o640)
+        self._index_fd = os.open(path.with_suffix(".idx"), flags, 0o640)
+        self._offset = os.fstat(self._data_fd).st_size
+        self._block = None
+
+    def _recover(self):
+        """
+        Otevře poslední segment: ořízne poškozený konec (nedokončený zápis
+        při pádu) a doplní index pro bloky, které se nestihly zaindexovat.
+        """
+        segments = _segment_paths(self.directory)
+        if not segments:
+            self._open_segment(1)
+            return
+        path = segments[-1]
+        number = int(path.stem.split("-")[1])
+        data = path.read_bytes()
+        index_path = path.with_suffix(".idx")
+        entries = _read_index(index_path, len(data))
+        indexed_end = entries[-1][0] + entries[-1][1] if entries else 0
+        with open(index_path, "ab") as f:
+            f.truncate(len(entries) * _INDEX.size)
+
+        valid_end = indexed_end
+        frames = []
+        for offset, end, timestamp, _, sid, _ in iter_frames(data, indexed_end):
+            frames.append((end - offset, timestamp, sandbox_bit(sid.decode())))
+            valid_end = end
+        if valid_end < len(data):
+            logger.warning(f"Truncating {len(data) - valid_end} torn bytes from {path}")
+            with open(path, "r+b") as f:
+                f.truncate(valid_end)
+
+        self._open_segment(number)
+        self._offset = indexed_end
+        index_entries: List[bytes] = []
+        for length, timestamp, bit in frames:
+            self._account(length, timestamp, bit, index_entries)
+        if index_entries:
+            os.write(self._index_fd, b"".join(index_entries))
+
+
+class EventLogReader:
+    """Streamované čtení logu s filtrem podle sandboxu, času a typu"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def _blocks(self, path: Path) -> Iterator[Tuple[int, int, Optional[Tuple[float, float, int]]]]:
+        """Bloky segmentu (offset, délka, statistiky); nezaindexovaný konec bez statistik"""
+        size = path.stat().st_size
+        end = 0
+        for offset, length, min_ts, max_ts, mask in _read_index(path.with_suffix(".idx"), size):
+            yield offset, length, (min_ts, max_ts, mask)
+            end = offset + length
+        if end < size:
+            yield end, size - end, None
+
+    def read(self, sandbox_id: Optional[str] = None, since: Optional[float] = None,
+             until: Optional[float] = None,
+             event_types: Optional[Iterable[str]] = None) -> Iterator[Event]:
+        """Události v pořadí zápisu odpovídající filtrům"""
+        sid_filter = sandbox_id.encode() if sandbox_id is not None else None
+        bit = sandbox_bit(sandbox_id) if sandbox_id is not None else 0
+        codes = {EVENT_TYPES[name] for name in event_types} if event_types is not None else None
+
+        for path in _segment_paths(self.directory):
+            with open(path, "rb") as f:
+                for offset, length, stats in self._blocks(path):
+                    if stats is not None:
+                        min_ts, max_ts, mask = stats
+                        if since is not None and max_ts < since:
+                            continue
+                        if until is not None and min_ts > until:
+                            continue
+                        if bit and not mask & bit:
+                            continue
+                    buffer = os.pread(f.fileno(), length, offset)
+                    for _, _, timestamp, code, sid, payload in iter_frames(buffer):
+                        if sid_filter is not None and sid != sid_filter:
+                            continue
+                        if since is not None and timestamp < since:
+                            continue
+                        if until is not None and timestamp > until:
+                            continue
+                        if codes is not None and code not in codes:
+                            continue
+                        yield Event(
+                            timestamp=timestamp,
+                            event_type=_EVENT_NAMES.get(code, str(code)),
+                            sandbox_id=sid.decode(),
+                            data=json.loads(payload)
+                        )
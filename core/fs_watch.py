@@ -0,0 +1,138 @@
+"""
+Sledování změn v adresářích pomocí inotify (Linux).
+Bez externích závislostí - volá libc přes ctypes.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+DEFAULT_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+_libc = _load_libc()
+HAS_INOTIFY = _libc is not None
+
+
+class DirectoryWatcher:
+    """
+    Sleduje adresáře (nerekurzivně) a pro každou změnu zavolá
+    callback(path, mask) z vlákna na pozadí.
+    """
+
+    def __init__(self, callback: Callable[[str, int], None], mask: int = DEFAULT_MASK):
+        if not HAS_INOTIFY:
+            raise OSError("inotify is not available on this platform")
+        self.callback = callback
+        self.mask = mask
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def add_watch(self, path: str):
+        """Přidá adresář ke sledování"""
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(path), self.mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        with self._lock:
+            self._watches[wd] = path
+
+    def start(self):
+        """Spustí čtecí vlákno"""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, name="novasandbox-inotify", daemon=True
+            )
+            self._thread.start()
+
+    def close(self):
+        """Zastaví vlákno a uvolní deskriptory"""
+        self._running = False
+        if self._thread is not None:
+            os.write(self._wakeup_w, b"x")
+            self._thread.join(timeout=5)
+            self._thread = None
+        for fd in (self._fd, self._wakeup_r, self._wakeup_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _run(self):
+        while self._running:
+            readable, _, _ = select.select([self._fd, self._wakeup_r], [], [])
+            if self._wakeup_r in readable:
+                return
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                logger.error(f"inotify read failed: {e}")
+                return
+            self._dispatch(data)
+
+    def _dispatch(self, data: bytes):
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            with self._lock:
+                base = self._watches.get(wd)
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+            if base is None:
+                continue
+
+            path = os.path.join(base, os.fsdecode(name)) if name else base
+            try:
+                self.callback(path, mask)
+            except Exception as e:
+                logger.error(f"Watcher callback failed for {path}: {e}")
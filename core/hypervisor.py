@@ -3,17 +3,40 @@ Univerzální abstrakce pro různé hypervisory.
 Zajišťuje jednotné API pro Firecracker, Apple VZ a další.
 """
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 from enum import Enum
-from typing import Optional, Dict, Any, List
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping, Sequence
 import asyncio
 import json
+import sys
 import time
 import logging
-from .security import SecurityPolicy, SecurityLevel, DEFAULT_POLICIES
+from .security import SecurityPolicy, SecurityLevel, DEFAULT_POLICIES, intern_policy
+from .event_bus import EventBus
+from .registry import SandboxRegistry
+from .leases import LeaseManager
 
 logger = logging.getLogger(__name__)
 
+# Sdílené výchozí kontejnery (copy-on-write: změna = přiřazení nového objektu)
+EMPTY_LABELS: Mapping[str, str] = MappingProxyType({})
+EMPTY_DRIVES: Sequence[Dict[str, Any]] = ()
+DEFAULT_KERNEL_ARGS = "console=ttyS0 reboot=k panic=1"
+
+
+def slotted_dataclass(cls):
+    """@dataclass se __slots__ (ekvivalent slots=True i pro Python 3.9)"""
+    if sys.version_info >= (3, 10):
+        return dataclass(cls, slots=True)
+    cls = dataclass(cls)
+    namespace = dict(cls.__dict__)
+    names = tuple(f.name for f in fields(cls))
+    for name in names + ("__dict__", "__weakref__"):
+        namespace.pop(name, None)
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
 class SandboxState(Enum):
     """Stavy sandboxu pro sledování životního cyklu"""
     CREATED = "created"
@@ -23,14 +46,19 @@ class SandboxState(Enum):
     STOPPED = "stopped"
     ERROR = "error"
 
-@dataclass
+@slotted_dataclass
 class SandboxConfig:
-    """Konfigurace pro vytvoření sandboxu"""
+    """
+    Konfigurace pro vytvoření sandboxu. Prázdné `labels` a `extra_drives`
+    sdílí všechny instance jako neměnné výchozí hodnoty - pro změnu se
+    přiřadí nový slovník / seznam.
+    """
     template_id: str = "alpine-python"
     memory_mb: int = 512
     vcpus: int = 2
     boot_timeout_ms: int = 5000
-    kernel_args: str = "console=ttyS0 reboot=k panic=1"
+    kernel_args: str = DEFAULT_KERNEL_ARGS  # Vlastní hodnota má přednost před výchozím profilem
+    boot_profile: Optional[str] = None  # Profil kernel args ze šablony (přebíjí kernel_args)
     
     # Síťová konfigurace
     enable_network: bool = True
@@ -39,23 +67,52 @@ class SandboxConfig:
     
     # Úložiště
     rootfs_path: Optional[str] = None
-    extra_drives: List[Dict[str, str]] = None
+    extra_drives: Sequence[Dict[str, Any]] = None
     
     # Metadata
-    labels: Dict[str, str] = None
+    labels: Mapping[str, str] = None
+    
+    # Lease - sandbox se po vypršení automaticky zastaví
+    ttl_s: Optional[float] = None  # Maximální doba života od vytvoření
+    idle_timeout_s: Optional[float] = None  # Zastavení po nečinnosti (exec, renew)
     
     # Bezpečnost
     security_level: SecurityLevel = SecurityLevel.STANDARD
     custom_security_policy: Optional[SecurityPolicy] = None
     
     def __post_init__(self):
-        if self.extra_drives is None:
-            self.extra_drives = []
-        if self.labels is None:
-            self.labels = {}
+        if not self.extra_drives:
+            self.extra_drives = EMPTY_DRIVES
+        if not self.labels:
+            self.labels = EMPTY_LABELS
+        if self.custom_security_policy is not None:
+            # Sandboxy se stejnou politikou sdílí jednu instanci
+            self.custom_security_policy = intern_policy(self.custom_security_policy)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializuje konfiguraci do JSON-kompatibilního slovníku"""
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        data["extra_drives"] = [dict(drive) for drive in self.extra_drives]
+        data["labels"] = dict(self.labels)
+        data["security_level"] = self.security_level.value
+        if self.custom_security_policy is not None:
+            data["custom_security_policy"] = self.custom_security_policy.to_dict()
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SandboxConfig':
+        """Vytvoří konfiguraci ze slovníku vytvořeného pomocí to_dict()"""
+        data = dict(data)
+        if "security_level" in data:
+            data["security_level"] = SecurityLevel(data["security_level"])
+        if data.get("custom_security_policy") is not None:
+            data["custom_security_policy"] = SecurityPolicy.from_dict(
+                data["custom_security_policy"]
+            )
+        return cls(**data)
     
     def get_security_policy(self) -> SecurityPolicy:
-        """Vrátí efektivní bezpečnostní politiku"""
+        """Vrátí efektivní bezpečnostní politiku (sdílenou instanci s kontrolami)"""
         if self.custom_security_policy:
             return self.custom_security_policy
         return DEFAULT_POLICIES.get(self.security_level, DEFAULT_POLICIES[SecurityLevel.STANDARD])
@@ -65,7 +122,14 @@ class BaseHypervisor(ABC):
     
     def __init__(self, hypervisor_path: Optional[str] = None):
         self.hypervisor_path = hypervisor_path
-        self._sandboxes: Dict[str, 'Sandbox'] = {}
+        self._sandboxes = SandboxRegistry()
+        self.event_bus: Optional[EventBus] = None  # Sběrnice událostí stavu a bootu
+        self.leases = LeaseManager(self)  # TTL a idle timeout (úklid spouští leases.start())
+    
+    @property
+    def registry(self) -> SandboxRegistry:
+        """Indexovaný registr sandboxů tohoto hypervisoru"""
+        return self._sandboxes
         
     @abstractmethod
     async def create_sandbox(self, config: SandboxConfig) -> 'Sandbox':
@@ -82,6 +146,20 @@ class BaseHypervisor(ABC):
         """Zastaví sandbox"""
         pass
     
+    async def stop_sandboxes(self, sandbox_ids: Sequence[str],
+                             force: bool = False) -> Dict[str, bool]:
+        """Zastaví více sandboxů souběžně; vrací výsledek pro každý sandbox"""
+        results = await asyncio.gather(
+            *(self.stop_sandbox(sandbox_id, force=force) for sandbox_id in sandbox_ids),
+            return_exceptions=True
+        )
+        stopped = {}
+        for sandbox_id, result in zip(sandbox_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to stop sandbox {sandbox_id}: {result}")
+            stopped[sandbox_id] = result is True
+        return stopped
+    
     @abstractmethod
     async def pause_sandbox(self, sandbox_id: str) -> bool:
         """Pozastaví sandbox"""
@@ -92,11 +170,22 @@ class BaseHypervisor(ABC):
         """Obnoví pozastavený sandbox"""
         pass
     
+    async def reset_sandbox(self, sandbox_id: str) -> bool:
+        """Vrátí běžící sandbox do čistého stavu šablony (bez nového vytvoření)"""
+        raise NotImplementedError(f"{type(self).__name__} does not support sandbox reset")
+    
     @abstractmethod
     async def get_sandbox_stats(self, sandbox_id: str) -> Dict[str, Any]:
         """Získá statistiky sandboxu"""
         pass
     
+    def get_owned_resources(self) -> Dict[str, set]:
+        """
+        Vrátí prostředky hostitele, které hypervisor aktuálně vlastní
+        (adresáře, TAP rozhraní, PID procesů). Používá OrphanReconciler.
+        """
+        return {"dirs": set(), "taps": set(), "pids": set()}
+    
     @property
     @abstractmethod
     def supported_platform(self) -> str:
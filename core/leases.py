@@ -0,0 +1,237 @@
+"""
+Leasy sandboxů: TTL a idle timeout s automatickým úklidem.
+Každý sledovaný sandbox má v timer wheelu jeden časovač na bližší z obou
+termínů. Aktivita (exec, renew) jen posune čas poslední aktivity, časovač
+se přeplánuje až při vypršení - `touch()` je tak O(1) bez zásahu do kola.
+Vypršelé sandboxy se zastavují v dávkách přes `stop_sandboxes()`;
+neúspěšné zastavení se opakuje s exponenciálním odstupem.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+import logging
+
+from .timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+# Odstup opakování neúspěšného zastavení (zdvojuje se až do maxima)
+LEASE_RETRY_BASE_S = 5.0
+LEASE_RETRY_MAX_S = 300.0
+
+
+@dataclass
+class LeaseMetrics:
+    """Metriky správce leasů"""
+    expired_ttl: int = 0
+    expired_idle: int = 0
+    reaped: int = 0
+    renewals: int = 0
+    retries: int = 0
+    errors: int = 0
+
+
+@dataclass
+class _Lease:
+    __slots__ = ("expires_at", "idle_timeout_s", "last_activity")
+    expires_at: Optional[float]  # Absolutní konec TTL (time.time)
+    idle_timeout_s: Optional[float]
+    last_activity: float
+
+    def deadline(self) -> Optional[float]:
+        deadlines = [d for d in (
+            self.expires_at,
+            self.last_activity + self.idle_timeout_s if self.idle_timeout_s else None
+        ) if d is not None]
+        return min(deadlines) if deadlines else None
+
+
+class LeaseManager:
+    """Sleduje TTL a nečinnost sandboxů hypervisoru a vypršelé zastavuje"""
+
+    def __init__(self, hypervisor, tick_s: float = 0.5, batch_size: int = 256,
+                 clock: Callable[[], float] = time.time):
+        self.hypervisor = hypervisor
+        self.tick_s = tick_s
+        self.batch_size = batch_size
+        self.clock = clock
+        self.metrics = LeaseMetrics()
+        self._leases: Dict[str, _Lease] = {}
+        self._wheel = TimerWheel(tick_s=tick_s, clock=clock)
+        self._expired: List[str] = []
+        self._failures: Dict[str, int] = {}  # Neúspěšná zastavení po vypršení
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._leases)
+
+    def __contains__(self, sandbox_id: str) -> bool:
+        return sandbox_id in self._leases
+
+    def _reschedule(self, sandbox_id: str, lease: _Lease):
+        deadline = lease.deadline()
+        if deadline is None:
+            self._wheel.cancel(sandbox_id)
+        else:
+            self._wheel.schedule(sandbox_id, deadline)
+
+    def track(self, sandbox) -> bool:
+        """
+        Začne sledovat sandbox podle `config.ttl_s` a `config.idle_timeout_s`.
+        TTL běží od `created_at`, takže po reattach pokračuje původní lease.
+        """
+        config = sandbox.config
+        if not config.ttl_s and not config.idle_timeout_s:
+            return False
+        lease = _Lease(
+            expires_at=sandbox.created_at + config.ttl_s if config.ttl_s else None,
+            idle_timeout_s=config.idle_timeout_s,
+            last_activity=self.clock()
+        )
+        self._leases[sandbox.sandbox_id] = lease
+        self._reschedule(sandbox.sandbox_id, lease)
+        return True
+
+    def release(self, sandbox_id: str):
+        """Přestane sledovat sandbox (zastavení, smazání)"""
+        self._failures.pop(sandbox_id, None)
+        if self._leases.pop(sandbox_id, None) is not None:
+            self._wheel.cancel(sandbox_id)
+
+    def touch(self, sandbox_id: str):
+        """Zaznamená aktivitu sandboxu (odsouvá idle timeout)"""
+        lease = self._leases.get(sandbox_id)
+        if lease is not None:
+            lease.last_activity = self.clock()
+
+    def renew(self, sandbox_id: str, ttl_s: Optional[float] = None) -> Optional[float]:
+        """
+        Prodlouží TTL na `ttl_s` (výchozí `config.ttl_s`) od teď a zaznamená
+        aktivitu. Vrací zbývající dobu leasu v sekundách.
+        """
+        sandbox = self.hypervisor._sandboxes.get(sandbox_id)
+        if sandbox is None:
+            raise KeyError(sandbox_id)
+        ttl_s = ttl_s if ttl_s is not None else sandbox.config.ttl_s
+        lease = self._leases.get(sandbox_id)
+        now = self.clock()
+        if lease is None:
+            lease = self._leases[sandbox_id] = _Lease(None, sandbox.config.idle_timeout_s, now)
+        if ttl_s:
+            lease.expires_at = now + ttl_s
+        lease.last_activity = now
+        self._failures.pop(sandbox_id, None)
+        self.metrics.renewals += 1
+        self._reschedule(sandbox_id, lease)
+        return self.remaining(sandbox_id)
+
+    def remaining(self, sandbox_id: str) -> Optional[float]:
+        """Zbývající doba leasu v sekundách (None = bez omezení)"""
+        lease = self._leases.get(sandbox_id)
+        if lease is None:
+            return None
+        deadline = lease.deadline()
+        return max(0.0, deadline - self.clock()) if deadline is not None else None
+
+    def get_lease(self, sandbox_id: str) -> Optional[Dict[str, Optional[float]]]:
+        """Popis leasu pro API"""
+        lease = self._leases.get(sandbox_id)
+        if lease is None:
+            return None
+        return {
+            "expires_at": lease.expires_at,
+            "idle_timeout_s": lease.idle_timeout_s,
+            "last_activity": lease.last_activity,
+            "remaining_s": self.remaining(sandbox_id),
+        }
+
+    def collect_expired(self, now: Optional[float] = None) -> List[str]:
+        """
+        Posune timer wheel a vrátí sandboxy, jejichž lease opravdu vypršel.
+        Časovače odsunuté aktivitou se jen přeplánují.
+        """
+        now = self.clock() if now is None else now
+        expired = []
+        for sandbox_id in self._wheel.advance(now):
+            lease = self._leases.get(sandbox_id)
+            if lease is None:
+                continue
+            deadline = lease.deadline()
+            if deadline is not None and deadline > now:
+                self._wheel.schedule(sandbox_id, deadline)
+                continue
+            del self._leases[sandbox_id]
+            if sandbox_id not in self._failures:  # Opakované zastavení je už započtené
+                if lease.expires_at is not None and lease.expires_at <= now:
+                    self.metrics.expired_ttl += 1
+                else:
+                    self.metrics.expired_idle += 1
+            expired.append(sandbox_id)
+        return expired
+
+    async def reap_once(self, now: Optional[float] = None) -> int:
+        """Zastaví sandboxy s vypršelým leasem; vrací počet zastavených"""
+        now = self.clock() if now is None else now
+        self._expired.extend(self.collect_expired(now))
+        reaped = 0
+        while self._expired:
+            batch = self._expired[:self.batch_size]
+            results = await self.hypervisor.stop_sandboxes(batch, force=True)
+            # Zpracovanou dávku odebereme až po zastavení (zrušení nic neztratí)
+            del self._expired[:len(batch)]
+            stopped = []
+            for sandbox_id in batch:
+                if results.get(sandbox_id):
+                    stopped.append(sandbox_id)
+                    self._failures.pop(sandbox_id, None)
+                else:
+                    self._retry(sandbox_id, now)
+            reaped += len(stopped)
+            if stopped:
+                logger.info(f"Reaped {len(stopped)} sandboxes with expired leases")
+        self.metrics.reaped += reaped
+        return reaped
+
+    def _retry(self, sandbox_id: str, now: float):
+        """Naplánuje nové zastavení sandboxu, který se zastavit nepodařilo"""
+        if sandbox_id not in self.hypervisor._sandboxes:
+            self._failures.pop(sandbox_id, None)  # Mezitím zmizel
+            return
+        failures = self._failures.get(sandbox_id, 0) + 1
+        self._failures[sandbox_id] = failures
+        delay = min(LEASE_RETRY_BASE_S * 2 ** (failures - 1), LEASE_RETRY_MAX_S)
+        lease = self._leases[sandbox_id] = _Lease(now + delay, None, now)
+        self._reschedule(sandbox_id, lease)
+        self.metrics.retries += 1
+        logger.warning(f"Failed to stop expired sandbox {sandbox_id}, retrying in {delay:.0f}s")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reap_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.errors += 1
+                logger.error(f"Lease reaping failed: {e}")
+            await asyncio.sleep(self.tick_s)
+
+    def start(self):
+        """Spustí úklid leasů na pozadí v aktuální event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Zastaví úklid leasů"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Vrátí metriky leasů"""
+        return {**asdict(self.metrics), "active": len(self._leases), "timers": len(self._wheel)}
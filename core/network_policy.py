@@ -0,0 +1,135 @@
+"""
+Předkompilované síťové politiky.
+Blokované adresy a CIDR rozsahy (IPv4 i IPv6) se sloučí do seřazených
+intervalů s vyhledáváním přes bisect, povolené porty do bitové mapy.
+Výsledky pro jednotlivé cílové adresy se cachují.
+"""
+import ipaddress
+import socket
+import threading
+import weakref
+from bisect import bisect_right
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+MAX_PORT = 65535
+DEFAULT_CACHE_SIZE = 65536
+_V4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+class _IntervalIndex:
+    """Seřazené disjunktní intervaly [start, end] celých čísel"""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals: List[Tuple[int, int]]):
+        merged: List[List[int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def contains(self, value: int) -> bool:
+        i = bisect_right(self.starts, value) - 1
+        return i >= 0 and value <= self.ends[i]
+
+
+class CompiledNetworkPolicy:
+    """Neměnná síťová politika - blokované CIDR rozsahy a povolené porty"""
+
+    def __init__(self, blocked: Iterable[str], allowed_ports: Optional[Iterable[int]],
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        v4: List[Tuple[int, int]] = []
+        v6: List[Tuple[int, int]] = []
+        names = set()
+        for entry in blocked:
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                names.add(entry)  # Hostname apod. - porovnává se přesně
+                continue
+            interval = (int(network.network_address), int(network.broadcast_address))
+            (v4 if network.version == 4 else v6).append(interval)
+        self._v4 = _IntervalIndex(v4)
+        self._v6 = _IntervalIndex(v6)
+        self._names: FrozenSet[str] = frozenset(names)
+
+        self.any_port = allowed_ports is None
+        ports = bytearray((MAX_PORT + 1) // 8)
+        for port in allowed_ports or ():
+            if 0 <= port <= MAX_PORT:
+                ports[port >> 3] |= 1 << (port & 7)
+        self._ports = bytes(ports)
+
+        self._cache: Dict[str, bool] = {}
+        self._cache_size = cache_size
+
+    @property
+    def range_count(self) -> int:
+        """Počet sloučených intervalů"""
+        return len(self._v4) + len(self._v6)
+
+    def _lookup(self, ip: str) -> bool:
+        if ip in self._names:
+            return True
+        # inet_pton je výrazně rychlejší než ipaddress.ip_address
+        try:
+            return self._v4.contains(int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+        except OSError:
+            pass
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, ip)
+        except OSError:
+            return False
+        if packed[:12] == _V4_MAPPED_PREFIX:
+            return self._v4.contains(int.from_bytes(packed[12:], "big"))
+        return self._v6.contains(int.from_bytes(packed, "big"))
+
+    def is_ip_blocked(self, ip: str) -> bool:
+        """Je cílová adresa v některém blokovaném rozsahu"""
+        blocked = self._cache.get(ip)
+        if blocked is None:
+            blocked = self._lookup(ip)
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[ip] = blocked
+        return blocked
+
+    def is_port_allowed(self, port: int) -> bool:
+        if self.any_port:
+            return True
+        return 0 <= port <= MAX_PORT and bool(self._ports[port >> 3] >> (port & 7) & 1)
+
+    def check(self, ip: str, port: int) -> Optional[str]:
+        """Vrátí důvod zamítnutí ('blocked_ip', 'port_not_allowed') nebo None"""
+        if self.is_ip_blocked(ip):
+            return "blocked_ip"
+        if not self.is_port_allowed(port):
+            return "port_not_allowed"
+        return None
+
+
+# Slabé reference: zkompilovanou politiku drží jen politiky, které ji používají
+_cache: "weakref.WeakValueDictionary[tuple, CompiledNetworkPolicy]" = weakref.WeakValueDictionary()
+_cache_lock = threading.Lock()
+
+
+def compile_network_policy(blocked_ips: Optional[Iterable[str]],
+                           allowed_ports: Optional[Iterable[int]]) -> CompiledNetworkPolicy:
+    """Vrátí sdílenou zkompilovanou síťovou politiku"""
+    key = (
+        frozenset(blocked_ips or ()),
+        frozenset(allowed_ports) if allowed_ports is not None else None,
+    )
+    compiled = _cache.get(key)
+    if compiled is None:
+        with _cache_lock:
+            compiled = _cache.get(key)
+            if compiled is None:
+                compiled = _cache[key] = CompiledNetworkPolicy(key[0], key[1])
+    return compiled
@@ -0,0 +1,110 @@
+"""
+Předkompilované politiky přístupu k souborům.
+Pravidla (allow / deny / readonly pro celý podstrom) se uloží do trie nad
+komponentami normalizované cesty; rozhoduje nejdelší shodný prefix.
+Normalizace řeší `..` vůči kořeni sandboxu, takže `/a/../../host`
+je `/host`.
+"""
+import threading
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ALLOW = "allow"
+DENY = "deny"
+READONLY = "readonly"
+ACTIONS = (ALLOW, DENY, READONLY)
+
+WRITE_MODES = frozenset({"write", "append", "create", "delete", "rw"})
+
+
+def path_components(path: str) -> List[str]:
+    """
+    Komponenty normalizované absolutní cesty. Relativní cesty se berou
+    od kořene, `..` nad kořenem zůstává v kořeni.
+    """
+    components: List[str] = []
+    for part in path.split("/"):
+        if part == "" or part == ".":
+            continue
+        if part == "..":
+            if components:
+                components.pop()
+            continue
+        components.append(part)
+    return components
+
+
+def normalize_path(path: str) -> str:
+    """Normalizovaná absolutní cesta uvnitř sandboxu"""
+    return "/" + "/".join(path_components(path))
+
+
+class _Node:
+    __slots__ = ("children", "action")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.action: Optional[str] = None
+
+
+class PathPolicy:
+    """Trie pravidel přístupu k souborům, vyhledání v O(hloubka cesty)"""
+
+    def __init__(self, rules: Dict[str, str], default: str = ALLOW):
+        if default not in ACTIONS:
+            raise ValueError(f"Unknown path action: {default}")
+        self._root = _Node()
+        self._root.action = default
+        self.rules = dict(rules)
+        for path, action in rules.items():
+            if action not in ACTIONS:
+                raise ValueError(f"Unknown path action for {path}: {action}")
+            node = self._root
+            for part in path_components(path):
+                node = node.children.setdefault(part, _Node())
+            node.action = action
+
+    def decide(self, path: str) -> str:
+        """Akce nejbližšího pravidla nad cestou"""
+        if "\0" in path:
+            return DENY
+        node = self._root
+        action = node.action
+        for part in path_components(path):
+            node = node.children.get(part)
+            if node is None:
+                break
+            if node.action is not None:
+                action = node.action
+        return action
+
+    def check(self, path: str, mode: str = "read") -> Optional[str]:
+        """Vrátí důvod zamítnutí ('denied', 'read_only') nebo None"""
+        action = self.decide(path)
+        if action == DENY:
+            return "denied"
+        if action == READONLY and mode in WRITE_MODES:
+            return "read_only"
+        return None
+
+    def check_many(self, paths: Iterable[str], mode: str = "read") -> List[Optional[str]]:
+        """Dávková kontrola seznamu souborů"""
+        check = self.check
+        return [check(path, mode) for path in paths]
+
+
+# Slabé reference: zkompilovanou politiku drží jen politiky, které ji používají
+_cache: "weakref.WeakValueDictionary[Tuple, PathPolicy]" = weakref.WeakValueDictionary()
+_cache_lock = threading.Lock()
+
+
+def compile_path_policy(rules: Optional[Dict[str, str]], default: str = ALLOW) -> PathPolicy:
+    """Vrátí sdílenou zkompilovanou politiku pro daná pravidla"""
+    key = (tuple(sorted((rules or {}).items())), default)
+    compiled = _cache.get(key)
+    if compiled is None:
+        with _cache_lock:
+            compiled = _cache.get(key)
+            if compiled is None:
+                compiled = _cache[key] = PathPolicy(dict(key[0]), default)
+    return compiled
@@ -0,0 +1,206 @@
+"""
+Zahřívání page cache pro často používané šablony.
+Před očekávanou zátěží načte kernel a rootfs do page cache, volitelně
+uzamkne kernel v paměti a hlásí, jaká část šablony je v cache.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import math
+import mmap
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = mmap.PAGESIZE
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+
+
+_libc = _load_libc()
+
+
+def fadvise_willneed(path: str) -> bool:
+    """Požádá kernel o asynchronní načtení celého souboru do page cache"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            return True
+        # Fallback (macOS) - sekvenční čtení
+        while os.read(fd, 1024 * 1024):
+            pass
+        return True
+    finally:
+        os.close(fd)
+
+
+class _mapped:
+    """
+    Namapuje soubor a vrátí adresu mapování. ACCESS_COPY (MAP_PRIVATE) je
+    nutné kvůli ctypes.from_buffer; dokud se do mapování nezapisuje, stránky
+    jsou přímo stránky page cache.
+    """
+
+    def __init__(self, path: str, keep: bool = False):
+        self.path = path
+        self.keep = keep
+        self.mm: Optional[mmap.mmap] = None
+
+    def __enter__(self) -> int:
+        with open(self.path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        anchor = ctypes.c_char.from_buffer(self.mm)
+        addr = ctypes.addressof(anchor)
+        del anchor  # Jinak by mmap nešlo zavřít
+        return addr
+
+    def __exit__(self, *exc):
+        if not self.keep or exc[0] is not None:
+            self.mm.close()
+        return False
+
+
+def page_cache_residency(path: str) -> Dict[str, int]:
+    """Zjistí přes mincore(), kolik stránek souboru je v page cache"""
+    size = os.path.getsize(path)
+    total = math.ceil(size / PAGE_SIZE)
+    if size == 0 or _libc is None:
+        return {"resident_pages": 0, "total_pages": total}
+
+    vec = (ctypes.c_ubyte * total)()
+    with _mapped(path) as addr:
+        ret = _libc.mincore(ctypes.c_void_p(addr), ctypes.c_size_t(size), vec)
+    if ret != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), path)
+    resident = sum(1 for page in vec if page & 1)
+    return {"resident_pages": resident, "total_pages": total}
+
+
+class TemplatePrefetcher:
+    """
+    Zahřívá page cache podle poptávky po šablonách.
+
+    Poptávka se počítá jako exponenciálně tlumený počet vytvoření sandboxu;
+    při náhlém nárůstu (burst) se šablona zahřeje hned.
+    """
+
+    def __init__(self, template_manager, half_life_s: float = 300.0,
+                 burst_threshold: float = 5.0, lock_kernel: bool = False):
+        self.template_manager = template_manager
+        self.half_life_s = half_life_s
+        self.burst_threshold = burst_threshold
+        self.lock_kernel = lock_kernel
+        # template_id -> (skóre poptávky, čas posledního update)
+        self._demand: Dict[str, List[float]] = {}
+        self._last_warm: Dict[str, float] = {}
+        # Namapované a uzamčené kernely (musí žít, jinak se mlock uvolní)
+        self._locked: Dict[str, mmap.mmap] = {}
+
+    def _decayed(self, template_id: str, now: float) -> float:
+        entry = self._demand.get(template_id)
+        if entry is None:
+            return 0.0
+        score, updated = entry
+        return score * 0.5 ** ((now - updated) / self.half_life_s)
+
+    def record_use(self, template_id: str) -> bool:
+        """
+        Zaznamená vytvoření sandboxu ze šablony.
+        Vrátí True, pokud poptávka předpovídá burst a šablonu je vhodné zahřát.
+        """
+        now = time.monotonic()
+        score = self._decayed(template_id, now) + 1.0
+        self._demand[template_id] = [score, now]
+        # Zahříváme maximálně jednou za čtvrtinu poločasu
+        recently_warmed = now - self._last_warm.get(template_id, -math.inf) < self.half_life_s / 4
+        return score >= self.burst_threshold and not recently_warmed
+
+    def ranked_templates(self) -> List[str]:
+        """Šablony seřazené podle aktuální poptávky"""
+        now = time.monotonic()
+        return sorted(self._demand, key=lambda tid: self._decayed(tid, now), reverse=True)
+
+    def warm(self, template_id: str) -> int:
+        """Zahřeje soubory šablony, vrací počet zahřátých souborů"""
+        template = self.template_manager.get_template(template_id)
+        if template is None:
+            return 0
+        warmed = 0
+        for fname, path in template.file_paths.items():
+            try:
+                fadvise_willneed(path)
+                warmed += 1
+                if self.lock_kernel and fname == "vmlinux":
+                    self._mlock(template_id, path)
+            except OSError as e:
+                logger.warning(f"Cannot prefetch {path}: {e}")
+        self._last_warm[template_id] = time.monotonic()
+        return warmed
+
+    def warm_top(self, count: int = 5) -> List[str]:
+        """Zahřeje nejžádanější šablony; bez historie všechny z indexu"""
+        ranked = self.ranked_templates() or self.template_manager.list_templates()
+        selected = ranked[:count]
+        for template_id in selected:
+            self.warm(template_id)
+        return selected
+
+    async def warm_async(self, template_id: str) -> int:
+        """Zahřeje šablonu mimo event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.warm, template_id)
+
+    def _mlock(self, template_id: str, path: str):
+        """Uzamkne kernel image v paměti (vyžaduje RLIMIT_MEMLOCK)"""
+        if _libc is None or template_id in self._locked:
+            return
+        size = os.path.getsize(path)
+        if size == 0:
+            return
+        mapping = _mapped(path, keep=True)
+        with mapping as addr:
+            ret = _libc.mlock(ctypes.c_void_p(addr), ctypes.c_size_t(size))
+        if ret != 0:
+            errno = ctypes.get_errno()
+            mapping.mm.close()
+            logger.warning(f"mlock of {path} failed: {os.strerror(errno)}")
+            return
+        self._locked[template_id] = mapping.mm
+
+    def unlock_all(self):
+        """Uvolní všechny uzamčené kernely"""
+        for mm in self._locked.values():
+            mm.close()
+        self._locked.clear()
+
+    def residency(self, template_id: str) -> Dict[str, Dict[str, float]]:
+        """Podíl stránek souborů šablony v page cache (mincore)"""
+        template = self.template_manager.get_template(template_id)
+        if template is None:
+            return {}
+        report = {}
+        for fname, path in template.file_paths.items():
+            try:
+                pages = page_cache_residency(path)
+            except OSError as e:
+                logger.warning(f"Cannot read residency of {path}: {e}")
+                continue
+            total = pages["total_pages"]
+            report[fname] = {
+                **pages,
+                "ratio": pages["resident_pages"] / total if total else 1.0,
+            }
+        return report
@@ -0,0 +1,288 @@
+"""
+Reconciler osiřelých prostředků hostitele.
+Porovnává realitu hostitele (tempdir, TAP, VMM procesy) se stavem hypervisoru
+a uvolňuje prostředky, které žádnému sandboxu nepatří.
+"""
+import asyncio
+import os
+import shutil
+import signal
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Alias TAP rozhraní (/sys/class/net/<tap>/ifalias) označuje vlastníka
+TAP_ALIAS_PREFIX = "novasandbox:"
+
+
+def tap_alias(instance_id: str) -> str:
+    """Alias, kterým instance hypervisoru označuje svá TAP rozhraní"""
+    return f"{TAP_ALIAS_PREFIX}{instance_id}"
+
+
+@dataclass
+class ReconcilerMetrics:
+    """Metriky reconcileru"""
+    runs: int = 0
+    orphan_dirs_reclaimed: int = 0
+    orphan_taps_reclaimed: int = 0
+    orphan_processes_reclaimed: int = 0
+    errors: int = 0
+    last_run_ms: float = 0.0
+    last_orphans_found: int = 0
+
+
+class OrphanReconciler:
+    """
+    Periodicky hledá osiřelé prostředky a uvolňuje je v dávkách.
+
+    Prostředek se uvolní až tehdy, když je osiřelý ve dvou po sobě jdoucích
+    průchodech - tím se vyhneme souběhu s právě vytvářeným sandboxem.
+    TAP rozhraní se uvolňují jen s aliasem této instance (`tap_alias`,
+    výchozí `hypervisor.tap_alias`); bez aliasu se TAP neuklízí vůbec.
+    """
+
+    def __init__(self, hypervisor, interval_s: float = 60.0, batch_size: int = 256,
+                 tmp_dir: Optional[str] = None,
+                 sys_net_dir: str = "/sys/class/net",
+                 proc_dir: str = "/proc",
+                 dir_prefix: str = "fc_",
+                 tap_prefix: str = "tap_",
+                 vmm_binary: str = "firecracker",
+                 min_age_s: float = 30.0,
+                 tap_alias: Optional[str] = None):
+        self.hypervisor = hypervisor
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self.tmp_dir = Path(tmp_dir or tempfile.gettempdir())
+        self.sys_net_dir = Path(sys_net_dir)
+        self.proc_dir = Path(proc_dir)
+        self.dir_prefix = dir_prefix
+        self.tap_prefix = tap_prefix
+        self.vmm_binary = vmm_binary
+        self.min_age_s = min_age_s
+        if tap_alias is None:
+            tap_alias = getattr(hypervisor, "tap_alias", None)
+        self.tap_alias = tap_alias if isinstance(tap_alias, str) else None
+        self.metrics = ReconcilerMetrics()
+        self._candidates: Dict[str, Set] = {"dirs": set(), "taps": set(), "pids": set()}
+        self._task: Optional[asyncio.Task] = None
+
+    # ----- Sken hostitele -----
+
+    def _scan_dirs(self) -> Set[str]:
+        """Najde dočasné adresáře sandboxů starší než min_age_s"""
+        found = set()
+        now = time.time()
+        try:
+            entries = os.scandir(self.tmp_dir)
+        except OSError:
+            return found
+        with entries:
+            for entry in entries:
+                if not entry.name.startswith(self.dir_prefix):
+                    continue
+                try:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    if now - entry.stat(follow_symlinks=False).st_mtime < self.min_age_s:
+                        continue
+                except OSError:
+                    continue
+                found.add(entry.path)
+        return found
+
+    def _scan_taps(self) -> Set[str]:
+        """Najde TAP rozhraní označená aliasem této instance"""
+        found = set()
+        if not self.tap_alias:
+            return found
+        try:
+            names = os.listdir(self.sys_net_dir)
+        except OSError:
+            return found
+        for name in names:
+            if not name.startswith(self.tap_prefix):
+                continue
+            try:
+                alias = (self.sys_net_dir / name / "ifalias").read_text().strip()
+            except OSError:
+                continue
+            if alias == self.tap_alias:
+                found.add(name)
+        return found
+
+    def _scan_processes(self) -> Dict[int, str]:
+        """Najde VMM procesy a jejich API sockety (pid -> socket)"""
+        found = {}
+        try:
+            entries = os.listdir(self.proc_dir)
+        except OSError:
+            return found
+        for name in entries:
+            if not name.isdigit():
+                continue
+            try:
+                with open(self.proc_dir / name / "cmdline", "rb") as f:
+                    argv = f.read().split(b"\0")
+            except OSError:
+                continue
+            if not argv or os.path.basename(argv[0].decode(errors="replace")) != self.vmm_binary:
+                continue
+            args = [arg.decode(errors="replace") for arg in argv]
+            if "--api-sock" not in args:
+                continue
+            idx = args.index("--api-sock")
+            if idx + 1 >= len(args):
+                continue
+            sock_dir = os.path.dirname(args[idx + 1])
+            # Jen procesy, jejichž socket leží v našem tempdir
+            if (os.path.dirname(sock_dir) == str(self.tmp_dir)
+                    and os.path.basename(sock_dir).startswith(self.dir_prefix)):
+                found[int(name)] = args[idx + 1]
+        return found
+
+    def find_orphans(self, owned: Optional[Dict[str, Set]] = None) -> Dict[str, Set]:
+        """
+        Porovná realitu hostitele se stavem hypervisoru. Blokující sken
+        /proc a /sys; `reconcile_once` ho volá v executoru s `owned`
+        získaným v event loop.
+        """
+        if owned is None:
+            owned = self.hypervisor.get_owned_resources()
+        processes = self._scan_processes()
+
+        orphan_pids = {pid for pid in processes if pid not in owned["pids"]}
+        # Adresář osiřelého procesu uvolníme až po jeho ukončení
+        busy_dirs = {os.path.dirname(sock) for pid, sock in processes.items()
+                     if pid not in orphan_pids}
+
+        return {
+            "dirs": self._scan_dirs() - owned["dirs"] - busy_dirs,
+            "taps": self._scan_taps() - owned["taps"],
+            "pids": orphan_pids,
+        }
+
+    # ----- Uvolnění -----
+
+    @staticmethod
+    def _batches(items: List, size: int):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def _reclaim_processes(self, pids: List[int]) -> int:
+        reclaimed = 0
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                reclaimed += 1
+            except ProcessLookupError:
+                pass
+            except PermissionError as e:
+                self.metrics.errors += 1
+                logger.error(f"Cannot kill orphaned VMM {pid}: {e}")
+        return reclaimed
+
+    def _reclaim_dirs(self, dirs: List[str]) -> int:
+        reclaimed = 0
+        for path in dirs:
+            try:
+                shutil.rmtree(path)
+                reclaimed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.metrics.errors += 1
+                logger.error(f"Cannot remove orphaned dir {path}: {e}")
+        return reclaimed
+
+    async def _reclaim_taps(self, taps: List[str]) -> int:
+        """Smaže TAP rozhraní jedním `ip -batch` procesem na dávku"""
+        script = "".join(f"tuntap del {tap} mode tap\n" for tap in taps).encode()
+        process = await asyncio.create_subprocess_exec(
+            "sudo", "ip", "-force", "-batch", "-",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate(script)
+        if process.returncode != 0:
+            self.metrics.errors += 1
+            logger.error(f"Failed to delete orphaned TAPs: {stderr.decode()}")
+        remaining = await asyncio.get_running_loop().run_in_executor(None, self._scan_taps)
+        return len(set(taps) - remaining)
+
+    async def reconcile_once(self) -> Dict[str, int]:
+        """Jeden průchod reconcileru, vrací počty uvolněných prostředků"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # Stav hypervisoru čteme v event loop, sken hostitele mimo ni
+        owned = self.hypervisor.get_owned_resources()
+        orphans = await loop.run_in_executor(None, self.find_orphans, owned)
+
+        # Uvolňujeme jen to, co bylo osiřelé už v minulém průchodu
+        confirmed = {kind: sorted(orphans[kind] & self._candidates[kind])
+                     for kind in orphans}
+        self._candidates = {kind: orphans[kind] - set(confirmed[kind])
+                            for kind in orphans}
+
+        result = {"processes": 0, "dirs": 0, "taps": 0}
+
+        # Nejdřív procesy, aby uvolnily sockety a TAP rozhraní
+        for batch in self._batches(confirmed["pids"], self.batch_size):
+            result["processes"] += self._reclaim_processes(batch)
+        for batch in self._batches(confirmed["dirs"], self.batch_size):
+            result["dirs"] += await loop.run_in_executor(None, self._reclaim_dirs, batch)
+        for batch in self._batches(confirmed["taps"], self.batch_size):
+            result["taps"] += await self._reclaim_taps(batch)
+
+        self.metrics.runs += 1
+        self.metrics.orphan_processes_reclaimed += result["processes"]
+        self.metrics.orphan_dirs_reclaimed += result["dirs"]
+        self.metrics.orphan_taps_reclaimed += result["taps"]
+        self.metrics.last_orphans_found = sum(len(v) for v in orphans.values())
+        self.metrics.last_run_ms = (time.perf_counter() - start) * 1000
+
+        if any(result.values()):
+            logger.info(
+                f"Reclaimed orphans: {result['processes']} processes, "
+                f"{result['dirs']} dirs, {result['taps']} taps"
+            )
+        return result
+
+    # ----- Běh na pozadí -----
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.errors += 1
+                logger.error(f"Reconciler run failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        """Spustí reconciler na pozadí v aktuální event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Zastaví reconciler"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_metrics(self) -> Dict[str, float]:
+        """Vrátí metriky reconcileru"""
+        return asdict(self.metrics)
@@ -0,0 +1,271 @@
+"""
+Registr sandboxů se sekundárními indexy.
+Indexuje stav, template_id a každou dvojici label klíč/hodnota, takže
+výběr podle selektoru (ve stylu Kubernetes: `team=ml,env in (dev,test),!gpu`)
+stojí úměrně velikosti nejmenší kandidátní množiny, ne počtu sandboxů.
+Index stavu se udržuje automaticky při přiřazení `sandbox.state`.
+"""
+import re
+from collections.abc import MutableMapping
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING, Dict, FrozenSet, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
+)
+
+if TYPE_CHECKING:
+    from .hypervisor import SandboxState
+    from .sandbox import Sandbox
+
+_NAME = r"[A-Za-z0-9][-A-Za-z0-9_./]*"
+_VALUE = r"[-A-Za-z0-9_./]*"
+_SET_RE = re.compile(rf"^({_NAME})\s+(in|notin)\s+\(([^)]*)\)$")
+_EQUALITY_RE = re.compile(rf"^({_NAME})\s*(==|=|!=)\s*({_VALUE})$")
+_EXISTS_RE = re.compile(rf"^(!?)\s*({_NAME})$")
+_VALUE_RE = re.compile(rf"^{_VALUE}$")
+
+_NO_LABELS: Dict[str, str] = {}
+
+# Operátory požadavků
+IN = "in"
+NOT_IN = "notin"
+EXISTS = "exists"
+NOT_EXISTS = "!exists"
+
+
+class Requirement(NamedTuple):
+    """Jeden požadavek selektoru; `=` je IN s jednou hodnotou, `!=` NOT_IN"""
+    key: str
+    operator: str
+    values: FrozenSet[str] = frozenset()
+
+    def matches(self, labels: Mapping[str, str]) -> bool:
+        if self.operator == IN:
+            return labels.get(self.key) in self.values
+        if self.operator == NOT_IN:
+            return labels.get(self.key) not in self.values
+        if self.operator == EXISTS:
+            return self.key in labels
+        return self.key not in labels
+
+
+def _split_terms(selector: str) -> List[str]:
+    """Rozdělí selektor podle čárek mimo závorky"""
+    terms, depth, start = [], 0, 0
+    for i, char in enumerate(selector):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            terms.append(selector[start:i])
+            start = i + 1
+    terms.append(selector[start:])
+    return [term.strip() for term in terms if term.strip()]
+
+
+@lru_cache(maxsize=1024)
+def _parse_selector_string(selector: str) -> Tuple[Requirement, ...]:
+    requirements = []
+    for term in _split_terms(selector):
+        match = _SET_RE.match(term)
+        if match:
+            values = [value.strip() for value in match.group(3).split(",")]
+            if not all(_VALUE_RE.match(value) for value in values):
+                raise ValueError(f"Invalid label selector: {term}")
+            operator = IN if match.group(2) == "in" else NOT_IN
+            requirements.append(Requirement(match.group(1), operator, frozenset(values)))
+            continue
+        match = _EQUALITY_RE.match(term)
+        if match:
+            operator = NOT_IN if match.group(2) == "!=" else IN
+            requirements.append(Requirement(match.group(1), operator, frozenset([match.group(3)])))
+            continue
+        match = _EXISTS_RE.match(term)
+        if match:
+            requirements.append(Requirement(match.group(2), NOT_EXISTS if match.group(1) else EXISTS))
+            continue
+        raise ValueError(f"Invalid label selector: {term}")
+    return tuple(requirements)
+
+
+def parse_selector(selector: Union[None, str, Mapping[str, str]]) -> Tuple[Requirement, ...]:
+    """
+    Převede selektor na požadavky. Řetězec podporuje `k=v`, `k==v`, `k!=v`,
+    `k in (a,b)`, `k notin (a,b)`, `k` a `!k`; mapping znamená rovnost
+    všech dvojic (matchLabels).
+    """
+    if not selector:
+        return ()
+    if isinstance(selector, str):
+        return _parse_selector_string(selector)
+    return tuple(Requirement(key, IN, frozenset([value])) for key, value in selector.items())
+
+
+def _add(index: Dict, key, sandbox_id: str):
+    index.setdefault(key, {})[sandbox_id] = None
+
+
+def _discard(index: Dict, key, sandbox_id: str):
+    ids = index.get(key)
+    if ids is not None:
+        ids.pop(sandbox_id, None)
+        if not ids:
+            del index[key]
+
+
+class SandboxRegistry(MutableMapping):
+    """
+    Mapping sandbox_id -> Sandbox s indexy podle stavu, šablony a labelů.
+    Labely se indexují při vložení; po jejich změně je potřeba `reindex()`.
+    Iterace prochází neměnný snapshot, takže registr lze během ní měnit.
+    """
+
+    def __init__(self):
+        self._sandboxes: Dict[str, "Sandbox"] = {}
+        self._by_state: Dict["SandboxState", Dict[str, None]] = {}
+        self._by_template: Dict[str, Dict[str, None]] = {}
+        self._by_label: Dict[str, Dict[str, Dict[str, None]]] = {}
+        # Indexované hodnoty sandboxu: (stav, šablona, labely)
+        self._indexed: Dict[str, Tuple["SandboxState", str, Dict[str, str]]] = {}
+        self._snapshot: Optional[Tuple["Sandbox", ...]] = None
+
+    def __getitem__(self, sandbox_id: str) -> "Sandbox":
+        return self._sandboxes[sandbox_id]
+
+    def __setitem__(self, sandbox_id: str, sandbox: "Sandbox"):
+        if sandbox_id in self._sandboxes:
+            self._unindex(sandbox_id)
+        self._sandboxes[sandbox_id] = sandbox
+        self._index(sandbox_id, sandbox)
+        self._snapshot = None
+
+    def __delitem__(self, sandbox_id: str):
+        del self._sandboxes[sandbox_id]
+        self._unindex(sandbox_id)
+        self._snapshot = None
+
+    def __contains__(self, sandbox_id) -> bool:
+        return sandbox_id in self._sandboxes
+
+    def __len__(self) -> int:
+        return len(self._sandboxes)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([sandbox.sandbox_id for sandbox in self.snapshot()])
+
+    def get(self, sandbox_id: str, default=None):
+        return self._sandboxes.get(sandbox_id, default)
+
+    def snapshot(self) -> Tuple["Sandbox", ...]:
+        """Neměnný snapshot sandboxů; mezi změnami se sdílí"""
+        if self._snapshot is None:
+            self._snapshot = tuple(self._sandboxes.values())
+        return self._snapshot
+
+    def _index(self, sandbox_id: str, sandbox: "Sandbox"):
+        # Kopie chrání index před změnou labelů na místě; prázdné se sdílí
+        labels = dict(sandbox.config.labels) if sandbox.config.labels else _NO_LABELS
+        template_id = sandbox.config.template_id
+        _add(self._by_state, sandbox.state, sandbox_id)
+        _add(self._by_template, template_id, sandbox_id)
+        for key, value in labels.items():
+            _add(self._by_label.setdefault(key, {}), value, sandbox_id)
+        self._indexed[sandbox_id] = (sandbox.state, template_id, labels)
+
+    def _unindex(self, sandbox_id: str):
+        state, template_id, labels = self._indexed.pop(sandbox_id)
+        _discard(self._by_state, state, sandbox_id)
+        _discard(self._by_template, template_id, sandbox_id)
+        for key, value in labels.items():
+            values = self._by_label[key]
+            _discard(values, value, sandbox_id)
+            if not values:
+                del self._by_label[key]
+
+    def state_changed(self, sandbox: "Sandbox"):
+        """Přesune sandbox v indexu stavu (volá Sandbox při přiřazení stavu)"""
+        sandbox_id = sandbox.sandbox_id
+        indexed = self._indexed.get(sandbox_id)
+        if indexed is None or self._sandboxes.get(sandbox_id) is not sandbox:
+            return
+        previous, template_id, labels = indexed
+        if previous is sandbox.state:
+            return
+        _discard(self._by_state, previous, sandbox_id)
+        _add(self._by_state, sandbox.state, sandbox_id)
+        self._indexed[sandbox_id] = (sandbox.state, template_id, labels)
+
+    def reindex(self, sandbox_id: str):
+        """Přeindexuje sandbox po změně labelů nebo konfigurace"""
+        sandbox = self._sandboxes[sandbox_id]
+        self._unindex(sandbox_id)
+        self._index(sandbox_id, sandbox)
+
+    def _label_ids(self, requirement: Requirement) -> Optional[List[Dict[str, None]]]:
+        """Množiny id splňující pozitivní požadavek (None pro negace)"""
+        values = self._by_label.get(requirement.key, {})
+        if requirement.operator == IN:
+            return [values[value] for value in requirement.values if value in values]
+        if requirement.operator == EXISTS:
+            return list(values.values())
+        return None
+
+    def select(self, selector: Union[None, str, Mapping[str, str]] = None,
+               state: Optional["SandboxState"] = None,
+               template_id: Optional[str] = None) -> List["Sandbox"]:
+        """
+        Sandboxy odpovídající selektoru labelů, stavu a šabloně.
+        Kandidáti se berou z nejmenšího indexu, zbylé podmínky se ověří
+        na nich; bez pozitivní podmínky se prochází celý registr.
+        """
+        requirements = parse_selector(selector)
+        candidates: Optional[List[Dict[str, None]]] = None
+        driver = None
+        if state is not None:
+            candidates = [self._by_state.get(state, {})]
+        if template_id is not None:
+            ids = [self._by_template.get(template_id, {})]
+            if candidates is None or len(ids[0]) < len(candidates[0]):
+                candidates, driver = ids, None
+        for requirement in requirements:
+            ids = self._label_ids(requirement)
+            if ids is None:
+                continue
+            if candidates is None or sum(map(len, ids)) < sum(map(len, candidates)):
+                candidates, driver = ids, requirement
+
+        if candidates is None:
+            candidates = [self._sandboxes]
+        checks = [r for r in requirements if r is not driver]
+
+        result = []
+        indexed = self._indexed
+        for ids in candidates:
+            for sandbox_id in ids:
+                sandbox_state, sandbox_template, labels = indexed[sandbox_id]
+                if state is not None and sandbox_state is not state:
+                    continue
+                if template_id is not None and sandbox_template != template_id:
+                    continue
+                if all(r.matches(labels) for r in checks):
+                    result.append(self._sandboxes[sandbox_id])
+        return result
+
+    def count(self, selector: Union[None, str, Mapping[str, str]] = None,
+              state: Optional["SandboxState"] = None,
+              template_id: Optional[str] = None) -> int:
+        """Počet odpovídajících sandboxů (bez selektoru přímo z indexu)"""
+        if not selector:
+            if state is not None and template_id is None:
+                return len(self._by_state.get(state, ()))
+            if template_id is not None and state is None:
+                return len(self._by_template.get(template_id, ()))
+            if state is None and template_id is None:
+                return len(self._sandboxes)
+        return len(self.select(selector, state, template_id))
+
+    def get_metrics(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "by_state": {state.value: len(ids) for state, ids in self._by_state.items()},
+            "by_template": {template: len(ids) for template, ids in self._by_template.items()},
+        }
@@ -1,25 +1,125 @@
 """
 Hlavní třída Sandbox reprezentující microVM instanci.
 """
-from dataclasses import dataclass, field
-from typing import Optional, Dict, Any
+from collections.abc import MutableMapping
+from dataclasses import field
+from typing import Optional, Dict, Any, Iterator, Mapping
 import asyncio
-from .hypervisor import SandboxState, SandboxConfig, BaseHypervisor
+from .hypervisor import SandboxState, SandboxConfig, BaseHypervisor, slotted_dataclass
+from .registry import SandboxRegistry
 import logging
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+_METADATA_FIELDS = (
+    "boot_time_ms", "api_socket", "config_file", "snapshot_key", "pid", "reattached", "vm"
+)
+_METADATA_FIELD_SET = frozenset(_METADATA_FIELDS)
+
+
+class SandboxMetadata(MutableMapping):
+    """
+    Metadata sandboxu s typovanými sloty pro známé klíče a slovníkem
+    jen pro ostatní (alokuje se až při prvním použití). Chová se jako
+    dict; slot s hodnotou None se bere jako chybějící klíč.
+    """
+    
+    __slots__ = _METADATA_FIELDS + ("_extra",)
+    
+    boot_time_ms: Optional[float]
+    api_socket: Optional[str]
+    config_file: Optional[str]
+    snapshot_key: Optional[str]
+    pid: Optional[int]
+    reattached: Optional[bool]
+    vm: Any  # Apple VZ objekt VM
+    
+    def __init__(self, data: Optional[Mapping[str, Any]] = None, **kwargs):
+        for name in _METADATA_FIELDS:
+            setattr(self, name, None)
+        self._extra: Optional[Dict[str, Any]] = None
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+    
+    def __getitem__(self, key: str) -> Any:
+        if key in _METADATA_FIELD_SET:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+    
+    def __setitem__(self, key: str, value: Any):
+        if key in _METADATA_FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+    
+    def __delitem__(self, key: str):
+        if key in _METADATA_FIELD_SET:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        else:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+    
+    def __iter__(self) -> Iterator[str]:
+        for name in _METADATA_FIELDS:
+            if getattr(self, name) is not None:
+                yield name
+        if self._extra:
+            yield from self._extra
+    
+    def __len__(self) -> int:
+        count = sum(1 for name in _METADATA_FIELDS if getattr(self, name) is not None)
+        return count + (len(self._extra) if self._extra else 0)
+    
+    def __repr__(self) -> str:
+        return f"SandboxMetadata({dict(self)!r})"
+
+
+@slotted_dataclass
 class Sandbox:
-    """Reprezentace běžící microVM instance"""
+    """Reprezentace běžící microVM instance (bez __dict__ na instanci)"""
     sandbox_id: str
     config: SandboxConfig
     hypervisor: BaseHypervisor
     state: SandboxState = SandboxState.CREATED
     process: Optional[asyncio.subprocess.Process] = None
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: SandboxMetadata = field(default_factory=SandboxMetadata)
     created_at: float = field(default_factory=__import__('time').time)
     
+    def __post_init__(self):
+        if not isinstance(self.metadata, SandboxMetadata):
+            self.metadata = SandboxMetadata(self.metadata)
+    
+    def __setattr__(self, name: str, value: Any):
+        if name != "state":
+            object.__setattr__(self, name, value)
+            return
+        previous = getattr(self, "state", None)
+        object.__setattr__(self, name, value)
+        if value is previous:
+            return
+        registry = getattr(self.hypervisor, "_sandboxes", None)
+        if isinstance(registry, SandboxRegistry):
+            registry.state_changed(self)
+        # Změna stavu se publikuje odběratelům sběrnice hypervisoru
+        event_bus = getattr(self.hypervisor, "event_bus", None)
+        if event_bus is not None:
+            event_bus.publish("state", self.sandbox_id, {
+                "state": value.value,
+                "previous": previous.value if previous is not None else None
+            }, self.config.labels)
+    
     async def execute_command(self, command: str, timeout: float = 30.0) -> str:
         """Vykoná příkaz v sandboxu a vrátí výstup"""
         # Implementace bude záviset na komunikačním kanálu
@@ -57,6 +157,28 @@ class Sandbox:
             self.state = SandboxState.RUNNING
         return success
     
+    async def reset(self) -> bool:
+        """
+        Vrátí sandbox do čistého stavu šablony (paměť ze snapshotu, prázdný
+        zapisovatelný overlay) se zachováním sítě, cgroup a socketu - pro
+        opakované použití mezi úlohami levnější než nové vytvoření.
+        """
+        success = await self.hypervisor.reset_sandbox(self.sandbox_id)
+        if success:
+            self.state = SandboxState.RUNNING
+        return success
+    
+    def renew(self, ttl_s: Optional[float] = None) -> Optional[float]:
+        """
+        Prodlouží lease sandboxu o `ttl_s` (výchozí `config.ttl_s`) od teď
+        a odsune idle timeout. Vrací zbývající dobu leasu v sekundách.
+        """
+        return self.hypervisor.leases.renew(self.sandbox_id, ttl_s)
+    
+    def lease_remaining_s(self) -> Optional[float]:
+        """Zbývající doba leasu v sekundách (None = bez omezení)"""
+        return self.hypervisor.leases.remaining(self.sandbox_id)
+    
     def is_running(self) -> bool:
         """Zkontroluje, zda je sandbox spuštěn"""
         return self.state == SandboxState.RUNNING
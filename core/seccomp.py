@@ -0,0 +1,191 @@
+"""
+Kompilace vlastních seccomp filtrů pro Firecracker.
+Ze specifikace ve formátu seccompileru Firecrackeru (JSON) vytváří přímo
+BPF program (ve formátu bincode, který přijímá `--seccomp-filter`). Syscally
+se vyhodnocují vyváženým binárním stromem nad čísly syscallů, takže filtr
+stojí O(log n) instrukcí na syscall. Zkompilované filtry se cachují
+na disku podle hashe specifikace.
+
+Filtry argumentů kompilátor nepodporuje. Vestavěný filtr Firecrackeru je
+používá (ioctl, mmap, socket, ...) a vlastní filtr ho celý nahrazuje, takže
+VMM standardně běží s vestavěným filtrem a vlastní se použije jen na výslovné
+přání provozovatele.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .syscalls import SYSCALL_NUMBERS, syscall_number
+
+# Verze kompilátoru je součástí klíče cache
+COMPILER_VERSION = 1
+
+AUDIT_ARCH_X86_64 = 0xC000003E
+
+# BPF instrukce (linux/filter.h)
+BPF_LD_W_ABS = 0x20
+BPF_JMP_JA = 0x05
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JGE_K = 0x35
+BPF_RET_K = 0x06
+
+SECCOMP_DATA_NR = 0
+SECCOMP_DATA_ARCH = 4
+
+SECCOMP_ACTIONS = {
+    "kill_process": 0x80000000,
+    "kill_thread": 0x00000000,
+    "trap": 0x00030000,
+    "log": 0x7FFC0000,
+    "allow": 0x7FFF0000,
+}
+SECCOMP_RET_ERRNO = 0x00050000
+
+# Maximální skok v podmíněné instrukci (jt/jf jsou u8)
+MAX_COND_JUMP = 255
+# Od kolika syscallů se list stromu porovnává lineárně
+LEAF_SIZE = 4
+
+
+def _action_value(action) -> int:
+    if isinstance(action, dict) and "errno" in action:
+        return SECCOMP_RET_ERRNO | (int(action["errno"]) & 0xFFFF)
+    if action not in SECCOMP_ACTIONS:
+        raise ValueError(f"Unsupported seccomp action: {action}")
+    return SECCOMP_ACTIONS[action]
+
+
+Instruction = Tuple[int, int, int, int]  # code, jt, jf, k
+
+
+def _leaf(numbers: List[int], allow: int, default: int) -> List[Instruction]:
+    """Lineární porovnání několika čísel, zakončené RET default a RET allow"""
+    code: List[Instruction] = []
+    count = len(numbers)
+    for i, nr in enumerate(numbers):
+        # Skok na RET allow za zbývajícími porovnáními a RET default
+        code.append((BPF_JMP_JEQ_K, count - i, 0, nr))
+    code.append((BPF_RET_K, 0, 0, default))
+    code.append((BPF_RET_K, 0, 0, allow))
+    return code
+
+
+def _tree(numbers: List[int], allow: int, default: int) -> List[Instruction]:
+    """Vyvážený rozhodovací strom nad seřazenými čísly syscallů"""
+    if len(numbers) <= LEAF_SIZE:
+        return _leaf(numbers, allow, default)
+    mid = len(numbers) // 2
+    left = _tree(numbers[:mid], allow, default)
+    right = _tree(numbers[mid:], allow, default)
+    if len(left) <= MAX_COND_JUMP:
+        # nr >= pivot -> přeskočit levý podstrom
+        return [(BPF_JMP_JGE_K, len(left), 0, numbers[mid])] + left + right
+    # Levý podstrom je delší než dosah podmíněného skoku - trampolína přes JA
+    return ([(BPF_JMP_JGE_K, 0, 1, numbers[mid]), (BPF_JMP_JA, 0, 0, len(left))]
+            + left + right)
+
+
+def compile_bpf(thread_filter: Dict) -> List[Instruction]:
+    """Zkompiluje filtr jednoho vlákna (bez podmínek na argumenty) do BPF"""
+    default = _action_value(thread_filter["default_action"])
+    allow = _action_value(thread_filter.get("filter_action", "allow"))
+    numbers = sorted({syscall_number(rule["syscall"]) for rule in thread_filter["filter"]
+                      if rule["syscall"] in SYSCALL_NUMBERS})
+    for rule in thread_filter["filter"]:
+        if rule.get("args"):
+            raise ValueError(f"Argument filters are not supported ({rule['syscall']})")
+
+    program: List[Instruction] = [
+        # Jiná architektura (x32, i386) se nevyhodnocuje podle x86_64 čísel
+        (BPF_LD_W_ABS, 0, 0, SECCOMP_DATA_ARCH),
+        (BPF_JMP_JEQ_K, 1, 0, AUDIT_ARCH_X86_64),
+        (BPF_RET_K, 0, 0, SECCOMP_ACTIONS["kill_process"]),
+        (BPF_LD_W_ABS, 0, 0, SECCOMP_DATA_NR),
+    ]
+    if numbers:
+        program += _tree(numbers, allow, default)
+    else:
+        program.append((BPF_RET_K, 0, 0, default))
+    return program
+
+
+def run_bpf(program: List[Instruction], nr: int, arch: int = AUDIT_ARCH_X86_64) -> int:
+    """Interpret podmnožiny BPF používané kompilátorem (pro testy a ladění)"""
+    data = {SECCOMP_DATA_NR: nr, SECCOMP_DATA_ARCH: arch}
+    accumulator = 0
+    pc = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        if code == BPF_LD_W_ABS:
+            accumulator = data[k]
+            pc += 1
+        elif code == BPF_JMP_JA:
+            pc += 1 + k
+        elif code == BPF_JMP_JEQ_K:
+            pc += 1 + (jt if accumulator == k else jf)
+        elif code == BPF_JMP_JGE_K:
+            pc += 1 + (jt if accumulator >= k else jf)
+        elif code == BPF_RET_K:
+            return k
+        else:
+            raise ValueError(f"Unsupported BPF opcode {code:#x}")
+
+
+def serialize_bincode(programs: Dict[str, List[Instruction]]) -> bytes:
+    """
+    Serializuje BPF programy vláken jako bincode HashMap<String, Vec<sock_filter>>
+    (formát výstupu seccompiler-bin, který čte `firecracker --seccomp-filter`).
+    """
+    out = [struct.pack("<Q", len(programs))]
+    for thread in sorted(programs):
+        name = thread.encode()
+        out.append(struct.pack("<Q", len(name)) + name)
+        program = programs[thread]
+        out.append(struct.pack("<Q", len(program)))
+        out.extend(struct.pack("<HBBI", code, jt, jf, k) for code, jt, jf, k in program)
+    return b"".join(out)
+
+
+class SeccompCompiler:
+    """Kompiluje a cachuje seccomp filtry Firecrackeru na disku"""
+
+    def __init__(self, cache_dir: str = ".novasandbox/seccomp"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._paths: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def filter_key(seccomp_filter: Dict) -> str:
+        """Hash specifikace filtru a verze kompilátoru"""
+        canonical = json.dumps(seccomp_filter, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{COMPILER_VERSION}:{canonical}".encode()).hexdigest()
+
+    def compile(self, seccomp_filter: Dict) -> str:
+        """Vrátí cestu ke zkompilovanému BPF souboru pro specifikaci filtru"""
+        key = self.filter_key(seccomp_filter)
+        path = self._paths.get(key)
+        if path is not None:
+            return path
+
+        with self._lock:
+            target = self.cache_dir / f"{key[:32]}.bpf"
+            if not target.exists():
+                programs = {thread: compile_bpf(spec) for thread, spec in seccomp_filter.items()}
+                tmp_file = target.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_file, "wb") as f:
+                    f.write(serialize_bincode(programs))
+                with open(target.with_suffix(".json"), "w") as f:
+                    json.dump(seccomp_filter, f, indent=2)
+                os.replace(tmp_file, target)
+            self._paths[key] = str(target.resolve())
+        return self._paths[key]
+
+    def compile_file(self, spec_path: str) -> str:
+        """Zkompiluje specifikaci filtru ze souboru JSON (formát seccompileru)"""
+        with open(spec_path, "r") as f:
+            return self.compile(json.load(f))
@@ -3,14 +3,34 @@ Bezpečnostní modul pro NovaSandbox.
 Prevence breakoutu, DOS útoků a neautorizovaného přístupu.
 """
 import logging
+import threading
 import time
-from dataclasses import dataclass
-from typing import Dict, Optional, Set
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from dataclasses import dataclass, fields
+from functools import cached_property
+from typing import (
+    Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+)
 from enum import Enum
 import hashlib
 
+from .syscall_audit import (
+    AuditSampler, SyscallAuditLog, DEFAULT_CAPACITY as DEFAULT_SYSCALL_LOG_CAPACITY
+)
+from .syscall_policy import (
+    HAS_NUMPY, np, CompiledSyscallPolicy, compile_syscall_policy, syscall_numbers
+)
+from .syscalls import syscall_name, syscall_number
+from .network_policy import CompiledNetworkPolicy, compile_network_policy
+from .path_policy import DENY, READONLY, ALLOW, PathPolicy, compile_path_policy, path_components
+
 logger = logging.getLogger(__name__)
 
+# Mountpoint hostitele v guestu - přístup je únik ze sandboxu
+HOST_MOUNT_PATH = "/host"
+
 
 class SecurityLevel(Enum):
     """Úrovně bezpečnosti"""
@@ -20,9 +40,51 @@ class SecurityLevel(Enum):
     PARANOID = "paranoid"        # Maximum - všechny kontroly
 
 
-@dataclass
+class FrozenRules(Mapping):
+    """Neměnná a hashovatelná pravidla cest (podstrom -> akce)"""
+    
+    __slots__ = ("_rules", "_hash")
+    
+    def __init__(self, rules=()):
+        self._rules = dict(rules)
+        self._hash = None
+    
+    def __getitem__(self, path: str) -> str:
+        return self._rules[path]
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rules)
+    
+    def __len__(self) -> int:
+        return len(self._rules)
+    
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(frozenset(self._rules.items()))
+        return self._hash
+    
+    def __reduce__(self):
+        return (FrozenRules, (self._rules,))
+    
+    def __repr__(self) -> str:
+        return f"FrozenRules({self._rules!r})"
+
+
+@dataclass(frozen=True)
+class CompiledPolicy:
+    """Předkompilované kontroly politiky - sdílené všemi sandboxy s politikou"""
+    syscalls: CompiledSyscallPolicy
+    network: CompiledNetworkPolicy
+    paths: PathPolicy
+
+
+@dataclass(frozen=True)
 class SecurityPolicy:
-    """Bezpečnostní politika pro sandbox"""
+    """
+    Neměnná bezpečnostní politika pro sandbox. Množiny a pravidla se
+    převádějí na neměnné typy, politika je hashovatelná podle obsahu.
+    Odvozené politiky vytvářejte přes dataclasses.replace().
+    """
     
     # Úroveň bezpečnosti
     level: SecurityLevel = SecurityLevel.STANDARD
@@ -33,20 +95,24 @@ class SecurityPolicy:
     max_processes: int = 1000
     max_open_files: int = 1024
     max_network_connections: int = 500
+    cpu_weight: int = 100              # cgroup v2 cpu.weight (1-10000)
+    max_disk_mbps: int = None          # io.max rbps/wbps, None = bez omezení
+    max_disk_iops: int = None          # io.max riops/wiops
     
     # Filesystem omezení
     allow_host_mount: bool = False  # Přístup k hostiteli FS
     readonly_rootfs: bool = False
-    allowed_devices: Set[str] = None  # /dev/null, /dev/zero, ...
+    allowed_devices: FrozenSet[str] = None  # /dev/null, /dev/zero, ...
+    path_rules: Mapping = None  # podstrom -> allow / deny / readonly
     
     # Network omezení
     allow_raw_sockets: bool = False
-    allowed_ports: Set[int] = None     # None = jakýkoliv port
-    blocked_ips: Set[str] = None
+    allowed_ports: FrozenSet[int] = None  # None = jakýkoliv port
+    blocked_ips: FrozenSet[str] = None    # Adresy nebo CIDR rozsahy (10.0.0.0/8, fd00::/8)
     rate_limit_mbps: int = 1000
     
     # Execution omezení
-    allowed_syscalls: Set[str] = None  # None = všechny
+    allowed_syscalls: FrozenSet[str] = None  # None = všechny
     allow_ptrace: bool = False         # Debug/escape prevence
     allow_setuid: bool = False         # Privilege escalation
     allow_kernel_modules: bool = False
@@ -60,53 +126,228 @@ class SecurityPolicy:
     log_syscalls: bool = False
     log_network: bool = False
     kill_on_violation: bool = True
+    audit_sample_rate: float = 1.0     # Podíl zaznamenaných povolených událostí (porušení vždy)
+    audit_warnings_per_s: float = 1.0  # Warning logy na klíč (druh porušení + předmět)
+    audit_warning_burst: int = 5
     
     def __post_init__(self):
-        if self.allowed_devices is None:
-            self.allowed_devices = {"/dev/null", "/dev/zero", "/dev/urandom"}
-        if self.blocked_ips is None:
-            self.blocked_ips = set()
+        normalize = object.__setattr__
+        normalize(self, "allowed_devices", frozenset(
+            self.allowed_devices if self.allowed_devices is not None
+            else ("/dev/null", "/dev/zero", "/dev/urandom")
+        ))
+        normalize(self, "blocked_ips", frozenset(self.blocked_ips or ()))
+        if self.allowed_ports is not None:
+            normalize(self, "allowed_ports", frozenset(self.allowed_ports))
+        if self.allowed_syscalls is not None:
+            normalize(self, "allowed_syscalls", frozenset(self.allowed_syscalls))
+        if not isinstance(self.path_rules, FrozenRules):
+            normalize(self, "path_rules", FrozenRules(
+                self.path_rules if self.path_rules is not None else {HOST_MOUNT_PATH: DENY}
+            ))
+    
+    @cached_property
+    def compiled(self) -> CompiledPolicy:
+        """Zkompilované kontroly (syscally, síť, cesty), vytvořené při prvním použití"""
+        path_rules = dict(self.path_rules)
+        if self.allow_host_mount:
+            path_rules.pop(HOST_MOUNT_PATH, None)
+        return CompiledPolicy(
+            syscalls=compile_syscall_policy(self.allowed_syscalls),
+            network=compile_network_policy(self.blocked_ips, self.allowed_ports),
+            paths=compile_path_policy(path_rules),
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializuje politiku do JSON-kompatibilního slovníku"""
+        data = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if isinstance(value, Enum):
+                value = value.value
+            elif isinstance(value, (set, frozenset)):
+                value = sorted(value)
+            elif isinstance(value, FrozenRules):
+                value = dict(value)
+            data[f.name] = value
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SecurityPolicy':
+        """Vytvoří politiku ze slovníku vytvořeného pomocí to_dict()"""
+        kwargs = {}
+        for f in fields(cls):
+            if f.name not in data:
+                continue
+            value = data[f.name]
+            if f.name == "level":
+                value = SecurityLevel(value)
+            elif isinstance(value, list):
+                value = set(value)
+            kwargs[f.name] = value
+        return cls(**kwargs)
+
+
+# Klíčem je obsah politiky, ne politika sama - silná reference v klíči
+# by politiku (a její zkompilované kontroly) držela navždy
+_interned: "weakref.WeakValueDictionary[tuple, SecurityPolicy]" = (
+    weakref.WeakValueDictionary()
+)
+_intern_lock = threading.Lock()
+
+
+def intern_policy(policy: SecurityPolicy) -> SecurityPolicy:
+    """
+    Vrátí sdílenou instanci politiky se stejným obsahem. Sandboxy se stejnou
+    politikou tak sdílí jeden objekt i jeho zkompilované kontroly.
+    """
+    key = tuple(getattr(policy, f.name) for f in fields(policy))
+    with _intern_lock:
+        shared = _interned.get(key)
+        if shared is None:
+            _interned[key] = shared = policy
+    return shared
 
 
 class RateLimiter:
-    """Rate limiter pro DOS ochranu"""
+    """
+    Rate limiter pro DOS ochranu (token bucket).
+
+    Každý klíč má kbelík s kapacitou `burst` tokenů, který se doplňuje
+    rychlostí `limit_per_second`; kontrola je O(1). Klíče jsou v LRU pořadí,
+    nečinné déle než `idle_ttl_s` se zahazují a jejich počet je omezen
+    `max_keys`. Vyřazený klíč začne znovu s plným kbelíkem: `idle_ttl_s` je
+    proto nejméně `burst / limit_per_second`, za kterou se kbelík stejně
+    doplní, a zahození nečinného klíče limit neobejde. Vyřazení kvůli
+    `max_keys` ale kbelík předčasně doplnit může - `max_keys` má pokrýt
+    všechny současně aktivní klíče.
+    """
     
-    def __init__(self, limit_per_second: int = 1000):
+    def __init__(self, limit_per_second: int = 1000, burst: Optional[int] = None,
+                 max_keys: int = 100_000, idle_ttl_s: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
         self.limit = limit_per_second
-        self.requests: Dict[str, list] = {}
+        self.burst = burst if burst is not None else limit_per_second
+        self.max_keys = max_keys
+        refill_s = self.burst / self.limit if self.limit > 0 else float("inf")
+        self.idle_ttl_s = max(idle_ttl_s, refill_s)
+        self._clock = clock
+        # klíč -> [tokeny, čas posledního doplnění], nejdéle nepoužité první
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+    
+    def _take(self, key: str, now: float, cost: float = 1.0) -> bool:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self._buckets[key] = bucket
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(key)
+            tokens = bucket[0] + (now - bucket[1]) * self.limit
+            bucket[0] = tokens if tokens < self.burst else float(self.burst)
+            bucket[1] = now
+        
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return True
+        return False
+    
+    def _evict(self, now: float):
+        """Zahodí nejdéle nepoužité klíče nad limitem a nečinné klíče (amortizovaně O(1))"""
+        buckets = self._buckets
+        while len(buckets) > self.max_keys:
+            buckets.popitem(last=False)
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] < self.idle_ttl_s:
+                break
+            buckets.popitem(last=False)
     
     def is_allowed(self, sandbox_id: str, resource_id: str = "default") -> bool:
         """Ověří, zda je request povolen"""
         key = f"{sandbox_id}:{resource_id}"
-        now = time.time()
-        
-        if key not in self.requests:
-            self.requests[key] = []
-        
-        # Vyčistí staré requesty (starší než 1 sekunda)
-        self.requests[key] = [
-            req_time for req_time in self.requests[key] 
-            if now - req_time < 1.0
-        ]
-        
-        if len(self.requests[key]) >= self.limit:
-            logger.warning(f"Rate limit exceeded for {key}")
-            return False
-        
-        self.requests[key].append(now)
-        return True
+        if self._take(key, self._clock()):
+            return True
+        # Volající zamítnutí hlásí sám; warning při floodu by byl dražší než kontrola
+        logger.debug(f"Rate limit exceeded for {key}")
+        return False
+    
+    def allow_many(self, requests: Iterable[Tuple[str, str]]) -> List[bool]:
+        """Ověří dávku (sandbox_id, resource_id) požadavků s jedním čtením hodin"""
+        now = self._clock()
+        take = self._take
+        results = [take(f"{sandbox_id}:{resource_id}", now) for sandbox_id, resource_id in requests]
+        return results
+
+
+class WarningThrottle:
+    """
+    Rate limit warning logů podle klíče. Potlačené zprávy se jen sečtou
+    a jejich počet se připojí k další propuštěné zprávě se stejným klíčem.
+    """
+    
+    def __init__(self, per_second: float = 1.0, burst: int = 5, max_keys: int = 10_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self._limiter = RateLimiter(per_second, burst, max_keys=max_keys, clock=clock)
+        self._suppressed: Dict[str, int] = {}
+        self.max_keys = max_keys
+        self.suppressed_total = 0
+    
+    def log(self, key: str, message: str, level: int = logging.WARNING) -> bool:
+        """Zaloguje zprávu, pokud to limit klíče dovolí"""
+        if self._limiter.is_allowed(key, "log"):
+            suppressed = self._suppressed.pop(key, 0)
+            if suppressed:
+                message = f"{message} ({suppressed} similar suppressed)"
+            logger.log(level, message)
+            return True
+        if len(self._suppressed) >= self.max_keys:
+            self._suppressed.clear()
+        self._suppressed[key] = self._suppressed.get(key, 0) + 1
+        self.suppressed_total += 1
+        return False
 
 
 class SandboxSecurityManager:
-    """Správce bezpečnosti pro jednotlivé sandoxy"""
+    """
+    Správce bezpečnosti pro jednotlivé sandoxy.
+
+    Audit (log_syscalls / log_network) zaznamená každé porušení, povolené
+    události jen ve vzorku `audit_sample_rate`; čítače jsou vždy přesné.
+    """
     
-    def __init__(self, sandbox_id: str, policy: SecurityPolicy):
+    def __init__(self, sandbox_id: str, policy: SecurityPolicy,
+                 syscall_log_capacity: int = DEFAULT_SYSCALL_LOG_CAPACITY,
+                 network_log_capacity: int = 4096,
+                 sample_seed: Optional[int] = None,
+                 event_log=None, event_bus=None, labels: Optional[Dict[str, str]] = None):
         self.sandbox_id = sandbox_id
-        self.policy = policy
+        self.event_log = event_log  # Trvalý log porušení (core.event_log.EventLog)
+        self.event_bus = event_bus  # Živé odběry porušení (core.event_bus.EventBus)
+        self.labels = labels or {}
+        self.policy = intern_policy(policy)
         self.created_at = time.time()
         self.violations: list = []
         self.rate_limiter = RateLimiter(limit_per_second=10000)
-        self._syscall_log = []
+        self._syscall_log = SyscallAuditLog(syscall_log_capacity)
+        self._syscall_sampler = AuditSampler(self.policy.audit_sample_rate, sample_seed)
+        # Síťový audit: vzorek záznamů (čas, ip, port, výsledek) a přesné čítače
+        self._network_log: deque = deque(maxlen=network_log_capacity)
+        self._network_sampler = AuditSampler(self.policy.audit_sample_rate, sample_seed)
+        self._network_counts = {
+            "allowed": 0, "blocked_ip": 0, "port_not_allowed": 0, "rate_limited": 0
+        }
+        self._warnings = WarningThrottle(
+            self.policy.audit_warnings_per_s, self.policy.audit_warning_burst
+        )
+        # Sdílené kontroly - sandboxy se stejnou politikou je nekompilují znovu
+        compiled = self.policy.compiled
+        self._syscall_policy = compiled.syscalls
+        self._network_policy = compiled.network
+        self._path_policy = compiled.paths
     
     def validate_config(self, config_dict: dict) -> bool:
         """Ověří konfiguraci proti politice"""
@@ -122,7 +363,7 @@ class SandboxSecurityManager:
         if errors:
             for error in errors:
                 logger.warning(f"[{self.sandbox_id}] Config violation: {error}")
-                self.violations.append({
+                self._record_violation({
                     'type': 'config_violation',
                     'message': error,
                     'timestamp': time.time()
@@ -133,67 +374,150 @@ class SandboxSecurityManager:
         
         return True
     
+    def _record_violation(self, violation: dict):
+        self.violations.append(violation)
+        if self.event_log is not None:
+            self.event_log.append("violation", self.sandbox_id, violation,
+                                  timestamp=violation['timestamp'])
+        if self.event_bus is not None:
+            self.event_bus.publish("violation", self.sandbox_id, violation, self.labels,
+                                   timestamp=violation['timestamp'])
+    
+    def _warn(self, key: str, message: str, level: int = logging.WARNING):
+        self._warnings.log(key, f"[{self.sandbox_id}] {message}", level)
+    
     def check_syscall(self, syscall_name: str) -> bool:
         """Ověří, zda je syscall povolen"""
-        if self.policy.allowed_syscalls is None:
+        if self._syscall_policy.allow_all:
             # Všechny syscalls povoleny
             if self.policy.log_syscalls:
-                self._syscall_log.append({
-                    'syscall': syscall_name,
-                    'timestamp': time.time(),
-                    'allowed': True
-                })
+                self._syscall_log.observe(syscall_number(syscall_name), True,
+                                          self._syscall_sampler)
             return True
         
-        allowed = syscall_name in self.policy.allowed_syscalls
+        nr = syscall_number(syscall_name)
+        if self._syscall_policy.allows(nr):
+            # Povolené volání: mimo vzorek jen čítač
+            if self.policy.log_syscalls:
+                self._syscall_log.observe(nr, True, self._syscall_sampler)
+            return True
         
         if self.policy.log_syscalls:
-            self._syscall_log.append({
-                'syscall': syscall_name,
-                'timestamp': time.time(),
-                'allowed': allowed
-            })
+            self._syscall_log.observe(nr, False, self._syscall_sampler)
+        violation = {
+            'type': 'syscall_violation',
+            'syscall': syscall_name,
+            'timestamp': time.time()
+        }
+        self._record_violation(violation)
+        self._warn(f"syscall:{syscall_name}", f"Blocked syscall: {syscall_name}")
         
-        if not allowed:
-            violation = {
-                'type': 'syscall_violation',
-                'syscall': syscall_name,
-                'timestamp': time.time()
-            }
-            self.violations.append(violation)
-            logger.warning(f"[{self.sandbox_id}] Blocked syscall: {syscall_name}")
-            
-            if self.policy.kill_on_violation:
-                logger.error(f"[{self.sandbox_id}] Killing sandbox due to syscall violation")
-                return False
+        if self.policy.kill_on_violation:
+            self._warn("kill", "Killing sandbox due to syscall violation", logging.ERROR)
+            return False
         
         return True
     
+    def check_syscalls(self, syscalls: Sequence[Union[str, int]],
+                       timestamps: Optional[Sequence[float]] = None):
+        """
+        Dávková kontrola auditních událostí (názvy nebo čísla syscallů).
+        Vrací masku povolených volání (NumPy pole, pokud je k dispozici),
+        porušení zaznamená najednou.
+        """
+        numbers = syscall_numbers(syscalls)
+        mask = self._syscall_policy.check_batch(numbers)
+        
+        if HAS_NUMPY:
+            denied = np.flatnonzero(~mask).tolist()
+        else:
+            denied = [i for i, ok in enumerate(mask) if not ok]
+        
+        if self.policy.log_syscalls:
+            self._record_syscall_batch(numbers, mask, denied, timestamps)
+        
+        if self._syscall_policy.allow_all:
+            return mask
+        if denied:
+            now = time.time()
+            for i in denied:
+                self._record_violation({
+                    'type': 'syscall_violation',
+                    'syscall': syscall_name(int(numbers[i])),
+                    'timestamp': timestamps[i] if timestamps is not None else now
+                })
+            self._warn("syscall:batch", f"Blocked {len(denied)} of {len(mask)} syscalls")
+            if self.policy.kill_on_violation:
+                self._warn("kill", "Killing sandbox due to syscall violation", logging.ERROR)
+        
+        return mask
+    
+    def _record_syscall_batch(self, numbers, mask, denied: List[int],
+                              timestamps: Optional[Sequence[float]]):
+        """Čítače za celou dávku, do logu porušení a vzorek povolených"""
+        log = self._syscall_log
+        log.count_numbers(numbers, mask)
+        if self._syscall_sampler.rate >= 1.0:
+            log.record_numbers(numbers, mask, timestamps)
+            return
+        
+        count = len(numbers)
+        if HAS_NUMPY:
+            allowed_positions = np.flatnonzero(mask)
+            picked = allowed_positions[self._syscall_sampler.sample_many(len(allowed_positions))]
+            keep = np.sort(np.concatenate([np.asarray(denied, dtype=np.int64), picked]))
+        else:
+            allowed_positions = [i for i, ok in enumerate(mask) if ok]
+            picked = [allowed_positions[p]
+                      for p in self._syscall_sampler.sample_many(len(allowed_positions))]
+            keep = sorted(denied + picked)
+        if len(keep) == count:
+            log.record_numbers(numbers, mask, timestamps)
+            return
+        if HAS_NUMPY:
+            kept_numbers = np.asarray(numbers)[keep]
+            kept_mask = np.asarray(mask)[keep]
+        else:
+            kept_numbers = [numbers[i] for i in keep]
+            kept_mask = [mask[i] for i in keep]
+        kept_timestamps = [timestamps[i] for i in keep] if timestamps is not None else None
+        log.record_numbers(kept_numbers, kept_mask, kept_timestamps)
+    
+    def _audit_network(self, dest_ip: str, dest_port: int, result: str):
+        """Síťový audit - porušení vždy, povolené spojení ve vzorku"""
+        self._network_counts[result] += 1
+        if result != "allowed" or self._network_sampler.sample():
+            self._network_log.append((time.time(), dest_ip, dest_port, result))
+    
     def check_network_access(self, dest_ip: str, dest_port: int) -> bool:
         """Ověří povolení síťového přístupu"""
-        # Kontrola IP blacklistu
-        if dest_ip in self.policy.blocked_ips:
+        # Kontrola IP blacklistu (adresy i CIDR rozsahy)
+        if self._network_policy.is_ip_blocked(dest_ip):
             violation = {
                 'type': 'network_violation',
                 'reason': 'blocked_ip',
                 'ip': dest_ip,
                 'timestamp': time.time()
             }
-            self.violations.append(violation)
-            logger.warning(f"[{self.sandbox_id}] Blocked IP: {dest_ip}")
+            self._record_violation(violation)
+            if self.policy.log_network:
+                self._audit_network(dest_ip, dest_port, "blocked_ip")
+            self._warn(f"ip:{dest_ip}", f"Blocked IP: {dest_ip}")
             return False
         
         # Kontrola povolených portů
-        if self.policy.allowed_ports is not None:
-            if dest_port not in self.policy.allowed_ports:
+        if not self._network_policy.any_port:
+            if not self._network_policy.is_port_allowed(dest_port):
                 violation = {
                     'type': 'network_violation',
                     'reason': 'port_not_allowed',
                     'port': dest_port,
                     'timestamp': time.time()
                 }
-                self.violations.append(violation)
-                logger.warning(f"[{self.sandbox_id}] Blocked port: {dest_port}")
+                self._record_violation(violation)
+                if self.policy.log_network:
+                    self._audit_network(dest_ip, dest_port, "port_not_allowed")
+                self._warn(f"port:{dest_port}", f"Blocked port: {dest_port}")
                 return False
         
         # Rate limiting
@@ -204,33 +528,49 @@ class SandboxSecurityManager:
                 'port': dest_port,
                 'timestamp': time.time()
             }
-            self.violations.append(violation)
-            logger.warning(f"[{self.sandbox_id}] Rate limit exceeded for {dest_ip}:{dest_port}")
+            self._record_violation(violation)
+            if self.policy.log_network:
+                self._audit_network(dest_ip, dest_port, "rate_limited")
+            self._warn(f"rate:{dest_ip}:{dest_port}",
+                       f"Rate limit exceeded for {dest_ip}:{dest_port}")
             return False
         
+        if self.policy.log_network:
+            self._audit_network(dest_ip, dest_port, "allowed")
         return True
     
     def check_file_access(self, file_path: str, mode: str = 'read') -> bool:
         """Ověří povolení přístupu k souboru"""
-        if self.policy.allow_host_mount:
+        reason = self._path_policy.check(file_path, mode)
+        if reason is None:
             return True
+        return self._file_access_violation(file_path, mode, reason)
+    
+    def check_file_accesses(self, file_paths: Iterable[str], mode: str = 'read') -> List[bool]:
+        """Dávková kontrola seznamu souborů"""
+        file_paths = list(file_paths)
+        return [
+            True if reason is None else self._file_access_violation(path, mode, reason)
+            for path, reason in zip(file_paths, self._path_policy.check_many(file_paths, mode))
+        ]
+    
+    def _file_access_violation(self, file_path: str, mode: str, reason: str) -> bool:
+        # Cesta normalizovaná do /host (i přes `..`) je pokus o únik
+        components = path_components(file_path)
+        if components[:1] == [HOST_MOUNT_PATH.strip("/")]:
+            reason = 'host_breakout_attempt'
+            self._warn(f"file:{reason}", f"Breakout attempt blocked: {file_path}", logging.ERROR)
+        else:
+            self._warn(f"file:{reason}", f"File access blocked ({reason}): {file_path}")
         
-        # Zákaz přístupu k hostiteli mimo sandbox
-        if file_path.startswith('/host') or file_path.startswith('/../'):
-            violation = {
-                'type': 'file_access_violation',
-                'path': file_path,
-                'mode': mode,
-                'reason': 'host_breakout_attempt',
-                'timestamp': time.time()
-            }
-            self.violations.append(violation)
-            logger.error(f"[{self.sandbox_id}] Breakout attempt blocked: {file_path}")
-            
-            if self.policy.kill_on_violation:
-                return False
-        
-        return True
+        self._record_violation({
+            'type': 'file_access_violation',
+            'path': file_path,
+            'mode': mode,
+            'reason': reason,
+            'timestamp': time.time()
+        })
+        return not self.policy.kill_on_violation
     
     def get_violations_summary(self) -> dict:
         """Vrátí souhrn porušení"""
@@ -240,7 +580,13 @@ class SandboxSecurityManager:
             'created_at': self.created_at,
             'lifetime_seconds': time.time() - self.created_at,
             'violations': self.violations[-100:],  # Posledních 100
-            'syscall_log_size': len(self._syscall_log)
+            'syscall_log_size': len(self._syscall_log),
+            'syscall_log_total': self._syscall_log.total,
+            'syscall_counts': self._syscall_log.counts(),
+            'network_log_size': len(self._network_log),
+            'network_counts': dict(self._network_counts),
+            'audit_sample_rate': self.policy.audit_sample_rate,
+            'suppressed_warnings': self._warnings.suppressed_total
         }
 
 
@@ -248,55 +594,15 @@ class HostSecurityHardening:
     """Hardening bezpečnosti hostitele"""
     
     @staticmethod
-    def get_firecracker_seccomp_rules() -> Dict[str, list]:
-        """Pravidla pro Firecracker seccomp"""
-        return {
-            "defaultAction": "SCMP_ACT_ALLOW",
-            "defaultErrnoRet": 1,
-            "archMap": [
-                {
-                    "architecture": "SCMP_ARCH_X86_64",
-                    "subArchitectures": [
-                        "SCMP_ARCH_X86",
-                        "SCMP_ARCH_X32"
-                    ]
-                }
-            ],
-            "syscalls": [
-                # Zákaz nebezpečných syscalls
-                {
-                    "names": ["ptrace", "clone", "fork", "vfork"],
-                    "action": "SCMP_ACT_ERRNO",
-                    "errnoRet": 1,
-                    "comment": "Disable process spawning and debugging"
-                },
-                {
-                    "names": ["mount", "umount2"],
-                    "action": "SCMP_ACT_ERRNO",
-                    "errnoRet": 1,
-                    "comment": "Disable mount operations"
-                },
-                {
-                    "names": ["module_load"],
-                    "action": "SCMP_ACT_ERRNO",
-                    "errnoRet": 1,
-                    "comment": "Disable kernel module loading"
-                }
-            ]
-        }
-    
-    @staticmethod
-    def get_cgroup_limits(config) -> Dict[str, str]:
-        """Cgroup limity pro resource control"""
-        return {
-            "memory.limit_in_bytes": str(config.memory_mb * 1024 * 1024),
-            "cpuset.cpus": f"0-{config.vcpus - 1}",
-            "pids.max": str(config.max_processes),
-            "net.ipv4.tcp_max_syn_backlog": "100",
-        }
+    def get_cgroup_limits(config, policy: Optional[SecurityPolicy] = None,
+                          io_device: Optional[str] = None) -> Dict[str, str]:
+        """Cgroup v2 limity VMM procesu (řídicí soubor -> hodnota)"""
+        from .cgroups import limits_from_policy
+        policy = policy or config.get_security_policy()
+        return limits_from_policy(policy, config, io_device).to_files()
 
 
-# Výchozí politiky pro různé use-case
+# Výchozí politiky pro různé use-case (sdílené, neměnné instance)
 DEFAULT_POLICIES = {
     SecurityLevel.BASIC: SecurityPolicy(
         level=SecurityLevel.BASIC,
@@ -318,21 +624,36 @@ DEFAULT_POLICIES = {
         max_memory_mb=1024,
         max_vcpus=2,
         max_network_connections=10,
+        max_disk_mbps=200,
+        max_disk_iops=5000,
         allow_raw_sockets=False,
         allow_ptrace=False,
         allow_setuid=False,
         enable_seccomp=True,
         enable_apparmor=True,
         kill_on_violation=True,
-        log_syscalls=True
+        log_syscalls=True,
+        audit_sample_rate=0.01
     ),
     SecurityLevel.PARANOID: SecurityPolicy(
         level=SecurityLevel.PARANOID,
         max_memory_mb=512,
         max_vcpus=1,
         max_network_connections=5,
+        cpu_weight=50,
+        max_disk_mbps=100,
+        max_disk_iops=2000,
         readonly_rootfs=True,
         allow_host_mount=False,
+        path_rules={
+            HOST_MOUNT_PATH: DENY,
+            "/": READONLY,
+            "/tmp": ALLOW,
+            "/run": ALLOW,
+            "/dev/shm": ALLOW,
+            "/proc/sys": DENY,
+            "/sys": READONLY,
+        },
         allow_raw_sockets=False,
         allow_ptrace=False,
         allow_setuid=False,
@@ -341,6 +662,9 @@ DEFAULT_POLICIES = {
         enable_apparmor=True,
         kill_on_violation=True,
         log_syscalls=True,
-        log_network=True
+        log_network=True,
+        audit_sample_rate=0.05
     )
 }
+for _policy in DEFAULT_POLICIES.values():
+    intern_policy(_policy)
@@ -0,0 +1,138 @@
+"""
+Perzistentní úložiště stavu sandboxů.
+Umožňuje po restartu control-plane znovu připojit běžící VMM.
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SandboxRecord:
+    """Záznam o sandboxu uložený na disku"""
+    sandbox_id: str
+    pid: Optional[int]
+    api_socket: str
+    tap_name: Optional[str]
+    config: Dict[str, Any]
+    state: str = "running"
+    created_at: float = field(default_factory=time.time)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class SandboxStateStore:
+    """SQLite úložiště (WAL) se záznamy o běžících sandboxech"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sandboxes (
+            sandbox_id TEXT PRIMARY KEY,
+            pid INTEGER,
+            api_socket TEXT NOT NULL,
+            tap_name TEXT,
+            config TEXT NOT NULL,
+            state TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            metadata TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, db_path: str = "novasandbox_state.db"):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None
+        )
+        # WAL + synchronous=NORMAL: zápis bez fsync na každý commit,
+        # databáze přesto přežije pád procesu
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(self._SCHEMA)
+
+    def put(self, record: SandboxRecord):
+        """Uloží nebo přepíše záznam sandboxu"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sandboxes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record.sandbox_id,
+                    record.pid,
+                    record.api_socket,
+                    record.tap_name,
+                    json.dumps(record.config),
+                    record.state,
+                    record.created_at,
+                    json.dumps(record.metadata),
+                ),
+            )
+
+    def update_state(self, sandbox_id: str, state: str):
+        """Aktualizuje stav sandboxu"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sandboxes SET state = ? WHERE sandbox_id = ?",
+                (state, sandbox_id),
+            )
+
+    def delete(self, sandbox_id: str):
+        """Odstraní záznam sandboxu"""
+        self.delete_many([sandbox_id])
+
+    def delete_many(self, sandbox_ids: Iterable[str]):
+        """Odstraní více záznamů v jedné transakci"""
+        ids = [(sid,) for sid in sandbox_ids]
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("DELETE FROM sandboxes WHERE sandbox_id = ?", ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, sandbox_id: str) -> Optional[SandboxRecord]:
+        """Vrátí záznam sandboxu"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM sandboxes WHERE sandbox_id = ?", (sandbox_id,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def load_all(self) -> List[SandboxRecord]:
+        """Načte všechny záznamy jedním dotazem"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM sandboxes").fetchall()
+        records = []
+        for row in rows:
+            try:
+                records.append(self._row_to_record(row))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Corrupted state record {row[0]}: {e}")
+        return records
+
+    def close(self):
+        """Uzavře databázi"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_record(row) -> SandboxRecord:
+        return SandboxRecord(
+            sandbox_id=row[0],
+            pid=row[1],
+            api_socket=row[2],
+            tap_name=row[3],
+            config=json.loads(row[4]),
+            state=row[5],
+            created_at=row[6],
+            metadata=json.loads(row[7]),
+        )
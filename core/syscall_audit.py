@@ -0,0 +1,228 @@
+"""
+Auditní log syscallů s pevnou kapacitou.
+Záznamy jsou v kruhovém bufferu nad kompaktními poli (číslo syscallu
+v array('H'), čas v array('d')), takže paměť sandboxu nezávisí na počtu
+volání. Souhrnné počty se vedou přesně i pro přepsané a nevzorkované
+záznamy - do bufferu může jít jen vzorek povolených volání (AuditSampler).
+"""
+import math
+import random
+import sys
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from .syscalls import syscall_name, syscall_number
+from .syscall_policy import HAS_NUMPY, np
+
+DEFAULT_CAPACITY = 16384  # ~180 KB na sandbox
+
+
+class AuditSampler:
+    """
+    Vzorkování povolených událostí. Rozestupy mezi vzorky jsou geometrické
+    (každá událost je vybrána s pravděpodobností `rate`), takže mezi vzorky
+    stojí událost jen inkrement čítače a porovnání.
+    """
+
+    __slots__ = ("rate", "seen", "_next", "_random", "_log_keep")
+
+    def __init__(self, rate: float = 1.0, seed: Optional[int] = None):
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("sample rate must be within [0, 1]")
+        self.rate = rate
+        self.seen = 0  # Počet všech nabídnutých událostí
+        self._random = random.Random(seed)
+        self._log_keep = math.log1p(-rate) if 0.0 < rate < 1.0 else None
+        self._next = self._gap()  # Pořadí příští vybrané události
+
+    def _gap(self) -> int:
+        if self.rate >= 1.0:
+            return 1
+        if self.rate <= 0.0:
+            return sys.maxsize
+        return int(math.log(1.0 - self._random.random()) / self._log_keep) + 1
+
+    def sample(self) -> bool:
+        """Započítá událost a vrátí, zda se má zaznamenat"""
+        self.seen += 1
+        if self.seen < self._next:
+            return False
+        self._next = self.seen + self._gap()
+        return True
+
+    def sample_many(self, count: int) -> List[int]:
+        """Započítá `count` událostí, vrátí pozice (0..count-1) vybraných"""
+        start = self.seen
+        end = start + count
+        positions = []
+        next_pick = self._next
+        while next_pick <= end:
+            positions.append(next_pick - start - 1)
+            next_pick += self._gap()
+        self._next = next_pick
+        self.seen = end
+        return positions
+
+
+class SyscallAuditLog:
+    """Kruhový buffer auditních záznamů syscallů"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._numbers = array("H", bytes(2 * capacity))
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._allowed = bytearray(capacity)
+        self._next = 0  # Index dalšího zápisu
+        self.total = 0  # Počet všech započítaných volání
+        self.recorded = 0  # Počet volání zapsaných do bufferu
+        # číslo syscallu -> [povoleno, zakázáno]
+        self._counters: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return min(self.recorded, self.capacity)
+
+    @property
+    def dropped(self) -> int:
+        """Počet záznamů přepsaných novějšími"""
+        return max(0, self.recorded - self.capacity)
+
+    def append(self, syscall: str, allowed: bool, timestamp: Optional[float] = None):
+        """Zaznamená volání syscallu (O(1), bez alokace záznamu)"""
+        self.append_number(syscall_number(syscall), allowed, timestamp)
+
+    def append_number(self, nr: int, allowed: bool, timestamp: Optional[float] = None):
+        """Zaznamená volání podle čísla syscallu"""
+        self._record(nr, allowed, timestamp)
+        self.count_number(nr, allowed)
+
+    def observe(self, nr: int, allowed: bool, sampler: AuditSampler):
+        """
+        Započítá volání; do bufferu zapíše porušení vždy, povolené volání
+        jen vybrané vzorkovačem.
+        """
+        self.total += 1
+        counter = self._counters.get(nr)
+        if counter is None:
+            counter = self._counters[nr] = [0, 0]
+        if allowed:
+            counter[0] += 1
+            if not sampler.sample():
+                return
+        else:
+            counter[1] += 1
+        self._record(nr, allowed, None)
+
+    def _record(self, nr: int, allowed: bool, timestamp: Optional[float]):
+        index = self._next
+        self._numbers[index] = nr
+        self._timestamps[index] = time.time() if timestamp is None else timestamp
+        self._allowed[index] = allowed
+        self._next = index + 1 if index + 1 < self.capacity else 0
+        self.recorded += 1
+
+    def count_number(self, nr: int, allowed: bool):
+        """Započítá volání bez zápisu do bufferu (nevzorkovaná událost)"""
+        self.total += 1
+        counter = self._counters.get(nr)
+        if counter is None:
+            counter = self._counters[nr] = [0, 0]
+        counter[0 if allowed else 1] += 1
+
+    def extend_numbers(self, numbers: Sequence[int], allowed: Sequence[bool],
+                       timestamps: Optional[Sequence[float]] = None):
+        """Zaznamená dávku volání (čísla, maska povolených, volitelně časy)"""
+        self.count_numbers(numbers, allowed)
+        self.record_numbers(numbers, allowed, timestamps)
+
+    def count_numbers(self, numbers: Sequence[int], allowed: Sequence[bool]):
+        """Započítá dávku volání bez zápisu do bufferu"""
+        if len(numbers):
+            self._count_batch(numbers, allowed)
+            self.total += len(numbers)
+
+    def record_numbers(self, numbers: Sequence[int], allowed: Sequence[bool],
+                       timestamps: Optional[Sequence[float]] = None):
+        """Zapíše dávku do bufferu bez započítání (čítače vede count_numbers)"""
+        count = len(numbers)
+        if count == 0:
+            return
+        self.recorded += count
+
+        # Do bufferu se vejde jen posledních `capacity` záznamů
+        keep = min(count, self.capacity)
+        start = count - keep
+        if HAS_NUMPY and isinstance(numbers, np.ndarray):
+            batch_numbers = array("H")
+            batch_numbers.frombytes(numbers[start:].astype(np.uint16).tobytes())
+            batch_allowed = np.asarray(allowed[start:], dtype=np.uint8).tobytes()
+        else:
+            batch_numbers = array("H", numbers[start:])
+            batch_allowed = bytes(bytearray(allowed[start:]))
+        if timestamps is None:
+            batch_timestamps = array("d", [time.time()]) * keep
+        else:
+            batch_timestamps = array("d", timestamps[start:])
+
+        index = self._next
+        first = min(keep, self.capacity - index)
+        self._numbers[index:index + first] = batch_numbers[:first]
+        self._timestamps[index:index + first] = batch_timestamps[:first]
+        self._allowed[index:index + first] = batch_allowed[:first]
+        rest = keep - first
+        if rest:
+            self._numbers[:rest] = batch_numbers[first:]
+            self._timestamps[:rest] = batch_timestamps[first:]
+            self._allowed[:rest] = batch_allowed[first:]
+        self._next = (index + keep) % self.capacity
+
+    def _count_batch(self, numbers: Sequence[int], allowed: Sequence[bool]):
+        counters = self._counters
+        if HAS_NUMPY and isinstance(numbers, np.ndarray):
+            mask = np.asarray(allowed, dtype=bool)
+            for slot, selected in ((0, numbers[mask]), (1, numbers[~mask])):
+                values, counts = np.unique(selected, return_counts=True)
+                for nr, n in zip(values.tolist(), counts.tolist()):
+                    counters.setdefault(nr, [0, 0])[slot] += n
+            return
+        for nr, ok in zip(numbers, allowed):
+            counter = counters.get(nr)
+            if counter is None:
+                counter = counters[nr] = [0, 0]
+            counter[0 if ok else 1] += 1
+
+    def entries(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Záznamy od nejstaršího; s `limit` jen posledních N"""
+        count = len(self)
+        if limit is not None:
+            count = min(count, limit)
+        start = (self._next - count) % self.capacity
+        for i in range(count):
+            index = (start + i) % self.capacity
+            yield {
+                "syscall": syscall_name(self._numbers[index]),
+                "timestamp": self._timestamps[index],
+                "allowed": bool(self._allowed[index]),
+            }
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Přesné počty volání po syscallech od vytvoření logu"""
+        return {
+            syscall_name(nr): {"allowed": allowed, "denied": denied}
+            for nr, (allowed, denied) in self._counters.items()
+        }
+
+    def memory_bytes(self) -> int:
+        """Velikost bufferů (bez čítačů, ty rostou jen s počtem různých syscallů)"""
+        return (self._numbers.itemsize * len(self._numbers)
+                + self._timestamps.itemsize * len(self._timestamps)
+                + len(self._allowed))
+
+    def clear(self):
+        """Zahodí záznamy i čítače"""
+        self._next = 0
+        self.total = 0
+        self.recorded = 0
+        self._counters.clear()
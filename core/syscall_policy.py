@@ -0,0 +1,108 @@
+"""
+Předkompilované syscall politiky.
+Povolené syscally se převedou na bitovou mapu indexovanou číslem syscallu.
+Mapa je neměnná a sdílená všemi sandboxy se stejnou politikou; dávková
+kontrola (audit replay) běží vektorizovaně přes NumPy, pokud je k dispozici.
+"""
+import threading
+import weakref
+from typing import FrozenSet, Iterable, Optional, Sequence, Union
+
+from .syscalls import MAX_SYSCALL_NUMBER, syscall_number
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+_BITSET_BYTES = (MAX_SYSCALL_NUMBER + 1) // 8
+
+
+class CompiledSyscallPolicy:
+    """Neměnná bitová mapa povolených syscallů (8 KB)"""
+
+    __slots__ = ("allow_all", "allowed", "_bits", "_np_bits", "__weakref__")
+
+    def __init__(self, allowed_syscalls: Optional[FrozenSet[str]]):
+        self.allow_all = allowed_syscalls is None
+        self.allowed = allowed_syscalls
+        bits = bytearray(_BITSET_BYTES)
+        for name in allowed_syscalls or ():
+            nr = syscall_number(name)
+            bits[nr >> 3] |= 1 << (nr & 7)
+        self._bits = bytes(bits)
+        self._np_bits = np.frombuffer(self._bits, dtype=np.uint8) if HAS_NUMPY else None
+
+    def allows(self, nr: int) -> bool:
+        """Povolí syscall podle čísla (O(1))"""
+        return self.allow_all or bool(self._bits[nr >> 3] >> (nr & 7) & 1)
+
+    def allows_name(self, name: str) -> bool:
+        return self.allows(syscall_number(name))
+
+    def check_batch(self, numbers):
+        """
+        Vyhodnotí dávku čísel syscallů. Vrací masku povolených volání -
+        NumPy pole bool, pokud je NumPy k dispozici, jinak seznam.
+        Čísla mimo rozsah 0..MAX_SYSCALL_NUMBER vyvolají ValueError.
+        """
+        numbers = _validated(numbers)
+        if HAS_NUMPY:
+            if self.allow_all:
+                return np.ones(numbers.shape, dtype=bool)
+            return ((self._np_bits[numbers >> 3] >> (numbers & 7)) & 1).astype(bool)
+        if self.allow_all:
+            return [True] * len(numbers)
+        bits = self._bits
+        return [bool(bits[nr >> 3] >> (nr & 7) & 1) for nr in numbers]
+
+
+# Slabé reference: zkompilovanou politiku drží jen politiky, které ji používají
+_cache: "weakref.WeakValueDictionary[Optional[FrozenSet[str]], CompiledSyscallPolicy]" = (
+    weakref.WeakValueDictionary()
+)
+_cache_lock = threading.Lock()
+
+
+def compile_syscall_policy(allowed_syscalls: Optional[Iterable[str]]) -> CompiledSyscallPolicy:
+    """Vrátí sdílenou zkompilovanou politiku pro danou množinu syscallů"""
+    key = frozenset(allowed_syscalls) if allowed_syscalls is not None else None
+    compiled = _cache.get(key)
+    if compiled is None:
+        with _cache_lock:
+            compiled = _cache.get(key)
+            if compiled is None:
+                compiled = _cache[key] = CompiledSyscallPolicy(key)
+    return compiled
+
+
+def _validated(numbers):
+    """
+    Ověří rozsah čísel syscallů a vrátí je jako uint16 pole (s NumPy)
+    nebo seznam. Přetečení při převodu na uint16 by tiše změnilo syscall.
+    """
+    if HAS_NUMPY:
+        array = np.asarray(numbers)
+        if array.dtype == np.uint16:
+            return array
+        if array.size == 0:
+            return array.astype(np.uint16)
+        if array.dtype.kind not in "iu":
+            raise ValueError(f"Syscall numbers must be integers, got {array.dtype}")
+        if array.min() < 0 or array.max() > MAX_SYSCALL_NUMBER:
+            raise ValueError(f"Syscall number out of range 0..{MAX_SYSCALL_NUMBER}")
+        return array.astype(np.uint16)
+    numbers = list(numbers)
+    if numbers and (min(numbers) < 0 or max(numbers) > MAX_SYSCALL_NUMBER):
+        raise ValueError(f"Syscall number out of range 0..{MAX_SYSCALL_NUMBER}")
+    return numbers
+
+
+def syscall_numbers(syscalls: Sequence[Union[str, int]]):
+    """Převede dávku názvů nebo čísel syscallů na čísla (ověřená, viz check_batch)"""
+    if HAS_NUMPY and isinstance(syscalls, np.ndarray):
+        return _validated(syscalls)
+    numbers = [nr if isinstance(nr, int) else syscall_number(nr) for nr in syscalls]
+    return _validated(numbers)
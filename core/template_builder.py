@@ -0,0 +1,440 @@
+"""
+Rootless sestavení šablon z vrstev s cache.
+Rootfs se skládá z tarballů a seznamů balíčků, každá vrstva je cachována
+podle hashe obsahu a rodičovské vrstvy. Výsledný ext4 image vzniká pomocí
+`mke2fs -d` ze sloučeného tarballu vrstev bez mount, chroot i sudo, takže
+vlastník a mode bity souborů zůstanou podle tarballů.
+"""
+import asyncio
+import copy
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from .template_manager import TemplateManager, TemplateInfo
+
+logger = logging.getLogger(__name__)
+
+# Soubor ve vrstvě se seznamem cest smazaných oproti rodičovským vrstvám
+WHITEOUT_FILE = ".novasandbox-whiteouts"
+
+# Minimální init spouštějící jen agenta (boot profil s init=/sbin/novasandbox-init)
+MINIMAL_INIT_SOURCE = (
+    Path(__file__).resolve().parent.parent / "templates" / "init" / "novasandbox-init"
+)
+MINIMAL_INIT_PATH = "/sbin/novasandbox-init"
+
+# Verze formátu vrstev - je součástí klíče, změna zneplatní cache vrstev
+LAYER_FORMAT_VERSION = 2
+
+# `mke2fs -d` přijímá tarball od e2fsprogs 1.47.1
+E2FSPROGS_TAR_VERSION = (1, 47, 1)
+
+
+@dataclass
+class BuildLayer:
+    """Jedna vrstva rootfs - tarball, balíčky nebo jednotlivé soubory"""
+    tarball: Optional[str] = None
+    packages: List[str] = field(default_factory=list)
+    files: Dict[str, str] = field(default_factory=dict)  # cesta v image -> cesta na hostiteli
+
+
+@dataclass
+class TemplateBuildSpec:
+    """Specifikace sestavení šablony"""
+    template_id: str
+    layers: List[BuildLayer]
+    kernel_path: str
+    size_mb: int = 500
+    repositories: List[str] = field(default_factory=list)
+    rootfs_format: str = "ext4"  # ext4, erofs nebo squashfs
+    config: Dict = field(default_factory=dict)  # další pole konfigurace šablony
+
+    @classmethod
+    def from_config(cls, template_id: str, config: Dict, kernel_path: str,
+                    base_tarball: str) -> 'TemplateBuildSpec':
+        """Vytvoří specifikaci z JSON konfigurace šablony (pole `packages`)"""
+        layers = [BuildLayer(tarball=base_tarball)]
+        if config.get("packages"):
+            layers.append(BuildLayer(packages=list(config["packages"])))
+        if config.get("boot", {}).get("minimal_init"):
+            layers.append(BuildLayer(files={MINIMAL_INIT_PATH: str(MINIMAL_INIT_SOURCE)}))
+        return cls(
+            template_id=template_id,
+            layers=layers,
+            kernel_path=kernel_path,
+            size_mb=int(config.get("disk_size_gb", 0.5) * 1024),
+            rootfs_format=config.get("rootfs", {}).get("format", "ext4"),
+            config=config,
+        )
+
+
+class TemplateBuilder:
+    """Sestavuje rootfs šablon bez root oprávnění"""
+
+    def __init__(self, template_manager: TemplateManager,
+                 cache_dir: str = ".novasandbox/build-cache",
+                 apk_path: str = "apk",
+                 mke2fs_path: str = "mke2fs",
+                 mkfs_erofs_path: str = "mkfs.erofs",
+                 mksquashfs_path: str = "mksquashfs",
+                 fakeroot_path: str = "fakeroot"):
+        self.template_manager = template_manager
+        self.cache_dir = Path(cache_dir)
+        self.layers_dir = self.cache_dir / "layers"
+        self.layers_dir.mkdir(parents=True, exist_ok=True)
+        self.apk_path = apk_path
+        self.mke2fs_path = mke2fs_path
+        self.mkfs_erofs_path = mkfs_erofs_path
+        self.mksquashfs_path = mksquashfs_path
+        self.fakeroot_path = fakeroot_path
+        self._mke2fs_tar: Optional[bool] = None
+
+    # ----- Klíče vrstev -----
+
+    def layer_key(self, layer: BuildLayer, parent_key: str,
+                  repositories: Optional[List[str]] = None) -> str:
+        """Klíč vrstvy = hash rodiče + obsahu vrstvy"""
+        digest = hashlib.sha256(parent_key.encode())
+        digest.update(f"format:{LAYER_FORMAT_VERSION}\n".encode())
+        store = self.template_manager.content_store
+        if layer.tarball:
+            digest.update(b"tarball:")
+            digest.update(store.hash_files([layer.tarball])[layer.tarball].encode())
+        if layer.packages:
+            digest.update(b"packages:")
+            digest.update(json.dumps(sorted(layer.packages)).encode())
+            digest.update(json.dumps(repositories or []).encode())
+        if layer.files:
+            sources = store.hash_files(layer.files.values())
+            digest.update(b"files:")
+            for dest in sorted(layer.files):
+                digest.update(f"{dest}={sources[layer.files[dest]]}\n".encode())
+        return digest.hexdigest()
+
+    def _layer_path(self, key: str) -> Path:
+        return self.layers_dir / f"{key}.tar"
+
+    # ----- Sestavení vrstev -----
+
+    @staticmethod
+    def _normalize(info: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+        """Vlastníkem souborů v image je root, bez ohledu na uživatele sestavení"""
+        if info.isdev():
+            return None  # Device nody nejde vytvořit bez root, řeší je devtmpfs
+        info.uid = info.gid = 0
+        info.uname = info.gname = "root"
+        return info
+
+    @staticmethod
+    def _layer_path_of(member: tarfile.TarInfo) -> str:
+        """Normalizovaná cesta položky vrstvy ("" pro kořen)"""
+        path = os.path.normpath(member.name.lstrip("/"))
+        return "" if path == "." else path
+
+    @staticmethod
+    def _extract_filter(member: tarfile.TarInfo, dest_path: str) -> Optional[tarfile.TarInfo]:
+        """Filtr "tar" (Python 3.12+) bez mazání setuid/setgid a sticky bitů"""
+        checked = tarfile.tar_filter(member, dest_path)
+        if checked is None or checked.mode == member.mode:
+            return checked
+        return checked.replace(mode=member.mode, deep=False)
+
+    def _extract(self, tar: tarfile.TarFile, staging: Path, members: List[tarfile.TarInfo]):
+        if not members:
+            return
+        if hasattr(tarfile, "tar_filter"):
+            # Python 3.12+ - odmítne absolutní cesty a únik z adresáře
+            tar.extractall(staging, members=members, filter=self._extract_filter)
+        else:
+            tar.extractall(staging, members=members)
+
+    def _merge_layers(self, layer_tars: List[Path], staging: Path):
+        """
+        Rozbalí vrstvy (zdola nahoru) do adresáře, aplikuje whiteouty.
+        Whiteout platí pro vše rozbalené před ním, i ve stejné vrstvě.
+        """
+        for layer_tar in layer_tars:
+            with tarfile.open(layer_tar, "r") as tar:
+                members = []
+                for member in tar.getmembers():
+                    if member.name.lstrip("./") == WHITEOUT_FILE:
+                        self._extract(tar, staging, members)
+                        members = []
+                        for path in tar.extractfile(member).read().decode().splitlines():
+                            target = staging / path
+                            if target.is_dir() and not target.is_symlink():
+                                shutil.rmtree(target, ignore_errors=True)
+                            elif target.exists() or target.is_symlink():
+                                target.unlink()
+                        continue
+                    if member.isdev():
+                        continue
+                    target = staging / member.name
+                    if (target.is_symlink() or target.is_file()) and not member.isdir():
+                        target.unlink()
+                    members.append(member)
+                self._extract(tar, staging, members)
+
+    def _write_merged_tar(self, layer_tars: List[Path], merged_tar: Path):
+        """
+        Sloučí vrstvy do jednoho tarballu bez rozbalování - vlastník, skupina
+        i mode bity položek se přenesou beze změny. Pozdější vrstvy přepisují
+        dřívější, whiteouty odstraní cestu i s obsahem adresáře.
+        """
+        tars = [tarfile.open(layer_tar, "r") for layer_tar in layer_tars]
+        try:
+            # cesta -> (tar, položka); dict drží pořadí prvního výskytu
+            entries: Dict[str, Tuple[tarfile.TarFile, tarfile.TarInfo]] = {}
+            for tar in tars:
+                for member in tar.getmembers():
+                    path = self._layer_path_of(member)
+                    if path == WHITEOUT_FILE:
+                        for removed in tar.extractfile(member).read().decode().splitlines():
+                            removed = os.path.normpath(removed)
+                            prefix = removed + "/"
+                            for existing in [p for p in entries
+                                             if p == removed or p.startswith(prefix)]:
+                                del entries[existing]
+                        continue
+                    if not path or member.isdev() or path == ".." or path.startswith("../"):
+                        continue
+                    # Přepsaná položka si drží pozici (před svým obsahem)
+                    entries[path] = (tar, member)
+
+            with tarfile.open(merged_tar, "w", format=tarfile.PAX_FORMAT) as out:
+                for path, (tar, member) in entries.items():
+                    if member.islnk() and self._layer_path_of(
+                            tarfile.TarInfo(member.linkname)) not in entries:
+                        logger.warning(f"Skipping hardlink {path} to removed {member.linkname}")
+                        continue
+                    info = copy.copy(member)
+                    info.name = path
+                    # Původní PAX cesty by přebily normalizované jméno
+                    info.pax_headers = {key: value for key, value in member.pax_headers.items()
+                                        if key not in ("path", "linkpath")}
+                    if member.islnk():
+                        info.linkname = self._layer_path_of(tarfile.TarInfo(member.linkname))
+                    fileobj = tar.extractfile(member) if member.isreg() else None
+                    out.addfile(info, fileobj)
+        finally:
+            for tar in tars:
+                tar.close()
+
+    @staticmethod
+    def _snapshot(root: Path) -> Dict[str, Tuple[int, int, int, int, int]]:
+        """(velikost, mtime, mode, uid, gid) všech položek pod root"""
+        result = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                st = os.lstat(path)
+                result[os.path.relpath(path, root)] = (
+                    st.st_size, st.st_mtime_ns, st.st_mode, st.st_uid, st.st_gid
+                )
+        return result
+
+    def _copy_tarball(self, tarball: Path, out: tarfile.TarFile):
+        """Přenese položky tarballu do vrstvy i s vlastníkem a mode bity"""
+        with tarfile.open(tarball, "r") as tar:
+            for member in tar.getmembers():
+                if member.isdev():
+                    continue  # Device nody řeší devtmpfs
+                out.addfile(member, tar.extractfile(member) if member.isreg() else None)
+
+    def _write_layer(self, root: Path, tarball: Optional[Path],
+                     before: Dict, after: Dict, layer_tar: Path):
+        """
+        Zapíše vrstvu: položky tarballu beze změny metadat, za nimi whiteouty
+        a soubory změněné balíčky či kopírováním (vlastník root).
+        """
+        changed = sorted(p for p, sig in after.items() if before.get(p) != sig)
+        removed = sorted(p for p in before if p not in after)
+        tmp_tar = layer_tar.with_suffix(".partial")
+        with tarfile.open(tmp_tar, "w", format=tarfile.PAX_FORMAT) as tar:
+            if tarball is not None:
+                self._copy_tarball(tarball, tar)
+            if removed:
+                data = "\n".join(removed).encode()
+                info = tarfile.TarInfo(WHITEOUT_FILE)
+                info.size = len(data)
+                tar.addfile(info, fileobj=io.BytesIO(data))
+            for path in changed:
+                tar.add(root / path, arcname=path, recursive=False, filter=self._normalize)
+        os.replace(tmp_tar, layer_tar)
+
+    async def _run(self, *cmd: str):
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"{cmd[0]} failed: {stderr.decode().strip()}")
+
+    async def _build_layer(self, layer: BuildLayer, parent_tars: List[Path],
+                           repositories: List[str], layer_tar: Path):
+        loop = asyncio.get_running_loop()
+        with tempfile.TemporaryDirectory(prefix="nsbuild_", dir=self.cache_dir) as tmp:
+            root = Path(tmp) / "rootfs"
+            root.mkdir()
+            await loop.run_in_executor(None, self._merge_layers, parent_tars, root)
+            tarball = Path(layer.tarball) if layer.tarball else None
+            if tarball is not None:
+                # Tarball jde do vrstvy přímo; rozbalený slouží jen balíčkům
+                await loop.run_in_executor(None, self._merge_layers, [tarball], root)
+            before = await loop.run_in_executor(None, self._snapshot, root)
+
+            if layer.packages:
+                cmd = [self.apk_path, "--root", str(root), "--usermode",
+                       "--no-cache", "--no-scripts", "--allow-untrusted"]
+                for repo in repositories:
+                    cmd += ["--repository", repo]
+                await self._run(*cmd, "add", *layer.packages)
+            for dest, src in layer.files.items():
+                target = root / dest.lstrip("/")
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(src, target)
+
+            after = await loop.run_in_executor(None, self._snapshot, root)
+            await loop.run_in_executor(
+                None, self._write_layer, root, tarball, before, after, layer_tar
+            )
+
+    async def build_layers(self, spec: TemplateBuildSpec) -> List[Path]:
+        """Sestaví vrstvy; vrstvy s klíčem v cache se nesestavují znovu"""
+        parent_key = ""
+        layer_tars: List[Path] = []
+        for layer in spec.layers:
+            key = self.layer_key(layer, parent_key, spec.repositories)
+            layer_tar = self._layer_path(key)
+            if layer_tar.exists():
+                logger.info(f"[{spec.template_id}] Layer {key[:12]} cached")
+            else:
+                logger.info(f"[{spec.template_id}] Building layer {key[:12]}")
+                await self._build_layer(layer, layer_tars, spec.repositories, layer_tar)
+            layer_tars.append(layer_tar)
+            parent_key = key
+        return layer_tars
+
+    # ----- Image a registrace -----
+
+    async def _mke2fs_supports_tar(self) -> bool:
+        """Zjistí (jednou), zda `mke2fs -d` umí číst tarball"""
+        if self._mke2fs_tar is None:
+            process = await asyncio.create_subprocess_exec(
+                self.mke2fs_path, "-V",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+            match = re.search(rb"mke2fs (\d+)\.(\d+)(?:\.(\d+))?", stdout + stderr)
+            version = tuple(int(part or 0) for part in match.groups()) if match else ()
+            self._mke2fs_tar = version >= E2FSPROGS_TAR_VERSION
+        return self._mke2fs_tar
+
+    async def _make_ext4(self, layer_tars: List[Path], image: Path, size_mb: int):
+        """
+        Vytvoří ext4 image z vrstev pomocí `mke2fs -d` (bez root). Vlastníci
+        a mode bity se berou ze sloučeného tarballu vrstev: nový mke2fs ho čte
+        přímo, se starším se rozbalí a zabalí pod fakeroot. Bez obojího
+        patří soubory uživateli sestavení.
+        """
+        loop = asyncio.get_running_loop()
+        tmp_image = image.with_suffix(".partial")
+        with open(tmp_image, "wb") as f:
+            f.truncate(size_mb * 1024 * 1024)  # Řídký soubor místo dd
+        mke2fs = [self.mke2fs_path, "-q", "-F", "-t", "ext4",
+                  "-O", "^has_journal",  # Bez journalu pro rychlejší boot
+                  "-E", "root_owner=0:0"]
+        with tempfile.TemporaryDirectory(prefix="nsbuild_", dir=self.cache_dir) as tmp:
+            merged_tar = Path(tmp) / "rootfs.tar"
+            root = Path(tmp) / "rootfs"
+            await loop.run_in_executor(None, self._write_merged_tar, layer_tars, merged_tar)
+            if await self._mke2fs_supports_tar():
+                await self._run(*mke2fs, "-d", str(merged_tar), str(tmp_image))
+            elif shutil.which(self.fakeroot_path):
+                root.mkdir()
+                await self._run(
+                    self.fakeroot_path, "--", "sh", "-c",
+                    'tar -xpf "$1" -C "$2" && shift 2 && exec "$@"', "sh",
+                    str(merged_tar), str(root), *mke2fs, "-d", str(root), str(tmp_image)
+                )
+            else:
+                logger.warning(
+                    "mke2fs without tar input and no fakeroot, "
+                    "image files will be owned by the build user"
+                )
+                root.mkdir()
+                await loop.run_in_executor(None, self._merge_layers, [merged_tar], root)
+                await self._run(*mke2fs, "-d", str(root), str(tmp_image))
+        os.replace(tmp_image, image)
+
+    async def _make_compressed(self, layer_tars: List[Path], image: Path, rootfs_format: str):
+        """Vytvoří komprimovaný read-only image (erofs/squashfs) z vrstev"""
+        loop = asyncio.get_running_loop()
+        tmp_image = image.with_suffix(".partial")
+        tmp_image.unlink(missing_ok=True)  # mksquashfs by do existujícího přidával
+        with tempfile.TemporaryDirectory(prefix="nsbuild_", dir=self.cache_dir) as tmp:
+            root = Path(tmp) / "rootfs"
+            root.mkdir()
+            await loop.run_in_executor(None, self._merge_layers, layer_tars, root)
+            if rootfs_format == "erofs":
+                await self._run(
+                    self.mkfs_erofs_path, "-zlz4hc", "--all-root",
+                    str(tmp_image), str(root)
+                )
+            elif rootfs_format == "squashfs":
+                await self._run(
+                    self.mksquashfs_path, str(root), str(tmp_image),
+                    "-comp", "zstd", "-all-root", "-noappend", "-quiet"
+                )
+            else:
+                raise ValueError(f"Unsupported rootfs format: {rootfs_format}")
+        os.replace(tmp_image, image)
+
+    async def build(self, spec: TemplateBuildSpec) -> Optional[TemplateInfo]:
+        """Sestaví šablonu a zaregistruje ji v TemplateManageru"""
+        layer_tars = await self.build_layers(spec)
+
+        template_dir = self.template_manager.templates_dir / spec.template_id
+        template_dir.mkdir(parents=True, exist_ok=True)
+        rootfs_image = f"rootfs.{spec.rootfs_format}"
+        if spec.rootfs_format == "ext4":
+            await self._make_ext4(layer_tars, template_dir / rootfs_image, spec.size_mb)
+        else:
+            await self._make_compressed(layer_tars, template_dir / rootfs_image, spec.rootfs_format)
+
+        kernel_target = template_dir / "vmlinux"
+        if not kernel_target.exists() or not os.path.samefile(spec.kernel_path, kernel_target):
+            tmp_kernel = kernel_target.with_suffix(".partial")
+            shutil.copy2(spec.kernel_path, tmp_kernel)
+            os.replace(tmp_kernel, kernel_target)
+
+        config = dict(spec.config)
+        config.update({
+            "template_id": spec.template_id,
+            "required_files": ["vmlinux", rootfs_image],
+            "rootfs": {**spec.config.get("rootfs", {}),
+                       "format": spec.rootfs_format, "image": rootfs_image},
+            "disk_size_gb": spec.size_mb / 1024,
+            "build": {"layers": [p.stem for p in layer_tars]},
+        })
+        config_file = template_dir / f"{spec.template_id}.json"
+        tmp_config = config_file.with_suffix(".partial")
+        with open(tmp_config, "w") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_config, config_file)
+
+        logger.info(f"Built template {spec.template_id} from {len(layer_tars)} layers")
+        return self.template_manager.register_template(spec.template_id)
@@ -1,15 +1,34 @@
 """
 Správa předpřipravených šablon microVM.
 """
+import asyncio
+import hashlib
 import json
 import os
+import shutil
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Optional, List
-from dataclasses import dataclass
+from typing import Dict, Optional, List, Tuple
+from dataclasses import dataclass, field, asdict
+from .template_store import ContentStore
+from .fs_watch import (
+    DirectoryWatcher, HAS_INOTIFY, IN_ISDIR, IN_DELETE_SELF, IN_MOVE_SELF,
+    IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Komprimované obrazy - jedna kopie v page cache sdílená všemi sandboxy
+READ_ONLY_ROOTFS_FORMATS = ("erofs", "squashfs")
+ROOTFS_FORMATS = ("ext4",) + READ_ONLY_ROOTFS_FORMATS
+DEFAULT_OVERLAY_SIZE_MB = 256
+
+# Backoff po neúspěšném vytvoření golden snapshotu (zdvojuje se do maxima)
+SNAPSHOT_RETRY_BASE_S = 30.0
+SNAPSHOT_RETRY_MAX_S = 3600.0
+
 @dataclass
 class TemplateInfo:
     """Informace o šabloně"""
@@ -23,34 +42,287 @@ class TemplateInfo:
     disk_size_gb: float
     kernel_version: str
     files: Dict[str, str]  # path -> sha256
+    file_paths: Dict[str, str] = field(default_factory=dict)  # path -> absolutní cesta
+    golden_snapshot: bool = False  # Restore sandboxů ze snapshotu místo bootu
+    preload_modules: List[str] = field(default_factory=list)  # Importy před snapshotem
+    initrd_path: Optional[str] = None  # Absolutní cesta k initrd
+    boot_profiles: Dict[str, str] = field(default_factory=dict)  # název -> kernel args
+    default_boot_profile: Optional[str] = None
+    rootfs_image: str = "rootfs.ext4"  # Klíč v file_paths
+    rootfs_format: str = "ext4"  # ext4 (zapisovatelný) nebo erofs/squashfs (read-only)
+    overlay_size_mb: int = 0  # Velikost zapisovatelného overlay disku, 0 = bez overlay
+    
+    @property
+    def read_only_rootfs(self) -> bool:
+        return self.rootfs_format in READ_ONLY_ROOTFS_FORMATS
+    
+    @property
+    def snapshot_capable(self) -> bool:
+        """
+        Golden snapshot je bezpečný jen s read-only rootfs a vlastním overlay
+        každého sandboxu - snapshot zapisovatelného ext4 by sdílely všechny
+        restorované VM a souběžné zápisy by obraz poškodily.
+        """
+        return self.golden_snapshot and self.read_only_rootfs and self.overlay_size_mb > 0
+    
+    def boot_args(self, profile: Optional[str] = None) -> Optional[str]:
+        """Kernel args profilu (výchozího, pokud není zadán); None bez profilů"""
+        name = profile or self.default_boot_profile
+        if name is None:
+            return None
+        if name not in self.boot_profiles:
+            raise ValueError(f"Unknown boot profile '{name}' for template {self.template_id}")
+        return self.boot_profiles[name]
+
+@dataclass
+class GoldenSnapshot:
+    """Snapshot šablony po bootu a zahřátí interpretu"""
+    template_id: str
+    key: str  # Hash souborů šablony a přednačtených modulů
+    snapshot_path: str
+    mem_file_path: str
+    created_at: float = field(default_factory=time.time)
+    overlay_path: Optional[str] = None  # Stav overlay disku v okamžiku snapshotu
 
 class TemplateManager:
     """Správce šablon microVM"""
     
-    def __init__(self, templates_dir: str = "templates"):
+    def __init__(self, templates_dir: str = "templates",
+                 content_store: Optional[ContentStore] = None,
+                 watch: bool = False,
+                 stat_ttl_s: float = 1.0):
         self.templates_dir = Path(templates_dir)
+        self.index_file = self.templates_dir / ".store" / "index.json"
+        self._content_store = content_store
+        # Načtené šablony (lazy) a lehký index všech šablon na disku
         self._templates: Dict[str, TemplateInfo] = {}
-        self._load_templates()
+        self._index: Dict[str, Dict] = {}
+        self._index_lock = threading.RLock()
+        # adresář -> template_id, pro mapování inotify událostí
+        self._watched_dirs: Dict[str, str] = {}
+        # path -> (signatura ze stat nebo None, čas ověření)
+        self._stat_cache: Dict[str, Tuple[Optional[tuple], float]] = {}
+        self._stat_ttl_s = stat_ttl_s
+        self._watcher: Optional[DirectoryWatcher] = None
+        self.snapshots_dir = self.templates_dir / ".store" / "snapshots"
+        self.overlays_dir = self.templates_dir / ".store" / "overlays"
+        self._overlay_lock: Optional[asyncio.Lock] = None
+        self._snapshots: Dict[str, GoldenSnapshot] = {}
+        self._snapshot_locks: Dict[str, asyncio.Lock] = {}
+        # klíč snapshotu -> (nejbližší další pokus, počet neúspěchů)
+        self._snapshot_failures: Dict[str, Tuple[float, int]] = {}
+        self._load_index()
+        if watch:
+            self.start_watching()
+    
+    def start_watching(self) -> bool:
+        """
+        Zapne inotify sledování adresáře šablon. Cache validace pak platí,
+        dokud nepřijde událost; bez inotify se záznamy obnovují po stat_ttl_s.
+        """
+        if self._watcher is not None:
+            return True
+        if not HAS_INOTIFY:
+            logger.warning("inotify not available, template validation uses stat TTL")
+            return False
+        
+        watcher = DirectoryWatcher(self._on_fs_event)
+        dirs = {str(self.templates_dir)} if self.templates_dir.exists() else set()
+        dirs.update(self._watched_dirs)
+        for directory in dirs:
+            watcher.add_watch(directory)
+        watcher.start()
+        
+        # Co se změnilo před spuštěním sledování, musí se znovu ověřit
+        self._stat_cache.clear()
+        self._watcher = watcher
+        return True
+    
+    def close(self):
+        """Zastaví sledování adresáře šablon"""
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+    
+    def _on_fs_event(self, path: str, mask: int):
+        """Zneplatní záznamy cache dotčené změnou na disku a přenačte šablonu"""
+        self._stat_cache.pop(path, None)
+        if mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF):
+            prefix = path.rstrip("/") + "/"
+            for cached in [p for p in list(self._stat_cache) if p.startswith(prefix)]:
+                self._stat_cache.pop(cached, None)
+        
+        parent = os.path.dirname(path)
+        if parent == str(self.templates_dir):
+            # Přidaný, smazaný nebo přejmenovaný adresář šablony
+            name = os.path.basename(path)
+            if not name.startswith("."):
+                # Nový adresář sledujeme hned, aby se neztratil zápis konfigurace
+                if mask & IN_ISDIR and os.path.isdir(path):
+                    self._watch_dir(path, name)
+                self._reload_template(name)
+            return
+        
+        template_id = self._watched_dirs.get(parent) or self._watched_dirs.get(path)
+        if template_id is not None and self._needs_reload(path, mask, template_id):
+            self._reload_template(template_id)
+    
+    def _needs_reload(self, path: str, mask: int, template_id: str) -> bool:
+        """
+        Rozhodne, zda změna v adresáři šablony vyžaduje přenačtení. Zápisy do
+        obrazu rootfs (VM zapisuje do ext4) se ignorují - přenačtení by obraz
+        přehashovalo a změnilo klíč golden snapshotu. Reaguje se na zápis
+        konfigurace a na nahrazení či smazání sledovaných souborů.
+        """
+        if path in self._watched_dirs:
+            return True  # Smazaný nebo přesunutý adresář šablony
+        name = os.path.basename(path)
+        if name in ("config.json", f"{template_id}.json"):
+            return bool(mask & (
+                IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+            ))
+        template = self._templates.get(template_id)
+        if template is None:
+            return False
+        fname = {os.path.basename(p): f for f, p in template.file_paths.items()}.get(name)
+        if fname is None:
+            return False
+        if mask & (IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+            return True
+        return bool(mask & IN_CLOSE_WRITE) and fname != template.rootfs_image
+    
+    def _reload_template(self, template_id: str):
+        """Inkrementálně aktualizuje index a znovu načte jen změněnou šablonu"""
+        with self._index_lock:
+            was_loaded = self._templates.pop(template_id, None) is not None
+            entry = self._index_entry(template_id)
+            if entry is None:
+                if self._index.pop(template_id, None) is not None:
+                    logger.info(f"Template removed: {template_id}")
+            else:
+                self._index[template_id] = entry
+            self._save_index()
+        
+        if was_loaded and entry is not None:
+            self.get_template(template_id)
+    
+    def _file_signature(self, path: str) -> Optional[tuple]:
+        """Vrátí (inode, velikost, mtime) souboru z cache, při minutí zavolá stat"""
+        entry = self._stat_cache.get(path)
+        if entry is not None and (
+            self._watcher is not None or time.monotonic() - entry[1] < self._stat_ttl_s
+        ):
+            return entry[0]
+        
+        try:
+            st = os.stat(path)
+            signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            signature = None
+        self._stat_cache[path] = (signature, time.monotonic())
+        return signature
+    
+    @property
+    def content_store(self) -> ContentStore:
+        """Content-addressed úložiště souborů šablon (vytvoří se při první potřebě)"""
+        if self._content_store is None:
+            self._content_store = ContentStore(str(self.templates_dir / ".store"))
+        return self._content_store
+    
+    def _find_config_file(self, template_dir: Path) -> Optional[Path]:
+        """Najde konfigurační JSON šablony"""
+        config_file = template_dir / f"{template_dir.name}.json"
+        if not config_file.exists():
+            config_file = template_dir / "config.json"
+        return config_file if config_file.exists() else None
     
-    def _load_templates(self):
-        """Načte všechny dostupné šablony"""
+    def _index_entry(self, template_id: str) -> Optional[Dict]:
+        """Vytvoří záznam indexu pro šablonu (jen stat, bez parsování JSON)"""
+        template_dir = self.templates_dir / template_id
+        config_file = self._find_config_file(template_dir)
+        if config_file is None:
+            return None
+        return {
+            "config_file": config_file.as_posix(),
+            "config_mtime_ns": config_file.stat().st_mtime_ns,
+            "dir_mtime_ns": template_dir.stat().st_mtime_ns,
+        }
+    
+    def _entry_is_current(self, template_id: str, entry: Dict) -> bool:
+        """Ověří záznam indexu podle mtime adresáře šablony a její konfigurace"""
+        try:
+            dir_mtime_ns = (self.templates_dir / template_id).stat().st_mtime_ns
+            config_mtime_ns = os.stat(entry["config_file"]).st_mtime_ns
+        except (OSError, KeyError):
+            return False
+        return (entry.get("dir_mtime_ns") == dir_mtime_ns
+                and entry.get("config_mtime_ns") == config_mtime_ns)
+    
+    def _load_index(self):
+        """
+        Načte index šablon. Pokud se adresář šablon od zápisu indexu nezměnil,
+        index se použije bez procházení adresáře, jinak se přestaví. Záznamy
+        se i tak ověří podle mtime adresáře a konfigurace každé šablony
+        (změna config.json mtime adresáře šablon nezmění).
+        """
         if not self.templates_dir.exists():
             logger.warning(f"Templates directory not found: {self.templates_dir}")
             return
         
-        for template_dir in self.templates_dir.iterdir():
-            if not template_dir.is_dir():
-                continue
-            
-            config_file = template_dir / f"{template_dir.name}.json"
-            if not config_file.exists():
-                config_file = template_dir / "config.json"
-            
-            if config_file.exists():
-                try:
-                    self._load_template(template_dir.name, config_file)
-                except Exception as e:
-                    logger.error(f"Failed to load template {template_dir.name}: {e}")
+        try:
+            with open(self.index_file, "r") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+        
+        if stored.get("dir_mtime_ns") == self.templates_dir.stat().st_mtime_ns:
+            index = stored.get("templates", {})
+            stale = [tid for tid, entry in index.items()
+                     if not self._entry_is_current(tid, entry)]
+            with self._index_lock:
+                self._index = index
+                for template_id in stale:
+                    entry = self._index_entry(template_id)
+                    if entry is None:
+                        del self._index[template_id]
+                    else:
+                        self._index[template_id] = entry
+                if stale:
+                    self._save_index()
+            return
+        
+        self._rebuild_index()
+    
+    def _rebuild_index(self):
+        """Projde adresář šablon a zapíše nový index"""
+        index = {}
+        with os.scandir(self.templates_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                index_entry = self._index_entry(entry.name)
+                if index_entry is not None:
+                    index[entry.name] = index_entry
+        
+        with self._index_lock:
+            self._index = index
+            self._save_index()
+    
+    def _save_index(self):
+        """Atomicky zapíše index na disk"""
+        try:
+            # Adresář indexu musí existovat dřív, než zjistíme mtime adresáře šablon
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            data = {
+                "dir_mtime_ns": self.templates_dir.stat().st_mtime_ns,
+                "templates": self._index,
+            }
+            tmp_file = self.index_file.with_suffix(".tmp")
+            with open(tmp_file, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            logger.debug(f"Cannot write template index {self.index_file}: {e}")
     
     def _load_template(self, template_id: str, config_file: Path):
         """Načte jednu šablonu z JSON souboru"""
@@ -60,12 +332,48 @@ class TemplateManager:
         template_dir = config_file.parent
         
         # Validace potřebných souborů
-        required_files = {}
+        file_paths = {}
         for fname in config.get("required_files", []):
             file_path = template_dir / fname
             if not file_path.exists():
                 raise FileNotFoundError(f"Required file not found: {fname}")
-            required_files[fname] = file_path.resolve().as_posix()
+            file_paths[fname] = file_path.resolve().as_posix()
+        
+        # Initrd se hashuje a sleduje stejně jako ostatní soubory šablony
+        boot = config.get("boot", {})
+        initrd = boot.get("initrd")
+        if initrd and initrd not in file_paths:
+            initrd_file = template_dir / initrd
+            if not initrd_file.exists():
+                raise FileNotFoundError(f"Initrd not found: {initrd}")
+            file_paths[initrd] = initrd_file.resolve().as_posix()
+        
+        rootfs = config.get("rootfs", {})
+        rootfs_format = rootfs.get("format", "ext4")
+        if rootfs_format not in ROOTFS_FORMATS:
+            raise ValueError(f"Unsupported rootfs format: {rootfs_format}")
+        rootfs_image = rootfs.get("image", f"rootfs.{rootfs_format}")
+        if rootfs_image not in file_paths and (template_dir / rootfs_image).exists():
+            file_paths[rootfs_image] = (template_dir / rootfs_image).resolve().as_posix()
+        overlay_size_mb = rootfs.get(
+            "overlay_size_mb",
+            DEFAULT_OVERLAY_SIZE_MB if rootfs_format in READ_ONLY_ROOTFS_FORMATS else 0
+        )
+        
+        profiles = boot.get("profiles", {})
+        default_profile = boot.get("default_profile")
+        if default_profile is not None and default_profile not in profiles:
+            raise ValueError(f"Default boot profile '{default_profile}' is not defined")
+        
+        # Hashe se počítají paralelně a jen pro soubory, které nejsou v cache
+        # Zapisovatelný rootfs se do úložiště nehardlinkuje (zápis z VM by
+        # změnil sdílený blob)
+        writable = []
+        if rootfs_format not in READ_ONLY_ROOTFS_FORMATS and rootfs_image in file_paths:
+            writable.append(file_paths[rootfs_image])
+        digests = self.content_store.ingest(
+            file_paths.values(), writable=writable
+        ) if file_paths else {}
         
         template_info = TemplateInfo(
             template_id=template_id,
@@ -77,19 +385,66 @@ class TemplateManager:
             boot_time_ms=config.get("boot_time_ms", 150.0),
             disk_size_gb=config.get("disk_size_gb", 1.0),
             kernel_version=config.get("kernel_version", "unknown"),
-            files=required_files
+            files={fname: digests[fpath] for fname, fpath in file_paths.items()},
+            file_paths=file_paths,
+            golden_snapshot=config.get("golden_snapshot", {}).get("enabled", False),
+            preload_modules=config.get("golden_snapshot", {}).get("preload_modules", []),
+            initrd_path=file_paths.get(initrd) if initrd else None,
+            boot_profiles=profiles,
+            default_boot_profile=default_profile,
+            rootfs_image=rootfs_image,
+            rootfs_format=rootfs_format,
+            overlay_size_mb=overlay_size_mb
         )
         
+        if template_info.golden_snapshot and not template_info.snapshot_capable:
+            logger.warning(
+                f"Golden snapshot of template {template_id} disabled: "
+                f"requires a read-only rootfs with an overlay disk"
+            )
+        
         self._templates[template_id] = template_info
+        
+        dirs = {template_dir.as_posix()} | {os.path.dirname(p) for p in file_paths.values()}
+        for directory in dirs:
+            self._watch_dir(directory, template_id)
         logger.info(f"Loaded template: {template_id}")
     
+    def _watch_dir(self, directory: str, template_id: str):
+        """Přiřadí adresář šabloně a případně ho začne sledovat"""
+        if directory not in self._watched_dirs and self._watcher is not None:
+            try:
+                self._watcher.add_watch(directory)
+            except OSError as e:
+                logger.warning(f"Cannot watch {directory}: {e}")
+        self._watched_dirs[directory] = template_id
+    
     def get_template(self, template_id: str) -> Optional[TemplateInfo]:
-        """Vrátí informace o šabloně"""
-        return self._templates.get(template_id)
+        """Vrátí informace o šabloně, při prvním přístupu ji načte z disku"""
+        template = self._templates.get(template_id)
+        if template is not None:
+            return template
+        
+        with self._index_lock:
+            entry = self._index.get(template_id)
+            if entry is None:
+                return None
+            if template_id not in self._templates:
+                try:
+                    self._load_template(template_id, Path(entry["config_file"]))
+                except Exception as e:
+                    logger.error(f"Failed to load template {template_id}: {e}")
+                    return None
+            return self._templates.get(template_id)
+    
+    def register_template(self, template_id: str) -> Optional[TemplateInfo]:
+        """Zaregistruje (nebo přenačte) šablonu, která byla právě vytvořena na disku"""
+        self._reload_template(template_id)
+        return self.get_template(template_id)
     
     def list_templates(self) -> List[str]:
-        """Vrátí seznam všech dostupných šablon"""
-        return list(self._templates.keys())
+        """Vrátí seznam všech dostupných šablon (z indexu, bez načítání)"""
+        return list(self._index.keys())
     
     def validate_template(self, template_id: str) -> bool:
         """Ověří, zda je šablona platná a všechny soubory existují"""
@@ -97,8 +452,149 @@ class TemplateManager:
         if not template:
             return False
         
-        for fname, fpath in template.files.items():
-            if not os.path.exists(fpath):
+        # Na horké cestě jen dict lookup - stat až po změně na disku
+        for fpath in template.file_paths.values():
+            if self._file_signature(fpath) is None:
                 return False
         
         return True
+    
+    def verify_template(self, template_id: str) -> bool:
+        """Ověří integritu souborů šablony proti uloženým sha256"""
+        template = self.get_template(template_id)
+        if not template:
+            return False
+        
+        return all(
+            self.content_store.verify(template.file_paths[fname], digest)
+            for fname, digest in template.files.items()
+        )
+    
+    # ----- Golden snapshoty -----
+    
+    def snapshot_key(self, template: TemplateInfo) -> str:
+        """Klíč snapshotu - změní se s hashem kteréhokoliv souboru šablony"""
+        digest = hashlib.sha256()
+        for fname in sorted(template.files):
+            digest.update(f"{fname}={template.files[fname]}\n".encode())
+        digest.update(json.dumps(template.preload_modules).encode())
+        # Snapshot vzniká bootem s výchozím profilem
+        digest.update((template.boot_args() or "").encode())
+        digest.update(f"overlay={template.overlay_size_mb}".encode())
+        return digest.hexdigest()
+    
+    def get_golden_snapshot(self, template_id: str) -> Optional[GoldenSnapshot]:
+        """Vrátí platný golden snapshot šablony, pokud existuje"""
+        template = self.get_template(template_id)
+        if template is None or not template.snapshot_capable:
+            return None
+        
+        key = self.snapshot_key(template)
+        snapshot = self._snapshots.get(template_id)
+        if snapshot is not None and snapshot.key == key:
+            return snapshot
+        
+        # Snapshot z předchozího běhu control-plane
+        meta_file = self.snapshots_dir / template_id / key / "meta.json"
+        try:
+            with open(meta_file, "r") as f:
+                snapshot = GoldenSnapshot(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        paths = [snapshot.snapshot_path, snapshot.mem_file_path, snapshot.overlay_path]
+        if not all(os.path.exists(path) for path in paths if path is not None):
+            return None
+        self._snapshots[template_id] = snapshot
+        return snapshot
+    
+    async def ensure_golden_snapshot(self, template_id: str,
+                                     hypervisor) -> Optional[GoldenSnapshot]:
+        """
+        Vrátí golden snapshot šablony; při prvním použití ho vytvoří pomocí
+        hypervisor.create_golden_snapshot(). Staré snapshoty (jiné hashe
+        souborů) se smažou. Neúspěch se pamatuje pro klíč snapshotu a další
+        pokus přijde až po backoffu - do té doby sandboxy rovnou bootují.
+        """
+        template = self.get_template(template_id)
+        if template is None or not template.snapshot_capable:
+            return None
+        
+        lock = self._snapshot_locks.setdefault(template_id, asyncio.Lock())
+        async with lock:
+            snapshot = self.get_golden_snapshot(template_id)
+            if snapshot is not None:
+                return snapshot
+            
+            key = self.snapshot_key(template)
+            failure = self._snapshot_failures.get(key)
+            if failure is not None and time.monotonic() < failure[0]:
+                return None
+            snapshot_dir = self.snapshots_dir / template_id / key
+            snapshot_dir.mkdir(parents=True, exist_ok=True)
+            snapshot = GoldenSnapshot(
+                template_id=template_id,
+                key=key,
+                snapshot_path=str((snapshot_dir / "vmstate").resolve()),
+                mem_file_path=str((snapshot_dir / "memory").resolve())
+            )
+            
+            try:
+                await hypervisor.create_golden_snapshot(template, snapshot)
+            except Exception as e:
+                failures = (failure[1] if failure is not None else 0) + 1
+                delay = min(SNAPSHOT_RETRY_BASE_S * 2 ** (failures - 1), SNAPSHOT_RETRY_MAX_S)
+                self._snapshot_failures[key] = (time.monotonic() + delay, failures)
+                logger.error(
+                    f"Failed to create golden snapshot for {template_id}: {e} "
+                    f"(retry in {delay:.0f}s)"
+                )
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+                return None
+            self._snapshot_failures.pop(key, None)
+            
+            with open(snapshot_dir / "meta.json", "w") as f:
+                json.dump(asdict(snapshot), f)
+            
+            for stale in (self.snapshots_dir / template_id).iterdir():
+                if stale.name != key:
+                    shutil.rmtree(stale, ignore_errors=True)
+            
+            self._snapshots[template_id] = snapshot
+            logger.info(f"Created golden snapshot for {template_id} ({key[:12]})")
+            return snapshot
+    
+    # ----- Overlay disky -----
+    
+    async def ensure_overlay_image(self, size_mb: int, mke2fs_path: str = "mke2fs") -> str:
+        """
+        Vrátí cestu k prázdnému naformátovanému ext4 overlay obrazu dané
+        velikosti. Obraz se vytvoří jednou; sandboxy dostávají jeho řídkou kopii.
+        """
+        image = self.overlays_dir / f"blank-{size_mb}.ext4"
+        if image.exists():
+            return str(image)
+        
+        if self._overlay_lock is None:
+            self._overlay_lock = asyncio.Lock()
+        async with self._overlay_lock:
+            if image.exists():
+                return str(image)
+            self.overlays_dir.mkdir(parents=True, exist_ok=True)
+            tmp_image = image.with_suffix(".partial")
+            with open(tmp_image, "wb") as f:
+                f.truncate(size_mb * 1024 * 1024)
+            process = await asyncio.create_subprocess_exec(
+                mke2fs_path, "-q", "-F", "-t", "ext4",
+                "-O", "^has_journal",
+                "-E", "lazy_itable_init=1,root_owner=0:0",
+                "-L", "overlay", str(tmp_image),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+            if process.returncode != 0:
+                tmp_image.unlink(missing_ok=True)
+                raise RuntimeError(f"mke2fs failed: {stderr.decode().strip()}")
+            os.replace(tmp_image, image)
+            logger.info(f"Created blank {size_mb}MB overlay image")
+        return str(image)
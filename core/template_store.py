@@ -0,0 +1,237 @@
+"""
+Content-addressed úložiště souborů šablon.
+Soubory jsou klíčovány podle sha256, hashe se počítají jednou a cachují
+podle (zařízení, inode, velikost, mtime). Obsahuje i kopírování řídkých
+diskových obrazů.
+"""
+import errno
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Velikost bloku pro hashování - hashlib pro velké bloky uvolňuje GIL,
+# takže vlákna hashují paralelně
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# ioctl(FICLONE) - reflink celého souboru (btrfs, xfs, bcachefs)
+FICLONE = 0x40049409
+
+
+def hash_file(path: str) -> str:
+    """Spočítá sha256 souboru čtením přes mmap"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for offset in range(0, size, HASH_CHUNK_SIZE):
+                    digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def sparse_copy(src: str, dst: str):
+    """
+    Zkopíruje soubor se zachováním děr (SEEK_DATA/SEEK_HOLE). Data se kopírují
+    přes copy_file_range, na btrfs/xfs tedy jako reflink bez kopírování bloků.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+        os.ftruncate(dst_fd, size)
+        if not hasattr(os, "SEEK_DATA"):
+            shutil.copyfileobj(fsrc, fdst)
+            return
+        offset = 0
+        while offset < size:
+            try:
+                data_start = os.lseek(src_fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break  # Zbytek souboru je díra
+                raise
+            data_end = os.lseek(src_fd, data_start, os.SEEK_HOLE)
+            _copy_range(src_fd, dst_fd, data_start, data_end)
+            offset = data_end
+
+
+def reflink(src: str, dst: str) -> bool:
+    """
+    Vytvoří `dst` jako reflink kopii `src` (sdílené bloky, copy-on-write).
+    Vrací False, pokud to souborový systém nepodporuje; `dst` pak nevznikne.
+    """
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        with suppress(FileNotFoundError):
+            os.unlink(dst)
+        return False
+    return True
+
+
+def _copy_range(src_fd: int, dst_fd: int, start: int, end: int):
+    position = start
+    while position < end:
+        try:
+            copied = os.copy_file_range(src_fd, dst_fd, end - position, position, position)
+        except (AttributeError, OSError):
+            # Starší kernel nebo nepodporovaný souborový systém
+            chunk = os.pread(src_fd, min(HASH_CHUNK_SIZE, end - position), position)
+            copied = os.pwrite(dst_fd, chunk, position)
+        if copied == 0:
+            break
+        position += copied
+
+
+class HashCache:
+    """Perzistentní cache hashů klíčovaná podle (dev, inode, size, mtime)"""
+
+    def __init__(self, cache_file: Path):
+        self.cache_file = cache_file
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if cache_file.exists():
+            try:
+                with open(cache_file, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring corrupted hash cache {cache_file}: {e}")
+
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}"
+
+    def get(self, st: os.stat_result) -> Optional[str]:
+        """Vrátí hash, pokud se soubor od posledního hashování nezměnil"""
+        entry = self._entries.get(self._key(st))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, st: os.stat_result, digest: str):
+        with self._lock:
+            self._entries[self._key(st)] = [st.st_size, st.st_mtime_ns, digest]
+            self._dirty = True
+
+    def save(self):
+        """Atomicky zapíše cache na disk"""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_file = self.cache_file.with_suffix(".tmp")
+            with open(tmp_file, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_file, self.cache_file)
+            self._dirty = False
+
+
+class ContentStore:
+    """
+    Úložiště blobů adresovaných obsahem (blobs/sha256/ab/abcdef...).
+
+    Stejné soubory z různých šablon jsou deduplikovány pomocí hardlinků
+    na jeden blob, takže sdílejí i položku v cache hashů. Hardlink je
+    bezpečný jen pro soubory, které nikdo nezapisuje (kernel, initrd,
+    read-only obrazy); zapisovatelné obrazy se nededuplikují.
+    """
+
+    def __init__(self, root: str, max_workers: Optional[int] = None):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs" / "sha256"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1))
+        self.hash_cache = HashCache(self.root / "hash_cache.json")
+
+    def blob_path(self, digest: str) -> Path:
+        """Cesta k blobu s daným hashem"""
+        return self.blobs_dir / digest[:2] / digest
+
+    def _hash_cached(self, path: str) -> str:
+        st = os.stat(path)
+        digest = self.hash_cache.get(st)
+        if digest is None:
+            digest = hash_file(path)
+            # Stat znovu - soubor se mohl během hashování změnit
+            if os.stat(path).st_mtime_ns == st.st_mtime_ns:
+                self.hash_cache.put(st, digest)
+        return digest
+
+    def hash_files(self, paths: Iterable[str]) -> Dict[str, str]:
+        """Vrátí hashe souborů; chybějící v cache se spočítají paralelně"""
+        paths = list(paths)
+        if len(paths) <= 1:
+            result = {p: self._hash_cached(p) for p in paths}
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                result = dict(zip(paths, pool.map(self._hash_cached, paths)))
+        self.hash_cache.save()
+        return result
+
+    def ingest(self, paths: Iterable[str], writable: Iterable[str] = ()) -> Dict[str, str]:
+        """
+        Zahashuje soubory a propojí je s bloby v úložišti.
+        Pokud blob se stejným obsahem už existuje, soubor je nahrazen
+        hardlinkem na něj (deduplikace napříč šablonami). Soubory z `writable`
+        (ext4 rootfs připojený k VM pro zápis) se jen hashují a inode s blobem
+        nikdy nesdílí - zápis z VM by poškodil blob i ostatní šablony.
+        """
+        digests = self.hash_files(paths)
+        writable = set(writable)
+        for path, digest in digests.items():
+            blob = self.blob_path(digest)
+            try:
+                # Blob sdílí inode se soubory šablon - pokud byl některý z nich
+                # přepsán na místě, blob už neodpovídá svému hashi
+                if blob.exists() and self._hash_cached(str(blob)) != digest:
+                    blob.unlink()
+                if path in writable:
+                    self._ingest_writable(path, blob)
+                elif not blob.exists():
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    os.link(path, blob)
+                elif not os.path.samefile(path, blob):
+                    tmp_link = f"{path}.dedup"
+                    os.link(blob, tmp_link)
+                    os.replace(tmp_link, path)
+                    logger.info(f"Deduplicated {path} -> {digest[:12]}")
+            except OSError as e:
+                # Jiný souborový systém apod. - deduplikace je jen optimalizace
+                logger.warning(f"Cannot link {path} into content store: {e}")
+        return digests
+
+    def _ingest_writable(self, path: str, blob: Path):
+        """Zapisovatelný soubor musí mít vlastní inode, blob se pro něj nevytváří"""
+        if blob.exists() and os.path.samefile(path, blob):
+            # Hardlink ze starší verze úložiště - soubor dostane vlastní kopii
+            # (reflink sdílí bloky copy-on-write, jinak plná kopie)
+            tmp_copy = f"{path}.dedup"
+            if not reflink(str(blob), tmp_copy):
+                sparse_copy(str(blob), tmp_copy)
+            os.replace(tmp_copy, path)
+            logger.info(f"Unlinked writable {path} from content store")
+
+    def verify(self, path: str, digest: str) -> bool:
+        """Ověří, že soubor odpovídá hashi (díky cache obvykle bez čtení)"""
+        try:
+            matches = self._hash_cached(path) == digest
+        except OSError:
+            return False
+        self.hash_cache.save()
+        return matches
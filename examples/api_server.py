@@ -3,7 +3,9 @@ Advanced example: REST API server pro NovaSandbox
 Umožňuje správu sandboxů přes HTTP API
 """
 import asyncio
+import json
 import logging
+import os
 from typing import Dict, List, Optional
 import sys
 from pathlib import Path
@@ -12,8 +14,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 try:
-    from fastapi import FastAPI, HTTPException, BackgroundTasks
-    from fastapi.responses import JSONResponse
+    from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+    from fastapi.responses import JSONResponse, StreamingResponse
     import uvicorn
 except ImportError:
     print("FastAPI je vyžadován pro tento příklad.")
@@ -21,6 +23,14 @@ except ImportError:
     sys.exit(1)
 
 from core import SandboxConfig, SandboxState, TemplateManager
+from core.state_store import SandboxStateStore
+from core.reconciler import OrphanReconciler
+from core.prefetch import TemplatePrefetcher
+from core.seccomp import SeccompCompiler
+from core.cgroups import CgroupManager, DEFAULT_CGROUP_ROOT
+from core.event_log import EventLog
+from core.event_bus import EventBus, StatsTicker
+from core.registry import SandboxRegistry
 from providers import FirecrackerHypervisor, AppleVZHypervisor
 import platform
 
@@ -37,31 +47,98 @@ app = FastAPI(
 
 # Globální stav
 hypervisor = None
-sandboxes_registry: Dict[str, dict] = {}
-template_manager = TemplateManager("templates")
+reconciler = None
+event_log: Optional[EventLog] = None
+event_bus = EventBus()
+stats_ticker: Optional[StatsTicker] = None
+sandboxes_registry = SandboxRegistry()  # Po startu registr hypervisoru
+template_manager = TemplateManager("templates", watch=True)
 
 
 @app.on_event("startup")
 async def startup_event():
     """Inicializace hypervisoru při startu"""
-    global hypervisor
+    global hypervisor, reconciler, event_log, stats_ticker, sandboxes_registry
     
     system = platform.system()
     logger.info(f"Inicializace na platformě: {system}")
     
     try:
         if system == "Linux":
-            hypervisor = FirecrackerHypervisor()
+            state_store = SandboxStateStore(
+                os.environ.get("NOVASANDBOX_STATE_DB", "novasandbox_state.db")
+            )
+            prefetcher = TemplatePrefetcher(template_manager)
+            # Trvalý log porušení, změn stavu a exec (group commit mimo event loop)
+            event_log = EventLog(os.environ.get("NOVASANDBOX_EVENT_LOG", "novasandbox_events"))
+            
+            # Cgroup v2 pro VMM - kořen může být i delegovaná uživatelská cgroup
+            cgroup_manager = CgroupManager(
+                os.environ.get("NOVASANDBOX_CGROUP_ROOT", DEFAULT_CGROUP_ROOT)
+            )
+            try:
+                cgroup_manager.setup()
+            except OSError as e:
+                logger.warning(f"Cgroups disabled: {e}")
+                cgroup_manager = None
+            
+            hypervisor = FirecrackerHypervisor(
+                state_store=state_store,
+                template_manager=template_manager,
+                prefetcher=prefetcher,
+                seccomp_compiler=SeccompCompiler(
+                    os.environ.get("NOVASANDBOX_SECCOMP_CACHE", ".novasandbox/seccomp")
+                ),
+                # Vlastní filtr VMM; bez něj platí vestavěný filtr Firecrackeru
+                seccomp_filter=os.environ.get("NOVASANDBOX_SECCOMP_FILTER"),
+                cgroup_manager=cgroup_manager,
+                event_log=event_log,
+                event_bus=event_bus,
+                instance_id=os.environ.get("NOVASANDBOX_INSTANCE_ID")
+            )
+            
+            # Zahřátí page cache šablon před prvními booty
+            await asyncio.get_running_loop().run_in_executor(None, prefetcher.warm_top)
+            
+            # Znovu připojení VM běžících před restartem serveru
+            recovered = await hypervisor.reattach()
+            logger.info(f"Obnoveno sandboxů: {recovered['reattached']}")
+            
+            # Úklid osiřelých tempdir, TAP rozhraní a VMM procesů
+            reconciler = OrphanReconciler(hypervisor)
+            reconciler.start()
         elif system == "Darwin":
             hypervisor = AppleVZHypervisor()
+            hypervisor.event_bus = event_bus
         else:
             raise RuntimeError(f"Nepodporovaná platforma: {system}")
         
+        # API sdílí indexovaný registr hypervisoru (stav se v něm udržuje sám)
+        sandboxes_registry = hypervisor.registry
+        
+        # Automatické zastavení sandboxů s vypršelým TTL / idle timeoutem
+        hypervisor.leases.start()
+        
+        # Statistiky se čtou, jen když je někdo odebírá
+        stats_ticker = StatsTicker(hypervisor, event_bus)
+        stats_ticker.start()
+        
         logger.info("Hypervisor inicializován úspěšně")
     except Exception as e:
         logger.error(f"Chyba při inicializaci: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Zastavení publikace statistik a dopsání logu událostí"""
+    if stats_ticker is not None:
+        await stats_ticker.stop()
+    if hypervisor is not None:
+        await hypervisor.leases.stop()
+    if event_log is not None:
+        await asyncio.get_running_loop().run_in_executor(None, event_log.close)
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -78,7 +155,9 @@ async def health():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "sandboxes_count": len(sandboxes_registry)
+        "sandboxes_count": len(sandboxes_registry),
+        "reconciler": reconciler.get_metrics() if reconciler else None,
+        "leases": hypervisor.leases.get_metrics() if hypervisor else None
     }
 
 
@@ -138,24 +217,21 @@ async def create_sandbox(config_data: dict):
             memory_mb=config_data.get("memory_mb", 512),
             vcpus=config_data.get("vcpus", 2),
             enable_network=config_data.get("enable_network", True),
-            labels=config_data.get("labels", {})
+            labels=config_data.get("labels", {}),
+            ttl_s=config_data.get("ttl_s"),
+            idle_timeout_s=config_data.get("idle_timeout_s")
         )
         
         # Vytvoření sandboxu
         sandbox = await hypervisor.create_sandbox(config)
         
-        # Uložení do registru
-        sandboxes_registry[sandbox.sandbox_id] = {
-            "sandbox": sandbox,
-            "created_at": sandbox.created_at
-        }
-        
         logger.info(f"Sandbox vytvořen: {sandbox.sandbox_id}")
         
         return {
             "sandbox_id": sandbox.sandbox_id,
             "state": sandbox.state.value,
             "boot_time_ms": sandbox.metadata.get("boot_time_ms"),
+            "lease_remaining_s": sandbox.lease_remaining_s(),
             "config": {
                 "memory_mb": sandbox.config.memory_mb,
                 "vcpus": sandbox.config.vcpus,
@@ -171,22 +247,35 @@ async def create_sandbox(config_data: dict):
 
 
 @app.get("/sandboxes")
-async def list_sandboxes():
-    """Výpis všech sandboxů"""
+async def list_sandboxes(selector: Optional[str] = None, state: Optional[str] = None,
+                         template_id: Optional[str] = None):
+    """
+    Výpis sandboxů, volitelně podle label selektoru (`team=ml,env in (dev,test)`),
+    stavu a šablony - vybírá se přes indexy registru
+    """
+    try:
+        sandbox_state = SandboxState(state) if state else None
+        if selector or sandbox_state or template_id:
+            sandboxes = sandboxes_registry.select(selector, sandbox_state, template_id)
+        else:
+            sandboxes = sandboxes_registry.snapshot()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
         "sandboxes": [
             {
-                "sandbox_id": sid,
-                "state": data["sandbox"].state.value,
-                "created_at": data["created_at"],
+                "sandbox_id": sandbox.sandbox_id,
+                "state": sandbox.state.value,
+                "created_at": sandbox.created_at,
+                "lease_remaining_s": sandbox.lease_remaining_s(),
                 "config": {
-                    "memory_mb": data["sandbox"].config.memory_mb,
-                    "vcpus": data["sandbox"].config.vcpus
+                    "memory_mb": sandbox.config.memory_mb,
+                    "vcpus": sandbox.config.vcpus
                 }
             }
-            for sid, data in sandboxes_registry.items()
+            for sandbox in sandboxes
         ],
-        "count": len(sandboxes_registry)
+        "count": len(sandboxes)
     }
 
 
@@ -196,8 +285,7 @@ async def get_sandbox(sandbox_id: str):
     if sandbox_id not in sandboxes_registry:
         raise HTTPException(status_code=404, detail="Sandbox not found")
     
-    data = sandboxes_registry[sandbox_id]
-    sandbox = data["sandbox"]
+    sandbox = sandboxes_registry[sandbox_id]
     
     return {
         "sandbox_id": sandbox.sandbox_id,
@@ -209,17 +297,28 @@ async def get_sandbox(sandbox_id: str):
             "template_id": sandbox.config.template_id,
             "labels": sandbox.config.labels
         },
-        "created_at": sandbox.created_at
+        "created_at": sandbox.created_at,
+        "lease": hypervisor.leases.get_lease(sandbox_id)
     }
 
 
+@app.post("/sandboxes/{sandbox_id}/renew")
+async def renew_sandbox(sandbox_id: str, ttl_s: Optional[float] = None):
+    """Prodloužení leasu sandboxu (TTL od teď, odsune i idle timeout)"""
+    if sandbox_id not in sandboxes_registry:
+        raise HTTPException(status_code=404, detail="Sandbox not found")
+    
+    remaining = sandboxes_registry[sandbox_id].renew(ttl_s)
+    return {"sandbox_id": sandbox_id, "lease_remaining_s": remaining}
+
+
 @app.get("/sandboxes/{sandbox_id}/stats")
 async def get_sandbox_stats(sandbox_id: str):
     """Statistiky sandboxu"""
     if sandbox_id not in sandboxes_registry:
         raise HTTPException(status_code=404, detail="Sandbox not found")
     
-    sandbox = sandboxes_registry[sandbox_id]["sandbox"]
+    sandbox = sandboxes_registry[sandbox_id]
     stats = await sandbox.get_stats()
     
     return {
@@ -229,13 +328,66 @@ async def get_sandbox_stats(sandbox_id: str):
     }
 
 
+@app.get("/sandboxes/{sandbox_id}/events")
+async def get_sandbox_events(sandbox_id: str, since: Optional[float] = None,
+                             until: Optional[float] = None, limit: int = 1000):
+    """Události sandboxu z trvalého logu (i pro již smazané sandboxy)"""
+    if event_log is None:
+        raise HTTPException(status_code=404, detail="Event log not enabled")
+    
+    def read_events():
+        events = []
+        for event in event_log.reader().read(sandbox_id=sandbox_id, since=since, until=until):
+            events.append(event.__dict__)
+            if len(events) >= limit:
+                break
+        return events
+    
+    events = await asyncio.get_running_loop().run_in_executor(None, read_events)
+    return {"sandbox_id": sandbox_id, "events": events}
+
+
+@app.get("/events/stream")
+async def stream_events(topics: Optional[str] = None, sandbox_id: Optional[str] = None,
+                        label: Optional[List[str]] = Query(None), maxsize: int = 1024):
+    """
+    Živé události jako Server-Sent Events. Filtry: `topics` (čárkami
+    oddělený seznam state,boot,violation,stats), `sandbox_id` a opakovaný
+    `label=klic=hodnota`. Pomalý klient ztrácí nejstarší události.
+    """
+    try:
+        labels = dict(item.split("=", 1) for item in label or [])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="label must be key=value")
+    subscription = event_bus.subscribe(
+        topics=topics.split(",") if topics else None,
+        sandbox_id=sandbox_id,
+        labels=labels or None,
+        maxsize=maxsize
+    )
+    
+    async def stream():
+        with subscription:
+            async for event in subscription:
+                payload = {
+                    "sandbox_id": event.sandbox_id,
+                    "timestamp": event.timestamp,
+                    "labels": dict(event.labels),
+                    "data": event.data,
+                    "dropped": subscription.dropped
+                }
+                yield f"event: {event.topic}\ndata: {json.dumps(payload, default=str)}\n\n"
+    
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
 @app.post("/sandboxes/{sandbox_id}/pause")
 async def pause_sandbox(sandbox_id: str):
     """Pozastavení sandboxu"""
     if sandbox_id not in sandboxes_registry:
         raise HTTPException(status_code=404, detail="Sandbox not found")
     
-    sandbox = sandboxes_registry[sandbox_id]["sandbox"]
+    sandbox = sandboxes_registry[sandbox_id]
     success = await sandbox.pause()
     
     if not success:
@@ -250,7 +402,7 @@ async def resume_sandbox(sandbox_id: str):
     if sandbox_id not in sandboxes_registry:
         raise HTTPException(status_code=404, detail="Sandbox not found")
     
-    sandbox = sandboxes_registry[sandbox_id]["sandbox"]
+    sandbox = sandboxes_registry[sandbox_id]
     success = await sandbox.resume()
     
     if not success:
@@ -259,21 +411,40 @@ async def resume_sandbox(sandbox_id: str):
     return {"sandbox_id": sandbox_id, "state": "running"}
 
 
+@app.post("/sandboxes/{sandbox_id}/reset")
+async def reset_sandbox(sandbox_id: str):
+    """Vrácení sandboxu do čistého stavu šablony pro další úlohu"""
+    if sandbox_id not in sandboxes_registry:
+        raise HTTPException(status_code=404, detail="Sandbox not found")
+    
+    sandbox = sandboxes_registry[sandbox_id]
+    try:
+        success = await sandbox.reset()
+    except (NotImplementedError, RuntimeError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to reset sandbox")
+    
+    return {
+        "sandbox_id": sandbox_id,
+        "state": sandbox.state.value,
+        "snapshot_key": sandbox.metadata.get("snapshot_key")
+    }
+
+
 @app.post("/sandboxes/{sandbox_id}/stop")
 async def stop_sandbox(sandbox_id: str, force: bool = False):
     """Zastavení sandboxu"""
     if sandbox_id not in sandboxes_registry:
         raise HTTPException(status_code=404, detail="Sandbox not found")
     
-    sandbox = sandboxes_registry[sandbox_id]["sandbox"]
+    sandbox = sandboxes_registry[sandbox_id]
     success = await sandbox.stop(force=force)
     
     if not success:
         raise HTTPException(status_code=500, detail="Failed to stop sandbox")
     
-    # Odebrání z registru
-    del sandboxes_registry[sandbox_id]
-    
     logger.info(f"Sandbox zastaven: {sandbox_id}")
     
     return {"sandbox_id": sandbox_id, "state": "stopped"}
@@ -285,12 +456,10 @@ async def delete_sandbox(sandbox_id: str):
     if sandbox_id not in sandboxes_registry:
         raise HTTPException(status_code=404, detail="Sandbox not found")
     
-    sandbox = sandboxes_registry[sandbox_id]["sandbox"]
-    
-    if sandbox.is_running():
-        await sandbox.stop(force=True)
-    
-    del sandboxes_registry[sandbox_id]
+    # Zastavení i ve stavu PAUSED/ERROR - hypervisor uvolní VMM, TAP, cgroup,
+    # lease i záznam stavu a sám sandbox odebere z registru
+    if not await hypervisor.stop_sandbox(sandbox_id, force=True):
+        raise HTTPException(status_code=500, detail="Failed to delete sandbox")
     
     logger.info(f"Sandbox smazán: {sandbox_id}")
     
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark bootu šablony napříč boot profily.
+Pro každý profil nabootuje sandboxy naslepo (bez golden snapshotu) a měří
+čas do odpovědi agenta v guestu. Vyžaduje Linux s KVM a Firecracker.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+# Přidání root adresáře do path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core import SandboxConfig, TemplateManager
+from providers import FirecrackerHypervisor
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+async def boot_once(hypervisor: FirecrackerHypervisor, config: SandboxConfig) -> Dict[str, float]:
+    """Nabootuje jeden sandbox a vrátí časy v ms"""
+    start = time.perf_counter()
+    # Studený boot - golden snapshot by měření profilů znehodnotil
+    sandbox = await hypervisor._create_sandbox(config, use_snapshot=False)
+    try:
+        vmm_ready = (time.perf_counter() - start) * 1000
+        sock_dir = os.path.dirname(sandbox.metadata["api_socket"])
+        await hypervisor._wait_for_agent(sock_dir, config.boot_timeout_ms / 1000)
+        agent_ready = (time.perf_counter() - start) * 1000
+    finally:
+        await hypervisor.stop_sandbox(sandbox.sandbox_id, force=True)
+    return {"vmm_ms": vmm_ready, "agent_ms": agent_ready}
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(args):
+    template_manager = TemplateManager(args.templates_dir)
+    template = template_manager.get_template(args.template)
+    if template is None:
+        print(f"❌ Šablona {args.template} nenalezena v {args.templates_dir}")
+        return 1
+
+    profiles = args.profiles or sorted(template.boot_profiles) or [None]
+    hypervisor = FirecrackerHypervisor(template_manager=template_manager)
+
+    print(f"\n🚀 Boot benchmark: {template.template_id} ({args.iterations} iterací)")
+    print(f"   initrd: {template.initrd_path or '-'}")
+    print(f"\n{'Profil':15} {'VMM p50':>10} {'Agent p50':>10} {'Agent p95':>10} {'Agent max':>10}")
+    print("-" * 60)
+
+    for profile in profiles:
+        config = SandboxConfig(
+            template_id=template.template_id,
+            memory_mb=template.memory_mb,
+            vcpus=template.vcpus,
+            boot_profile=profile,
+        )
+        results = []
+        for _ in range(args.iterations):
+            try:
+                results.append(await boot_once(hypervisor, config))
+            except Exception as e:
+                logger.error(f"Boot with profile {profile} failed: {e}")
+                break
+        if not results:
+            print(f"{profile or 'default':15} {'selhal':>10}")
+            continue
+
+        vmm = [r["vmm_ms"] for r in results]
+        agent = [r["agent_ms"] for r in results]
+        print(f"{profile or 'default':15} "
+              f"{statistics.median(vmm):>8.1f}ms "
+              f"{statistics.median(agent):>8.1f}ms "
+              f"{_percentile(agent, 0.95):>8.1f}ms "
+              f"{max(agent):>8.1f}ms")
+
+    print()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Boot benchmark across template boot profiles")
+    parser.add_argument("--template", default="alpine-python")
+    parser.add_argument("--templates-dir", default="templates")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--profile", dest="profiles", action="append",
+                        help="profil k měření (opakovatelně); výchozí jsou všechny")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
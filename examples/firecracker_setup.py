@@ -47,6 +47,30 @@ sudo umount mnt
 rmdir mnt
 ```
 
+### Alternativa: rootless sestavení s cache vrstev
+
+Bez sudo, mount a chroot - rootfs se skládá z vrstev (tarball + balíčky)
+pomocí `mke2fs -d`. Vrstvy jsou cachovány podle hashe obsahu, takže změna
+seznamu balíčků sestaví znovu jen horní vrstvu.
+
+```bash
+python -c "
+import asyncio, json
+from core.template_manager import TemplateManager
+from core.template_builder import TemplateBuilder, TemplateBuildSpec
+
+tm = TemplateManager('templates')
+config = json.load(open('templates/alpine-python.json'))
+spec = TemplateBuildSpec.from_config(
+    'alpine-python', config,
+    kernel_path='vmlinux-5.10.217',
+    base_tarball='alpine-minirootfs-3.18.0-x86_64.tar.gz'
+)
+spec.repositories = ['https://dl-cdn.alpinelinux.org/alpine/v3.18/main']
+asyncio.run(TemplateBuilder(tm, apk_path='apk.static').build(spec))
+"
+```
+
 ## 3. Bootování Firecracker kernelu
 
 ```bash
@@ -102,8 +126,12 @@ python examples/basic_usage.py
 ## Optimalizace pro rychlejší boot
 
 1. **Kernel** - minimální kernely s vypnutými nepotřebnými moduly
-2. **Initrd** - místo init=/sbin/init použít init=/sbin/busybox
-3. **Filesystem** - ext4 bez journalu
+2. **Init** - boot profil `agent` spouští místo init=/sbin/init jen agenta
+   (/sbin/novasandbox-init); volitelný initrd se deklaruje v sekci `boot`
+   šablony, profily se porovnají pomocí `python examples/boot_benchmark.py`
+3. **Filesystem** - ext4 bez journalu, nebo `"rootfs": {"format": "erofs"}`:
+   komprimovaný read-only základ sdílený v page cache všemi VM a malý
+   zapisovatelný overlay disk pro každý sandbox (`overlay_size_mb`)
 4. **CPU** - ht_enabled=False v machine-config
 5. **Tahy k síťi** - vynechat pokud není potřeba
 
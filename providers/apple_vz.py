@@ -153,6 +153,7 @@ class AppleVZHypervisor(BaseHypervisor):
             )
             
             self._sandboxes[sandbox_id] = sandbox
+            self.leases.track(sandbox)
             return sandbox
             
         except Exception as e:
@@ -171,6 +172,7 @@ class AppleVZHypervisor(BaseHypervisor):
             return False
         
         sandbox = self._sandboxes[sandbox_id]
+        self.leases.release(sandbox_id)
         vm = sandbox.metadata.get("vm")
         
         if vm:
@@ -5,28 +5,76 @@ Dosažení startu pod 150 ms.
 import asyncio
 import json
 import os
+import signal
+import shutil
 import tempfile
 import time
 import uuid
 import socket
+import hashlib
+from contextlib import nullcontext, suppress
 from pathlib import Path
 from typing import Dict, Any, Optional
 import aiofiles
 import aiofiles.os
-from ..core.hypervisor import BaseHypervisor, SandboxConfig, SandboxState
+from ..core.hypervisor import BaseHypervisor, SandboxConfig, SandboxState, DEFAULT_KERNEL_ARGS
+from ..core.state_store import SandboxStateStore, SandboxRecord
+from ..core.template_manager import TemplateManager
+from ..core.template_store import sparse_copy
+from ..core.prefetch import TemplatePrefetcher
+from ..core.seccomp import SeccompCompiler
+from ..core.cgroups import CgroupManager, block_device_of, limits_from_policy
+from ..core.event_log import EventLog
+from ..core.event_bus import EventBus
+from ..core.reconciler import tap_alias
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Agent v guestu naslouchá na vsock portu; UDS je relativní k adresáři sandboxu
+AGENT_VSOCK_PORT = 52
+GUEST_CID = 3
+VSOCK_UDS_NAME = "vsock.sock"
+# Overlay disk sandboxu - relativní cesta, stejně jako vsock
+OVERLAY_IMAGE_NAME = "overlay.ext4"
+OVERLAY_GUEST_DEVICE = "/dev/vdb"
+
 class FirecrackerHypervisor(BaseHypervisor):
     """Firecracker implementace pro ultra-rychlé microVM"""
     
     def __init__(self, firecracker_path: str = "/usr/bin/firecracker",
-                 jailer_path: Optional[str] = None):
+                 jailer_path: Optional[str] = None,
+                 state_store: Optional[SandboxStateStore] = None,
+                 template_manager: Optional[TemplateManager] = None,
+                 prefetcher: Optional[TemplatePrefetcher] = None,
+                 seccomp_compiler: Optional[SeccompCompiler] = None,
+                 seccomp_filter: Optional[str] = None,
+                 cgroup_manager: Optional[CgroupManager] = None,
+                 event_log: Optional[EventLog] = None,
+                 event_bus: Optional[EventBus] = None,
+                 instance_id: Optional[str] = None):
         super().__init__(firecracker_path)
+        self.event_bus = event_bus
         self.jailer_path = jailer_path
+        self.state_store = state_store
+        self.template_manager = template_manager
+        self.prefetcher = prefetcher
+        self.seccomp_compiler = seccomp_compiler
+        self.seccomp_filter = seccomp_filter
+        self.cgroup_manager = cgroup_manager
+        self.event_log = event_log
         self._api_sockets: Dict[str, str] = {}
         self._tap_interfaces: Dict[str, str] = {}
+        # Identita instance pro označení TAP rozhraní; odvozená z cesty stavové
+        # databáze přežije restart, takže reattach i reconciler poznají svá TAP
+        if instance_id is None:
+            if state_store is not None:
+                db_path = str(Path(state_store.db_path).resolve())
+                instance_id = hashlib.sha256(db_path.encode()).hexdigest()[:12]
+            else:
+                instance_id = uuid.uuid4().hex[:12]
+        self.instance_id = instance_id
+        self.tap_alias = tap_alias(instance_id)
         
         # Optimalizované výchozí parametry pro rychlý start
         self._default_kernel_args = (
@@ -41,11 +89,14 @@ class FirecrackerHypervisor(BaseHypervisor):
     
     async def _create_tap_interface(self, sandbox_id: str) -> str:
         """Vytvoří TAP interface pro síťovou izolaci"""
-        tap_name = f"tap_{sandbox_id[:8]}"
+        # Název rozhraní je omezen na 15 znaků (IFNAMSIZ)
+        tap_name = f"tap_{sandbox_id[-11:]}"
+        self._tap_interfaces[sandbox_id] = tap_name
         
         # Vytvoření TAP interface
         commands = [
             ["sudo", "ip", "tuntap", "add", tap_name, "mode", "tap"],
+            ["sudo", "ip", "link", "set", "dev", tap_name, "alias", self.tap_alias],
             ["sudo", "ip", "link", "set", tap_name, "up"],
             ["sudo", "ip", "link", "set", "dev", tap_name, "mtu", "1500"],
         ]
@@ -58,26 +109,36 @@ class FirecrackerHypervisor(BaseHypervisor):
             )
             await process.wait()
         
-        self._tap_interfaces[sandbox_id] = tap_name
         return tap_name
     
     async def _prepare_vm_config(self, config: SandboxConfig, 
                                 kernel_path: str, 
-                                rootfs_path: str) -> Dict[str, Any]:
+                                rootfs_path: str,
+                                sandbox_id: str) -> Dict[str, Any]:
         """Připraví optimalizovanou konfiguraci pro Firecracker"""
         
+        boot_args, initrd_path = self._resolve_boot_source(config)
+        template = self._get_template(config.template_id)
+        read_only_rootfs = template is not None and template.read_only_rootfs
+        overlay = template is not None and template.overlay_size_mb > 0
+        if read_only_rootfs:
+            boot_args += f" rootfstype={template.rootfs_format}"
+        if overlay:
+            # Init v guestu složí overlayfs z read-only základu a tohoto disku
+            boot_args += f" novasandbox.overlay={OVERLAY_GUEST_DEVICE}"
+        
         vm_config = {
             "boot-source": {
                 "kernel_image_path": kernel_path,
-                "boot_args": config.kernel_args or self._default_kernel_args,
-                "initrd_path": None
+                "boot_args": boot_args,
+                "initrd_path": initrd_path
             },
             "drives": [
                 {
                     "drive_id": "rootfs",
                     "path_on_host": rootfs_path,
                     "is_root_device": True,
-                    "is_read_only": False,
+                    "is_read_only": read_only_rootfs,
                     "rate_limiter": {
                         "bandwidth": {"size": 0, "refill_time": 0},
                         "ops": {"size": 0, "refill_time": 0}
@@ -95,12 +156,17 @@ class FirecrackerHypervisor(BaseHypervisor):
                     "avx2": False,  # Vypnuto pro rychlejší inicializaci
                     "avx512": False
                 }
+            },
+            # Kanál k agentovi v guestu (relativní cesta - viz _spawn_vmm)
+            "vsock": {
+                "guest_cid": GUEST_CID,
+                "uds_path": VSOCK_UDS_NAME
             }
         }
         
         # Přidání síťového interface pokud je povoleno
         if config.enable_network:
-            tap_name = await self._create_tap_interface(str(uuid.uuid4()))
+            tap_name = await self._create_tap_interface(sandbox_id)
             vm_config["network-interfaces"] = [{
                 "iface_id": "eth0",
                 "host_dev_name": tap_name,
@@ -115,6 +181,14 @@ class FirecrackerHypervisor(BaseHypervisor):
                 }
             }]
         
+        if overlay:
+            vm_config["drives"].append({
+                "drive_id": "overlay",
+                "path_on_host": OVERLAY_IMAGE_NAME,
+                "is_root_device": False,
+                "is_read_only": False
+            })
+        
         # Přidání extra disků
         for i, drive in enumerate(config.extra_drives):
             vm_config["drives"].append({
@@ -126,82 +200,193 @@ class FirecrackerHypervisor(BaseHypervisor):
         
         return vm_config
     
-    async def create_sandbox(self, config: SandboxConfig) -> 'Sandbox':
-        """Vytvoří a spustí microVM pomocí Firecracker"""
-        from ..core.sandbox import Sandbox
-        
-        sandbox_id = f"fc_{uuid.uuid4().hex[:12]}"
-        start_time = time.time()
-        
-        # Vytvoření unix socket pro API komunikaci
-        sock_dir = tempfile.mkdtemp(prefix="fc_")
-        api_socket = os.path.join(sock_dir, "api.socket")
-        self._api_sockets[sandbox_id] = api_socket
+    def _resolve_boot_source(self, config: SandboxConfig):
+        """
+        Vrátí kernel args a initrd. Explicitně zvolený boot profil přebíjí
+        config.kernel_args; výchozí profil šablony se použije, jen pokud
+        kernel_args zůstaly výchozí.
+        """
+        template = self._get_template(config.template_id)
+        if template is None:
+            if config.boot_profile is not None:
+                raise ValueError(
+                    f"Boot profile '{config.boot_profile}' requires a template manager"
+                )
+            return config.kernel_args or self._default_kernel_args, None
+        
+        if config.boot_profile is None and config.kernel_args != DEFAULT_KERNEL_ARGS:
+            return config.kernel_args, template.initrd_path
+        boot_args = template.boot_args(config.boot_profile)
+        return (boot_args or config.kernel_args or self._default_kernel_args,
+                template.initrd_path)
+    
+    def _get_template(self, template_id: str):
+        if self.template_manager is None:
+            return None
+        return self.template_manager.get_template(template_id)
+    
+    async def _prepare_overlay(self, template_id: str, sock_dir: str, snapshot=None):
+        """
+        Vytvoří zapisovatelný overlay disk sandboxu jako řídkou kopii
+        prázdného obrazu (nebo stavu overlay ze snapshotu).
+        """
+        template = self._get_template(template_id)
+        if template is None or template.overlay_size_mb <= 0:
+            return
+        if snapshot is not None and snapshot.overlay_path:
+            source = snapshot.overlay_path
+        else:
+            source = await self.template_manager.ensure_overlay_image(template.overlay_size_mb)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, sparse_copy, source, os.path.join(sock_dir, OVERLAY_IMAGE_NAME)
+        )
+    
+    def _resolve_template_files(self, template_id: str):
+        """Vrátí cesty ke kernelu a rootfs šablony"""
+        if self.template_manager is not None:
+            # Validace přes cache TemplateManageru - bez stat volání na horké cestě
+            template = self.template_manager.get_template(template_id)
+            if (template is not None
+                    and "vmlinux" in template.file_paths
+                    and template.rootfs_image in template.file_paths
+                    and self.template_manager.validate_template(template_id)):
+                return (template.file_paths["vmlinux"],
+                        template.file_paths[template.rootfs_image])
+            raise FileNotFoundError(
+                f"Template {template_id} not found or missing vmlinux/rootfs image"
+            )
         
         # Cesty k předpřipraveným šablonám
-        template_dir = Path("templates") / config.template_id
+        template_dir = Path("templates") / template_id
         kernel_path = template_dir / "vmlinux"
         rootfs_path = template_dir / "rootfs.ext4"
         
         if not kernel_path.exists() or not rootfs_path.exists():
             raise FileNotFoundError(
-                f"Template {config.template_id} not found. "
+                f"Template {template_id} not found. "
                 f"Expected {kernel_path} and {rootfs_path}"
             )
+        return str(kernel_path), str(rootfs_path)
+    
+    async def create_sandbox(self, config: SandboxConfig) -> 'Sandbox':
+        """Vytvoří a spustí microVM pomocí Firecracker"""
+        return await self._create_sandbox(config, use_snapshot=True)
+    
+    def _snapshot_eligible(self, config: SandboxConfig) -> bool:
+        """Restore ze snapshotu jen pro konfiguraci, se kterou byl snapshot pořízen"""
+        if self.template_manager is None or not config.enable_network or config.extra_drives:
+            return False
+        template = self.template_manager.get_template(config.template_id)
+        return (template is not None and template.snapshot_capable
+                and config.boot_profile in (None, template.default_boot_profile)
+                and (config.boot_profile is not None or config.kernel_args == DEFAULT_KERNEL_ARGS)
+                and config.memory_mb == template.memory_mb
+                and config.vcpus == template.vcpus)
+    
+    async def _create_sandbox(self, config: SandboxConfig, use_snapshot: bool) -> 'Sandbox':
+        from ..core.sandbox import Sandbox
         
-        # Příprava konfigurace
-        vm_config = await self._prepare_vm_config(
-            config, str(kernel_path), str(rootfs_path)
-        )
-        
-        # Zápis konfigurace do dočasného souboru
-        config_file = Path(sock_dir) / "config.json"
-        async with aiofiles.open(config_file, 'w') as f:
-            await f.write(json.dumps(vm_config, indent=2))
-        
-        # Spuštění Firecracker procesu
-        cmd = [
-            self.hypervisor_path,
-            "--api-sock", api_socket,
-            "--config-file", str(config_file),
-            "--no-api",  # Rychlejší start bez HTTP API
-            "--seccomp-level", "0"  # Pro maximální výkon (pouze v důvěryhodném prostředí)
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Okamžitě spustíme VM (bez čekání na API)
-        boot_cmd = [
-            "curl", "-X", "PUT",
-            "--unix-socket", api_socket,
-            "http://localhost/actions",
-            "-H", "Accept: application/json",
-            "-H", "Content-Type: application/json",
-            "-d", '{"action_type": "InstanceStart"}'
-        ]
+        sandbox_id = f"fc_{uuid.uuid4().hex[:12]}"
+        start_time = time.time()
         
-        # Spuštění VM
-        boot_process = await asyncio.create_subprocess_exec(
-            *boot_cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        # Rostoucí poptávka po šabloně předpovídá burst - zahřát page cache
+        if self.prefetcher is not None and self.prefetcher.record_use(config.template_id):
+            asyncio.get_running_loop().create_task(
+                self.prefetcher.warm_async(config.template_id)
+            )
         
-        stdout, stderr = await boot_process.communicate()
+        snapshot = None
+        if use_snapshot and self._snapshot_eligible(config):
+            # První použití šablony snapshot vytvoří, další ho jen načtou
+            snapshot = await self.template_manager.ensure_golden_snapshot(
+                config.template_id, self
+            )
         
-        if boot_process.returncode != 0:
-            logger.error(f"Failed to start VM: {stderr.decode()}")
+        # Vytvoření unix socket pro API komunikaci
+        sock_dir = tempfile.mkdtemp(prefix="fc_")
+        api_socket = os.path.join(sock_dir, "api.socket")
+        self._api_sockets[sandbox_id] = api_socket
+        config_file = None
+        
+        process = None
+        try:
+            kernel_path, rootfs_path = self._resolve_template_files(config.template_id)
+            await self._prepare_overlay(config.template_id, sock_dir, snapshot)
+            self._create_cgroup(sandbox_id, config, rootfs_path)
+            
+            if snapshot is not None:
+                tap_name = await self._create_tap_interface(sandbox_id)
+                process = await self._spawn_vmm(
+                    ["--api-sock", api_socket, *self._seccomp_args(config)], sock_dir,
+                    sandbox_id
+                )
+                self._publish_boot(sandbox_id, config, "vmm_spawned", start_time)
+                await self._load_snapshot(api_socket, snapshot, tap_name)
+                self._publish_boot(sandbox_id, config, "snapshot_loaded", start_time)
+            else:
+                # Příprava konfigurace
+                vm_config = await self._prepare_vm_config(
+                    config, kernel_path, rootfs_path, sandbox_id
+                )
+                
+                # Zápis konfigurace do dočasného souboru
+                config_file = Path(sock_dir) / "config.json"
+                async with aiofiles.open(config_file, 'w') as f:
+                    await f.write(json.dumps(vm_config, indent=2))
+                
+                # Spuštění Firecracker procesu
+                process = await self._spawn_vmm([
+                    "--api-sock", api_socket,
+                    "--config-file", str(config_file),
+                    *self._seccomp_args(config)
+                ], sock_dir, sandbox_id)
+                self._publish_boot(sandbox_id, config, "vmm_spawned", start_time)
+                
+                # Okamžitě spustíme VM (bez čekání na API)
+                boot_cmd = [
+                    "curl", "-X", "PUT",
+                    "--unix-socket", api_socket,
+                    "http://localhost/actions",
+                    "-H", "Accept: application/json",
+                    "-H", "Content-Type: application/json",
+                    "-d", '{"action_type": "InstanceStart"}'
+                ]
+                
+                # Spuštění VM
+                boot_process = await asyncio.create_subprocess_exec(
+                    *boot_cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                
+                stdout, stderr = await boot_process.communicate()
+                
+                if boot_process.returncode != 0:
+                    logger.error(f"Failed to start VM: {stderr.decode()}")
+                    raise RuntimeError(f"Failed to start sandbox: {stderr.decode()}")
+                self._publish_boot(sandbox_id, config, "instance_started", start_time)
+        except BaseException:
+            # Jakékoliv selhání po mkdtemp nesmí nechat na hostiteli
+            # adresář, TAP ani běžící VMM
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
             await self._cleanup_resources(sandbox_id)
-            raise RuntimeError(f"Failed to start sandbox: {stderr.decode()}")
+            self._record_event("state", sandbox_id, {"state": SandboxState.ERROR.value})
+            self._publish_boot(sandbox_id, config, "failed", start_time)
+            raise
         
         boot_time = (time.time() - start_time) * 1000  # v ms
         
         logger.info(f"Firecracker sandbox {sandbox_id} started in {boot_time:.2f}ms")
         
+        metadata = {
+            "boot_time_ms": boot_time,
+            "config_file": str(config_file) if config_file else None,
+            "snapshot_key": snapshot.key if snapshot else None
+        }
+        
         # Vytvoření Sandbox objektu
         sandbox = Sandbox(
             sandbox_id=sandbox_id,
@@ -209,16 +394,319 @@ class FirecrackerHypervisor(BaseHypervisor):
             hypervisor=self,
             state=SandboxState.RUNNING,
             process=process,
-            metadata={
-                "boot_time_ms": boot_time,
-                "api_socket": api_socket,
-                "config_file": str(config_file)
-            }
+            metadata={**metadata, "api_socket": api_socket}
         )
         
         self._sandboxes[sandbox_id] = sandbox
+        self.leases.track(sandbox)
+        self._record_event("state", sandbox_id, {
+            "state": SandboxState.RUNNING.value,
+            "template_id": config.template_id,
+            "boot_time_ms": boot_time,
+            "snapshot_key": metadata["snapshot_key"]
+        })
+        
+        if self.state_store is not None:
+            self.state_store.put(SandboxRecord(
+                sandbox_id=sandbox_id,
+                pid=process.pid,
+                api_socket=api_socket,
+                tap_name=self._tap_interfaces.get(sandbox_id),
+                config=config.to_dict(),
+                state=sandbox.state.value,
+                created_at=sandbox.created_at,
+                metadata=metadata
+            ))
+        
         return sandbox
     
+    def _record_event(self, event_type: str, sandbox_id: str, data: Dict[str, Any]):
+        """Zařadí událost do trvalého logu (neblokuje)"""
+        if self.event_log is not None:
+            self.event_log.append(event_type, sandbox_id, data)
+    
+    def _publish_boot(self, sandbox_id: str, config: SandboxConfig, phase: str,
+                      start_time: float):
+        """Publikuje fázi bootu s časem od začátku vytváření"""
+        if self.event_bus is not None:
+            self.event_bus.publish("boot", sandbox_id, {
+                "phase": phase,
+                "elapsed_ms": (time.time() - start_time) * 1000
+            }, config.labels)
+    
+    def _seccomp_args(self, config: SandboxConfig) -> list:
+        """
+        Seccomp VMM podle politiky sandboxu. Standardně vestavěný filtr
+        Firecrackeru (včetně filtrů argumentů); vlastní filtr `seccomp_filter`
+        ho nahradí celý, zkompilovaný a cachovaný na disku.
+        """
+        policy = config.get_security_policy()
+        if not policy.enable_seccomp:
+            return ["--no-seccomp"]
+        if self.seccomp_compiler is None or self.seccomp_filter is None:
+            return []
+        return ["--seccomp-filter", self.seccomp_compiler.compile_file(self.seccomp_filter)]
+    
+    def _create_cgroup(self, sandbox_id: str, config: SandboxConfig, rootfs_path: str):
+        """Cgroup VMM s limity z politiky (io.max na zařízení s rootfs)"""
+        if self.cgroup_manager is None:
+            return
+        policy = config.get_security_policy()
+        if not policy.enable_cgroups:
+            return
+        limits = limits_from_policy(policy, config, block_device_of(rootfs_path))
+        self.cgroup_manager.create(sandbox_id, limits)
+    
+    async def _spawn_vmm(self, args: list, sock_dir: str,
+                         sandbox_id: Optional[str] = None) -> asyncio.subprocess.Process:
+        """
+        Spustí Firecracker proces. Pracovní adresář je adresář sandboxu, takže
+        relativní cesty (vsock) ze sdíleného snapshotu míří do vlastního adresáře.
+        Má-li sandbox cgroup, proces do ní vstoupí ještě před exec.
+        """
+        cgroup = nullcontext()
+        if self.cgroup_manager is not None and sandbox_id in self.cgroup_manager:
+            cgroup = self.cgroup_manager.spawn_into(sandbox_id)
+        with cgroup as preexec_fn:
+            return await asyncio.create_subprocess_exec(
+                self.hypervisor_path, *args,
+                cwd=sock_dir,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                preexec_fn=preexec_fn
+            )
+    
+    async def _api_request(self, api_socket: str, method: str, path: str,
+                           body: Optional[Dict[str, Any]] = None) -> str:
+        """Zavolá Firecracker API přes unix socket"""
+        cmd = [
+            "curl", "-s", "--fail-with-body", "-X", method,
+            "--unix-socket", api_socket,
+            f"http://localhost{path}",
+            "-H", "Accept: application/json",
+            "-H", "Content-Type: application/json",
+        ]
+        if body is not None:
+            cmd += ["-d", json.dumps(body)]
+        
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"Firecracker API {method} {path} failed: "
+                f"{stdout.decode() or stderr.decode()}"
+            )
+        return stdout.decode()
+    
+    @staticmethod
+    async def _wait_for_path(path: str, timeout_s: float = 2.0):
+        """Počká, až VMM vytvoří svůj socket"""
+        deadline = time.time() + timeout_s
+        while not os.path.exists(path):
+            if time.time() > deadline:
+                raise TimeoutError(f"{path} did not appear within {timeout_s}s")
+            await asyncio.sleep(0.001)
+    
+    async def _load_snapshot(self, api_socket: str, snapshot, tap_name: str):
+        """Načte golden snapshot do čerstvého VMM a rovnou ho spustí"""
+        await self._wait_for_path(api_socket)
+        await self._api_request(api_socket, "PUT", "/snapshot/load", {
+            "snapshot_path": snapshot.snapshot_path,
+            # Paměť je mapována MAP_PRIVATE - všechny sandboxy sdílí page cache
+            "mem_backend": {
+                "backend_type": "File",
+                "backend_path": snapshot.mem_file_path
+            },
+            "network_overrides": [{"iface_id": "eth0", "host_dev_name": tap_name}],
+            "resume_vm": True
+        })
+    
+    async def _agent_request(self, sock_dir: str, payload: Dict[str, Any],
+                             timeout_s: float = 30.0,
+                             sandbox_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Pošle požadavek agentovi v guestu přes vsock. Protokol: host se připojí
+        k UDS vsock zařízení, pošle `CONNECT <port>`, pak jeden JSON řádek
+        a přečte jeden JSON řádek s odpovědí. Exec požadavky se zapisují
+        do logu událostí a jako aktivita pro idle timeout.
+        """
+        if sandbox_id is not None:
+            self.leases.touch(sandbox_id)
+        if payload.get("op") == "exec" and sandbox_id is not None:
+            started = time.time()
+            response = await self._agent_call(sock_dir, payload, timeout_s)
+            self._record_event("exec", sandbox_id, {
+                "code_sha256": hashlib.sha256(payload.get("code", "").encode()).hexdigest(),
+                "ok": bool(response.get("ok")),
+                "error": response.get("error"),
+                "duration_ms": (time.time() - started) * 1000
+            })
+            return response
+        return await self._agent_call(sock_dir, payload, timeout_s)
+    
+    async def _agent_call(self, sock_dir: str, payload: Dict[str, Any],
+                          timeout_s: float) -> Dict[str, Any]:
+        reader, writer = await asyncio.open_unix_connection(
+            os.path.join(sock_dir, VSOCK_UDS_NAME)
+        )
+        try:
+            writer.write(f"CONNECT {AGENT_VSOCK_PORT}\n".encode())
+            await writer.drain()
+            ack = await asyncio.wait_for(reader.readline(), timeout_s)
+            if not ack.startswith(b"OK"):
+                raise ConnectionError(f"Agent vsock handshake failed: {ack!r}")
+            writer.write(json.dumps(payload).encode() + b"\n")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.readline(), timeout_s)
+            return json.loads(response)
+        finally:
+            writer.close()
+    
+    async def _wait_for_agent(self, sock_dir: str, timeout_s: float):
+        """Čeká, dokud agent v guestu neodpoví na ping"""
+        deadline = time.time() + timeout_s
+        while True:
+            try:
+                response = await self._agent_request(sock_dir, {"op": "ping"}, timeout_s=1.0)
+                if response.get("ok"):
+                    return
+            except (OSError, ConnectionError, ValueError, asyncio.TimeoutError):
+                pass
+            if time.time() > deadline:
+                raise TimeoutError(f"Guest agent not ready within {timeout_s}s")
+            await asyncio.sleep(0.01)
+    
+    async def create_golden_snapshot(self, template, snapshot):
+        """
+        Nabootuje šablonu, počká na agenta, přednačte moduly v interpretu
+        guestu a uloží snapshot paměti a stavu VM. Jen pro read-only rootfs
+        s overlay - restorované VM se zapisovatelným rootfs by sdílely disk.
+        """
+        if not template.snapshot_capable:
+            raise RuntimeError(
+                f"Template {template.template_id} cannot be snapshotted: "
+                f"requires a read-only rootfs with an overlay disk"
+            )
+        config = SandboxConfig(
+            template_id=template.template_id,
+            memory_mb=template.memory_mb,
+            vcpus=template.vcpus
+        )
+        sandbox = await self._create_sandbox(config, use_snapshot=False)
+        try:
+            sock_dir = os.path.dirname(sandbox.metadata["api_socket"])
+            await self._wait_for_agent(sock_dir, config.boot_timeout_ms / 1000)
+            
+            if template.preload_modules:
+                response = await self._agent_request(sock_dir, {
+                    "op": "exec",
+                    "code": "\n".join(f"import {m}" for m in template.preload_modules)
+                }, sandbox_id=sandbox.sandbox_id)
+                if not response.get("ok"):
+                    raise RuntimeError(f"Module preload failed: {response.get('error')}")
+            
+            api_socket = sandbox.metadata["api_socket"]
+            await self._api_request(api_socket, "PATCH", "/vm", {"state": "Paused"})
+            await self._api_request(api_socket, "PUT", "/snapshot/create", {
+                "snapshot_type": "Full",
+                "snapshot_path": snapshot.snapshot_path,
+                "mem_file_path": snapshot.mem_file_path
+            })
+            
+            # Restorované sandboxy musí začínat se stejným obsahem overlay,
+            # jaký měl guest připojený v okamžiku snapshotu
+            if template.overlay_size_mb > 0:
+                overlay_path = os.path.join(
+                    os.path.dirname(snapshot.snapshot_path), OVERLAY_IMAGE_NAME
+                )
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    None, sparse_copy, os.path.join(sock_dir, OVERLAY_IMAGE_NAME), overlay_path
+                )
+                snapshot.overlay_path = overlay_path
+        finally:
+            await self.stop_sandbox(sandbox.sandbox_id, force=True)
+    
+    async def reattach(self) -> Dict[str, int]:
+        """
+        Po restartu control-plane znovu připojí běžící VMM ze state store
+        a uklidí záznamy, jejichž proces již neběží.
+        """
+        from ..core.sandbox import Sandbox
+        
+        if self.state_store is None:
+            return {"reattached": 0, "collected": 0}
+        
+        dead = []
+        reattached = 0
+        for record in self.state_store.load_all():
+            if not self._is_vmm_alive(record.pid, record.api_socket):
+                dead.append(record)
+                continue
+            
+            self._api_sockets[record.sandbox_id] = record.api_socket
+            if record.tap_name:
+                self._tap_interfaces[record.sandbox_id] = record.tap_name
+            if self.cgroup_manager is not None:
+                self.cgroup_manager.adopt(record.sandbox_id)
+            
+            self._sandboxes[record.sandbox_id] = Sandbox(
+                sandbox_id=record.sandbox_id,
+                config=SandboxConfig.from_dict(record.config),
+                hypervisor=self,
+                state=SandboxState(record.state),
+                process=None,  # Proces není náš potomek, ovládáme ho přes PID
+                metadata={
+                    **record.metadata,
+                    "api_socket": record.api_socket,
+                    "pid": record.pid,
+                    "reattached": True
+                },
+                created_at=record.created_at
+            )
+            self.leases.track(self._sandboxes[record.sandbox_id])
+            reattached += 1
+        
+        # Garbage collection mrtvých VMM - prostředky uklidíme souběžně
+        for record in dead:
+            self._api_sockets[record.sandbox_id] = record.api_socket
+            if record.tap_name:
+                self._tap_interfaces[record.sandbox_id] = record.tap_name
+        await asyncio.gather(
+            *(self._cleanup_resources(record.sandbox_id) for record in dead),
+            return_exceptions=True
+        )
+        self.state_store.delete_many(record.sandbox_id for record in dead)
+        
+        logger.info(
+            f"Reattached {reattached} sandboxes, collected {len(dead)} dead records"
+        )
+        return {"reattached": reattached, "collected": len(dead)}
+    
+    @staticmethod
+    def _is_vmm_alive(pid: Optional[int], api_socket: str) -> bool:
+        """Ověří, že PID stále patří našemu Firecracker procesu"""
+        if not pid:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        
+        # Ochrana proti recyklaci PID - cmdline musí obsahovat náš socket
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            return False
+        return api_socket.encode() in cmdline
+    
     async def start_sandbox(self, sandbox_id: str) -> bool:
         """Spustí existující sandbox - u Firecracker ihned běží"""
         if sandbox_id not in self._sandboxes:
@@ -227,6 +715,31 @@ class FirecrackerHypervisor(BaseHypervisor):
     
     async def stop_sandbox(self, sandbox_id: str, force: bool = False) -> bool:
         """Zastaví sandbox"""
+        if not await self._stop(sandbox_id, force):
+            return False
+        if self.state_store is not None:
+            self.state_store.delete(sandbox_id)
+        return True
+    
+    async def stop_sandboxes(self, sandbox_ids, force: bool = False) -> Dict[str, bool]:
+        """Zastaví více sandboxů souběžně, záznamy stavu smaže jednou dávkou"""
+        results = await asyncio.gather(
+            *(self._stop(sandbox_id, force) for sandbox_id in sandbox_ids),
+            return_exceptions=True
+        )
+        stopped = {}
+        for sandbox_id, result in zip(sandbox_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to stop sandbox {sandbox_id}: {result}")
+            stopped[sandbox_id] = result is True
+        if self.state_store is not None:
+            self.state_store.delete_many(
+                sandbox_id for sandbox_id, ok in stopped.items() if ok
+            )
+        return stopped
+    
+    async def _stop(self, sandbox_id: str, force: bool) -> bool:
+        """Zastaví VMM a uvolní prostředky (bez zápisu do state store)"""
         if sandbox_id not in self._sandboxes:
             return False
         
@@ -236,17 +749,51 @@ class FirecrackerHypervisor(BaseHypervisor):
             if force:
                 sandbox.process.terminate()
             await sandbox.process.wait()
+        elif sandbox.metadata.get("pid"):
+            # Znovu připojený sandbox - proces není náš potomek
+            await self._terminate_pid(sandbox.metadata["pid"], force)
         
         await self._cleanup_resources(sandbox_id)
         
+        # Lease až po úspěšném zastavení - jinak by sandbox nikdo neuklidil
+        self.leases.release(sandbox_id)
+        sandbox.state = SandboxState.STOPPED
         del self._sandboxes[sandbox_id]
+        self._record_event("state", sandbox_id, {
+            "state": SandboxState.STOPPED.value, "force": force
+        })
         return True
     
+    @staticmethod
+    async def _terminate_pid(pid: int, force: bool, timeout: float = 5.0):
+        """Ukončí proces, který není potomkem tohoto procesu"""
+        try:
+            os.kill(pid, signal.SIGKILL if force else signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return
+            await asyncio.sleep(0.01)
+        
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    
     async def pause_sandbox(self, sandbox_id: str) -> bool:
         """Pozastaví sandbox"""
         if sandbox_id not in self._sandboxes:
             return False
         # Firecracker specifická implementace
+        self._sandboxes[sandbox_id].state = SandboxState.PAUSED
+        self._record_event("state", sandbox_id, {"state": SandboxState.PAUSED.value})
+        if self.state_store is not None:
+            self.state_store.update_state(sandbox_id, SandboxState.PAUSED.value)
         return True
     
     async def resume_sandbox(self, sandbox_id: str) -> bool:
@@ -254,10 +801,112 @@ class FirecrackerHypervisor(BaseHypervisor):
         if sandbox_id not in self._sandboxes:
             return False
         # Firecracker specifická implementace
+        self._sandboxes[sandbox_id].state = SandboxState.RUNNING
+        self._record_event("state", sandbox_id, {"state": SandboxState.RUNNING.value})
+        if self.state_store is not None:
+            self.state_store.update_state(sandbox_id, SandboxState.RUNNING.value)
+        return True
+    
+    async def reset_sandbox(self, sandbox_id: str) -> bool:
+        """
+        Vrátí sandbox do stavu golden snapshotu šablony. Firecracker neumí
+        načíst snapshot do již běžícího VM, proto se VMM proces nahradí
+        novým ve stejném adresáři, cgroup a se stejným TAP a API socketem;
+        zapisovatelný overlay se přepíše obsahem ze snapshotu. Paměť guestu
+        je namapovaná MAP_PRIVATE ze sdíleného souboru, takže nový VMM
+        nezdědí nic z předchozí úlohy.
+        
+        Jen pro read-only rootfs s overlay diskem uloženým ve snapshotu -
+        jinak by zápisy předchozí úlohy na disku přežily reset.
+        """
+        sandbox = self._sandboxes.get(sandbox_id)
+        if sandbox is None:
+            return False
+        config = sandbox.config
+        template = self._get_template(config.template_id)
+        if template is None or not template.snapshot_capable:
+            raise RuntimeError(
+                f"Sandbox {sandbox_id} cannot be reset: "
+                f"requires a read-only rootfs with an overlay disk"
+            )
+        if not sandbox.metadata.get("snapshot_key") or not self._snapshot_eligible(config):
+            raise RuntimeError(f"Sandbox {sandbox_id} was not restored from a golden snapshot")
+        
+        start_time = time.time()
+        snapshot = await self.template_manager.ensure_golden_snapshot(config.template_id, self)
+        if snapshot is None or not snapshot.overlay_path:
+            raise RuntimeError(
+                f"Sandbox {sandbox_id} cannot be reset: golden snapshot of "
+                f"{config.template_id} has no overlay disk to restore"
+            )
+        api_socket = sandbox.metadata["api_socket"]
+        sock_dir = os.path.dirname(api_socket)
+        tap_name = self._tap_interfaces[sandbox_id]
+        sandbox.state = SandboxState.STARTING
+        
+        try:
+            if sandbox.process:
+                if sandbox.process.returncode is None:
+                    sandbox.process.kill()
+                await sandbox.process.wait()
+            elif sandbox.metadata.get("pid"):
+                await self._terminate_pid(sandbox.metadata["pid"], force=True)
+            # Nový VMM vytváří API socket i vsock UDS znovu
+            for name in (os.path.basename(api_socket), VSOCK_UDS_NAME):
+                with suppress(FileNotFoundError):
+                    os.unlink(os.path.join(sock_dir, name))
+            
+            await self._prepare_overlay(config.template_id, sock_dir, snapshot)
+            process = await self._spawn_vmm(
+                ["--api-sock", api_socket, *self._seccomp_args(config)], sock_dir, sandbox_id
+            )
+            sandbox.process = process
+            sandbox.metadata.pid = None
+            sandbox.metadata.reattached = None
+            self._publish_boot(sandbox_id, config, "vmm_spawned", start_time)
+            await self._load_snapshot(api_socket, snapshot, tap_name)
+            self._publish_boot(sandbox_id, config, "snapshot_loaded", start_time)
+        except BaseException:
+            # VMM je pryč nebo v neznámém stavu - zbylé prostředky uklidí stop
+            sandbox.state = SandboxState.ERROR
+            self._record_event("state", sandbox_id, {"state": SandboxState.ERROR.value})
+            self._publish_boot(sandbox_id, config, "failed", start_time)
+            raise
+        
+        reset_time = (time.time() - start_time) * 1000
+        sandbox.metadata.snapshot_key = snapshot.key
+        sandbox.state = SandboxState.RUNNING
+        self.leases.touch(sandbox_id)
+        self._record_event("lifecycle", sandbox_id, {
+            "action": "reset",
+            "snapshot_key": snapshot.key,
+            "reset_time_ms": reset_time
+        })
+        logger.info(f"Firecracker sandbox {sandbox_id} reset in {reset_time:.2f}ms")
+        
+        if self.state_store is not None:
+            self.state_store.put(SandboxRecord(
+                sandbox_id=sandbox_id,
+                pid=process.pid,
+                api_socket=api_socket,
+                tap_name=tap_name,
+                config=config.to_dict(),
+                state=sandbox.state.value,
+                created_at=sandbox.created_at,
+                metadata={
+                    "boot_time_ms": sandbox.metadata.get("boot_time_ms"),
+                    "config_file": None,
+                    "snapshot_key": snapshot.key
+                }
+            ))
         return True
     
     async def _cleanup_resources(self, sandbox_id: str):
         """Vyčistí prostředky sandboxu"""
+        # VMM už neběží - cgroup.kill jen pro případné zbylé procesy
+        if self.cgroup_manager is not None:
+            self.cgroup_manager.remove(sandbox_id, kill=True)
+        
         # Uklizení TAP interface
         if sandbox_id in self._tap_interfaces:
             tap_name = self._tap_interfaces[sandbox_id]
@@ -274,15 +923,41 @@ class FirecrackerHypervisor(BaseHypervisor):
             # Uklidit celý adresář
             sock_dir = os.path.dirname(sock_path)
             if os.path.exists(sock_dir):
-                import shutil
                 shutil.rmtree(sock_dir, ignore_errors=True)
             del self._api_sockets[sandbox_id]
     
+    def get_owned_resources(self) -> Dict[str, set]:
+        """Vrátí adresáře, TAP rozhraní a PID patřící známým sandboxům"""
+        pids = set()
+        for sandbox in list(self._sandboxes.values()):
+            if sandbox.process is not None:
+                pids.add(sandbox.process.pid)
+            elif sandbox.metadata.get("pid"):
+                pids.add(sandbox.metadata["pid"])
+        return {
+            "dirs": {os.path.dirname(sock) for sock in list(self._api_sockets.values())},
+            "taps": set(self._tap_interfaces.values()),
+            "pids": pids,
+        }
+    
     async def get_sandbox_stats(self, sandbox_id: str) -> Dict[str, Any]:
-        """Získá statistiky sandboxu přes Firecracker API"""
+        """
+        Statistiky sandboxu. S cgroup se čtou z posledního vzorku cgroup
+        (bez subprocessu), jinak přes Firecracker API.
+        """
         if sandbox_id not in self._api_sockets:
             return {}
         
+        if self.cgroup_manager is not None:
+            usage = self.cgroup_manager.stats(sandbox_id)
+            if usage:
+                sandbox = self._sandboxes.get(sandbox_id)
+                return {
+                    "vcpu_count": sandbox.config.vcpus if sandbox else 0,
+                    "uptime_ns": int((time.time() - sandbox.created_at) * 1e9) if sandbox else 0,
+                    **usage
+                }
+        
         api_socket = self._api_sockets[sandbox_id]
         
         # Získání statistik přes HTTP API
@@ -10,7 +10,7 @@ import sys
 # Přidání root adresáře do path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from core import SandboxConfig, SandboxState
+from core import SandboxConfig, SandboxState, Sandbox
 from unittest.mock import AsyncMock, MagicMock, patch
 import logging
 
@@ -182,5 +182,343 @@ class TestScalability:
             assert drive["path"] == f"/dev/sda{i}"
 
 
+class TestRateLimiterPerformance:
+    """Benchmarky rate limiteru"""
+    
+    KEYS = 1_000_000
+    
+    def test_hot_key_check(self, benchmark):
+        """Kontrola jednoho klíče s limitem SandboxSecurityManageru - O(1)"""
+        from core.security import RateLimiter
+        limiter = RateLimiter(limit_per_second=10000)
+        
+        def check():
+            for _ in range(10000):
+                limiter.is_allowed("sandbox", "net:10.0.0.1:443")
+        
+        benchmark(check)
+    
+    def test_million_keys_bounded_memory(self, benchmark):
+        """1M různých klíčů - paměť zůstává omezená max_keys"""
+        from core.security import RateLimiter
+        keys = [f"net:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}:443" for i in range(self.KEYS)]
+        limiter = RateLimiter(limit_per_second=100, max_keys=100_000)
+        
+        def check_all():
+            for key in keys:
+                limiter.is_allowed("sandbox", key)
+        
+        benchmark.pedantic(check_all, rounds=3, iterations=1)
+        assert len(limiter) == 100_000
+    
+    def test_million_keys_allow_many(self, benchmark):
+        """1M klíčů v dávkách po 1000 přes allow_many()"""
+        from core.security import RateLimiter
+        batches = [
+            [("sandbox", f"net:{i}") for i in range(start, start + 1000)]
+            for start in range(0, self.KEYS, 1000)
+        ]
+        limiter = RateLimiter(limit_per_second=100, max_keys=100_000)
+        
+        def check_batches():
+            for batch in batches:
+                limiter.allow_many(batch)
+        
+        benchmark.pedantic(check_batches, rounds=3, iterations=1)
+        assert len(limiter) == 100_000
+
+
+class TestSyscallPolicyPerformance:
+    """Benchmarky kontroly syscallů"""
+    
+    EVENTS = 100_000
+    
+    def _manager(self):
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        policy = SecurityPolicy(allowed_syscalls={"read", "write", "openat", "close", "futex"})
+        return SandboxSecurityManager("bench", policy)
+    
+    def _events(self):
+        from core.syscalls import syscall_number
+        names = ["read", "write", "openat", "close", "futex", "mmap"]
+        return [syscall_number(names[i % len(names)]) for i in range(self.EVENTS)]
+    
+    def test_audit_replay_per_event(self, benchmark):
+        """Replay auditu voláním check_syscall pro každou událost"""
+        from core.syscalls import syscall_name
+        manager = self._manager()
+        names = [syscall_name(nr) for nr in self._events()]
+        
+        def replay():
+            manager.violations.clear()
+            for name in names:
+                manager.check_syscall(name)
+        
+        benchmark.pedantic(replay, rounds=3, iterations=1)
+    
+    def test_audit_replay_batch(self, benchmark):
+        """Replay auditu jednou dávkou přes check_syscalls (NumPy)"""
+        from core.syscall_policy import HAS_NUMPY, np
+        manager = self._manager()
+        events = self._events()
+        if HAS_NUMPY:
+            events = np.asarray(events, dtype=np.uint16)
+        
+        def replay():
+            manager.violations.clear()
+            return manager.check_syscalls(events)
+        
+        mask = benchmark(replay)
+        assert len(mask) == self.EVENTS
+
+
+class TestNetworkPolicyPerformance:
+    """Benchmarky síťové politiky s velkým počtem CIDR rozsahů"""
+    
+    def _policy(self):
+        from core.network_policy import CompiledNetworkPolicy
+        cidrs = [f"{a}.{b}.0.0/20" for a in range(11, 90) for b in range(0, 256, 1)][:50_000]
+        return CompiledNetworkPolicy(cidrs, {80, 443})
+    
+    def test_cached_lookup(self, benchmark):
+        """Opakovaná kontrola stejného cíle (cache)"""
+        policy = self._policy()
+        policy.check("45.12.7.1", 443)
+        
+        result = benchmark(policy.check, "45.12.7.1", 443)
+        assert result == "blocked_ip"
+    
+    def test_uncached_lookups(self, benchmark):
+        """Kontrola 10k různých cílů proti 50k rozsahům"""
+        targets = [f"{200 - i % 150}.{i % 256}.{i // 256 % 256}.1" for i in range(10_000)]
+        
+        def check_all():
+            policy = self._policy()
+            return sum(policy.check(ip, 443) is None for ip in targets)
+        
+        benchmark.pedantic(check_all, rounds=3, iterations=1)
+
+
+class TestPathPolicyPerformance:
+    """Benchmarky politiky přístupu k souborům"""
+    
+    def _policy(self):
+        from core.path_policy import PathPolicy
+        rules = {f"/srv/app{i}/data": "readonly" for i in range(10_000)}
+        rules.update({"/host": "deny", "/proc/sys": "deny", "/": "allow"})
+        return PathPolicy(rules)
+    
+    def test_deep_path_lookup(self, benchmark):
+        """Jedna kontrola hluboké cesty - O(hloubka), nezávisle na počtu pravidel"""
+        policy = self._policy()
+        result = benchmark(policy.check, "/srv/app4242/data/a/b/c/../d/file.txt", "write")
+        assert result == "read_only"
+    
+    def test_batch_with_traversal(self, benchmark):
+        """Dávka 10k cest s traversal triky"""
+        policy = self._policy()
+        paths = [f"/srv/app{i}/../../host/x{i}" if i % 3 == 0 else f"/srv/app{i}/data/f"
+                 for i in range(10_000)]
+        
+        results = benchmark(policy.check_many, paths, "read")
+        assert results.count("denied") == 3334
+
+
+class TestAuditSamplingPerformance:
+    """Benchmarky auditu při 1M událostí"""
+    
+    EVENTS = 1_000_000
+    
+    def _manager(self, sample_rate):
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        policy = SecurityPolicy(
+            allowed_syscalls={"read", "write", "openat", "close", "futex"},
+            log_syscalls=True, log_network=True, audit_sample_rate=sample_rate
+        )
+        return SandboxSecurityManager("bench", policy)
+    
+    @pytest.mark.parametrize("sample_rate", [1.0, 0.01])
+    def test_1m_allowed_syscalls(self, benchmark, sample_rate):
+        """1M povolených syscallů - plný audit vs. vzorek 1 %"""
+        names = ["read", "write", "openat", "close", "futex"]
+        events = [names[i % len(names)] for i in range(self.EVENTS)]
+        managers = []
+        
+        def setup():
+            # Každé kolo s čistým audit logem - počet kol závisí na --benchmark-disable
+            managers.append(self._manager(sample_rate))
+            return (managers[-1],), {}
+        
+        def replay(manager):
+            check = manager.check_syscall
+            for name in events:
+                check(name)
+        
+        benchmark.pedantic(replay, setup=setup, rounds=3, iterations=1)
+        assert managers[-1]._syscall_log.counts()["read"]["allowed"] == self.EVENTS // 5
+    
+    def test_1m_allowed_connections(self, benchmark):
+        """1M povolených spojení se vzorkovaným síťovým auditem"""
+        from core.security import RateLimiter
+        manager = self._manager(0.01)
+        manager.rate_limiter = RateLimiter(limit_per_second=10 ** 9)
+        
+        def replay():
+            check = manager.check_network_access
+            for i in range(self.EVENTS):
+                check("1.1.1.1", 443)
+        
+        benchmark.pedantic(replay, rounds=1, iterations=1)
+        assert manager.get_violations_summary()["network_counts"]["allowed"] == self.EVENTS
+
+
+class TestEventLogPerformance:
+    """Benchmarky trvalého logu událostí"""
+    
+    def test_append_100k_events(self, benchmark, tmp_path):
+        """Zařazení 100k událostí - producent neblokuje na fsync"""
+        from core.event_log import EventLog
+        log = EventLog(str(tmp_path))
+        
+        def append_all():
+            for i in range(100_000):
+                log.append("violation", f"sb{i % 1000}", {"type": "syscall_violation", "i": i})
+        
+        benchmark.pedantic(append_all, rounds=3, iterations=1)
+        assert log.flush(timeout=30)
+        assert log.get_metrics()["dropped"] == 0
+        log.close()
+    
+    def test_time_range_read(self, benchmark, tmp_path):
+        """Čtení krátkého časového okna z 200k událostí přes sparse index"""
+        from core.event_log import EventLog
+        log = EventLog(str(tmp_path))
+        for i in range(200_000):
+            log.append("state", f"sb{i % 1000}", {"i": i}, timestamp=float(i))
+        log.close()
+        reader = log.reader()
+        
+        events = benchmark(lambda: list(reader.read(since=100_000.0, until=100_099.0)))
+        assert len(events) == 100
+
+
+class TestSecurityPolicyPerformance:
+    """Benchmarky sdílených politik"""
+    
+    def test_10k_sandbox_managers(self, benchmark):
+        """10k security managerů se stejnou vlastní politikou sdílí jednu instanci"""
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        
+        def create_managers():
+            return [
+                SandboxSecurityManager(
+                    f"sb{i}", SecurityPolicy(blocked_ips={"10.0.0.0/8"}), syscall_log_capacity=16
+                )
+                for i in range(10_000)
+            ]
+        
+        managers = benchmark.pedantic(create_managers, rounds=3, iterations=1)
+        assert len({id(manager.policy) for manager in managers}) == 1
+
+
+class TestEventBusPerformance:
+    """Benchmarky sběrnice událostí"""
+    
+    def test_publish_with_10k_sandbox_subscriptions(self, benchmark):
+        """Publikace s 10k odběry jednotlivých sandboxů doručí jen jednomu"""
+        from core.event_bus import EventBus
+        bus = EventBus()
+        subscriptions = [bus.subscribe(sandbox_id=f"sb{i}", maxsize=16) for i in range(10_000)]
+        
+        def publish_all():
+            for i in range(100_000):
+                bus.publish("stats", f"sb{i % 10_000}", {"i": i})
+        
+        def drain_all():
+            for s in subscriptions:
+                s.drain()
+        
+        benchmark.pedantic(publish_all, setup=drain_all, rounds=3, iterations=1)
+        assert all(len(s) == 10 and s.dropped == 0 for s in subscriptions)
+
+
+class TestSandboxRegistryPerformance:
+    """Benchmarky indexovaného registru"""
+    
+    def test_select_from_100k(self, benchmark):
+        """Výběr 10 sandboxů podle labelu a stavu ze 100k"""
+        from core.registry import SandboxRegistry
+        registry = SandboxRegistry()
+        hypervisor = MagicMock(event_bus=None, _sandboxes=registry)
+        for i in range(100_000):
+            registry[f"sb{i}"] = Sandbox(
+                sandbox_id=f"sb{i}",
+                config=SandboxConfig(labels={"team": f"t{i % 10_000}", "env": "prod"}),
+                hypervisor=hypervisor,
+                state=SandboxState.RUNNING
+            )
+        
+        result = benchmark(registry.select, "team=t42,env=prod", SandboxState.RUNNING)
+        assert len(result) == 10
+
+
+class TestSandboxMemory:
+    """Paměťová náročnost sledovaných sandboxů"""
+    
+    def test_bytes_per_sandbox(self, benchmark):
+        """Bajty na sandbox (konfigurace, metadata, objekt) měřené přes tracemalloc"""
+        import gc
+        import tracemalloc
+        hypervisor = MagicMock(event_bus=None)
+        count = 10_000
+        
+        def create_sandboxes():
+            return [
+                Sandbox(
+                    sandbox_id=f"fc_{i:012x}",
+                    config=SandboxConfig(),
+                    hypervisor=hypervisor,
+                    state=SandboxState.RUNNING,
+                    metadata={"boot_time_ms": 12.5, "api_socket": f"/tmp/fc_{i}/api.socket",
+                              "config_file": None, "snapshot_key": "abc"}
+                )
+                for i in range(count)
+            ]
+        
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        sandboxes = create_sandboxes()
+        per_sandbox = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+        benchmark.extra_info["bytes_per_sandbox"] = per_sandbox
+        
+        benchmark.pedantic(create_sandboxes, rounds=3, iterations=1)
+        assert len(sandboxes) == count
+        assert per_sandbox < 1024
+
+
+class TestLeasePerformance:
+    """Benchmarky timer wheelu leasů"""
+    
+    def test_100k_timers(self, benchmark):
+        """Naplánování 100k leasů a jejich vypršení tick po ticku"""
+        import random
+        from core.timer_wheel import TimerWheel
+        rng = random.Random(1)
+        deadlines = [rng.uniform(1, 3600) for _ in range(100_000)]
+        
+        def schedule_and_expire():
+            wheel = TimerWheel(tick_s=0.5, clock=lambda: 0.0)
+            for i, deadline in enumerate(deadlines):
+                wheel.schedule(i, deadline)
+            expired = 0
+            for tick in range(1, 7202):
+                expired += len(wheel.advance(tick * 0.5))
+            return expired
+        
+        assert benchmark.pedantic(schedule_and_expire, rounds=3, iterations=1) == 100_000
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--benchmark-only"])
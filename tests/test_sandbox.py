@@ -3,6 +3,8 @@ Jednotkové testy pro NovaSandbox
 """
 import pytest
 import asyncio
+import os
+import shutil
 from pathlib import Path
 import sys
 
@@ -11,11 +13,32 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from core import SandboxConfig, SandboxState, Sandbox
 from core.template_manager import TemplateManager
+from core.state_store import SandboxStateStore, SandboxRecord
+from core.reconciler import OrphanReconciler, tap_alias
+from core.template_store import ContentStore, hash_file, sparse_copy
+from core.fs_watch import HAS_INOTIFY
+from core.security import RateLimiter
+from core.syscall_audit import SyscallAuditLog
+from core.syscall_policy import compile_syscall_policy
+from core.cgroups import CgroupManager, CgroupLimits, limits_from_policy
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _import_from_package(module: str):
+    """Providery používají relativní importy - načtou se přes nadřazený balíček"""
+    import importlib
+    root = Path(__file__).parent.parent
+    if not root.name.isidentifier():
+        pytest.skip(f"Repository directory {root.name!r} is not importable as a package")
+    sys.path.insert(0, str(root.parent))
+    try:
+        return importlib.import_module(f"{root.name}.{module}")
+    finally:
+        sys.path.remove(str(root.parent))
+
+
 class TestSandboxConfig:
     """Testy konfigurace sandboxu"""
     
@@ -86,6 +109,1343 @@ class TestTemplateManager:
         if manager.templates_dir.exists():
             # Test bude záviset na obsahu
             logger.info(f"Found templates: {templates}")
+    
+    def test_files_are_hashed_and_deduplicated(self, tmp_path):
+        """Test content-addressed ukládání souborů šablon"""
+        import hashlib
+        import json
+        import os
+        for name in ("tpl-a", "tpl-b"):
+            template_dir = tmp_path / name
+            template_dir.mkdir()
+            (template_dir / "vmlinux").write_bytes(b"kernel")
+            (template_dir / "rootfs.ext4").write_bytes(name.encode() * 1000)
+            (template_dir / "config.json").write_text(
+                json.dumps({"required_files": ["vmlinux", "rootfs.ext4"]})
+            )
+        
+        manager = TemplateManager(str(tmp_path))
+        tpl_a = manager.get_template("tpl-a")
+        tpl_b = manager.get_template("tpl-b")
+        
+        assert tpl_a.files["vmlinux"] == hashlib.sha256(b"kernel").hexdigest()
+        assert tpl_a.files["rootfs.ext4"] != tpl_b.files["rootfs.ext4"]
+        # Stejný kernel je uložen jen jednou
+        assert os.path.samefile(tpl_a.file_paths["vmlinux"], tpl_b.file_paths["vmlinux"])
+        # Zapisovatelný ext4 rootfs nesdílí inode s blobem
+        blob = manager.content_store.blob_path(tpl_a.files["rootfs.ext4"])
+        assert not (blob.exists() and os.path.samefile(tpl_a.file_paths["rootfs.ext4"], blob))
+        assert manager.validate_template("tpl-a")
+        assert manager.verify_template("tpl-a")
+        
+        (tmp_path / "tpl-a" / "rootfs.ext4").write_bytes(b"tampered")
+        assert not manager.verify_template("tpl-a")
+    
+    def _make_template(self, root, name="tpl"):
+        import json
+        template_dir = root / name
+        template_dir.mkdir()
+        (template_dir / "vmlinux").write_bytes(b"kernel")
+        (template_dir / "config.json").write_text(json.dumps({"required_files": ["vmlinux"]}))
+        return template_dir
+    
+    def test_validation_is_cached(self, tmp_path):
+        """Opakovaná validace nevolá stat"""
+        from unittest.mock import patch
+        self._make_template(tmp_path)
+        manager = TemplateManager(str(tmp_path), stat_ttl_s=60)
+        
+        assert manager.validate_template("tpl")
+        with patch("core.template_manager.os.stat") as mocked_stat:
+            assert manager.validate_template("tpl")
+            mocked_stat.assert_not_called()
+    
+    @pytest.mark.skipif(not HAS_INOTIFY, reason="inotify not available")
+    def test_watcher_invalidates_cache(self, tmp_path):
+        """Smazání souboru se projeví přes inotify i s dlouhým TTL"""
+        import time
+        template_dir = self._make_template(tmp_path)
+        manager = TemplateManager(str(tmp_path), watch=True, stat_ttl_s=3600)
+        try:
+            assert manager.validate_template("tpl")
+            (template_dir / "vmlinux").unlink()
+            
+            deadline = time.time() + 2
+            while manager.validate_template("tpl") and time.time() < deadline:
+                time.sleep(0.01)
+            assert not manager.validate_template("tpl")
+        finally:
+            manager.close()
+    
+    def test_lazy_loading_from_index(self, tmp_path):
+        """Šablony se parsují až při prvním přístupu, index se znovu použije"""
+        from unittest.mock import patch
+        for i in range(3):
+            self._make_template(tmp_path, f"tpl-{i}")
+        
+        manager = TemplateManager(str(tmp_path))
+        assert sorted(manager.list_templates()) == ["tpl-0", "tpl-1", "tpl-2"]
+        assert manager._templates == {}
+        assert manager.get_template("tpl-1").template_id == "tpl-1"
+        assert list(manager._templates) == ["tpl-1"]
+        
+        # Nezměněný adresář - index se načte bez procházení
+        with patch("core.template_manager.os.scandir") as mocked_scandir:
+            restarted = TemplateManager(str(tmp_path))
+            mocked_scandir.assert_not_called()
+        assert sorted(restarted.list_templates()) == ["tpl-0", "tpl-1", "tpl-2"]
+        
+        # Nová šablona se projeví v indexu po restartu
+        self._make_template(tmp_path, "tpl-3")
+        assert "tpl-3" in TemplateManager(str(tmp_path)).list_templates()
+    
+    def test_index_detects_changed_config(self, tmp_path):
+        """Změny uvnitř adresáře šablony se po restartu projeví v indexu"""
+        import json
+        template_dir = self._make_template(tmp_path)
+        self._make_template(tmp_path, "gone")
+        TemplateManager(str(tmp_path)).list_templates()
+        dir_mtime_ns = tmp_path.stat().st_mtime_ns
+        
+        # <id>.json má přednost před config.json, smazaná konfigurace šablonu ruší
+        (template_dir / "tpl.json").write_text(
+            json.dumps({"name": "Preferred", "required_files": ["vmlinux"]})
+        )
+        (tmp_path / "gone" / "config.json").unlink()
+        assert tmp_path.stat().st_mtime_ns == dir_mtime_ns
+        
+        restarted = TemplateManager(str(tmp_path))
+        assert restarted.list_templates() == ["tpl"]
+        assert restarted._index["tpl"]["config_file"].endswith("tpl/tpl.json")
+        assert restarted.get_template("tpl").name == "Preferred"
+    
+    @pytest.mark.skipif(not HAS_INOTIFY, reason="inotify not available")
+    def test_hot_reload(self, tmp_path):
+        """Přidání a změna šablony se projeví bez restartu"""
+        import json
+        import time
+        template_dir = self._make_template(tmp_path, "tpl-a")
+        manager = TemplateManager(str(tmp_path), watch=True)
+        
+        def wait_for(predicate):
+            deadline = time.time() + 2
+            while not predicate() and time.time() < deadline:
+                time.sleep(0.01)
+            return predicate()
+        
+        try:
+            assert manager.get_template("tpl-a").name == "tpl-a"
+            
+            self._make_template(tmp_path, "tpl-b")
+            assert wait_for(lambda: "tpl-b" in manager.list_templates())
+            
+            (template_dir / "config.json").write_text(
+                json.dumps({"name": "Renamed", "required_files": ["vmlinux"]})
+            )
+            assert wait_for(lambda: manager.get_template("tpl-a").name == "Renamed")
+        finally:
+            manager.close()
+
+    def test_rootfs_writes_do_not_reload(self, tmp_path):
+        """Zápis VM do rootfs šablonu nepřenačte, změna konfigurace ano"""
+        import json
+        from unittest.mock import patch
+        from core.fs_watch import IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO
+        template_dir = self._make_template(tmp_path)
+        (template_dir / "rootfs.ext4").write_bytes(b"rootfs")
+        (template_dir / "config.json").write_text(
+            json.dumps({"required_files": ["vmlinux", "rootfs.ext4"]})
+        )
+        manager = TemplateManager(str(tmp_path))
+        manager.get_template("tpl")
+        rootfs = str(template_dir / "rootfs.ext4")
+        
+        with patch.object(manager, "_reload_template") as reload:
+            manager._on_fs_event(rootfs, IN_MODIFY)
+            manager._on_fs_event(rootfs, IN_CLOSE_WRITE)
+            manager._on_fs_event(str(template_dir / "scratch.tmp"), IN_CLOSE_WRITE)
+            reload.assert_not_called()
+            
+            manager._on_fs_event(rootfs, IN_MOVED_TO)
+            manager._on_fs_event(str(template_dir / "vmlinux"), IN_CLOSE_WRITE)
+            manager._on_fs_event(str(template_dir / "config.json"), IN_CLOSE_WRITE)
+            assert reload.call_count == 3
+    
+    def test_boot_profiles_and_initrd(self, tmp_path):
+        """Boot profily šablony a initrd jako sledovaný soubor šablony"""
+        import json
+        template_dir = self._make_template(tmp_path)
+        (template_dir / "initrd.img").write_bytes(b"initrd")
+        (template_dir / "config.json").write_text(json.dumps({
+            "required_files": ["vmlinux"],
+            "boot": {
+                "initrd": "initrd.img",
+                "default_profile": "agent",
+                "profiles": {"agent": "init=/sbin/novasandbox-init", "full": "init=/sbin/init"}
+            }
+        }))
+        manager = TemplateManager(str(tmp_path))
+        template = manager.get_template("tpl")
+        
+        assert template.initrd_path == (template_dir / "initrd.img").resolve().as_posix()
+        assert "initrd.img" in template.files
+        assert template.boot_args() == "init=/sbin/novasandbox-init"
+        assert template.boot_args("full") == "init=/sbin/init"
+        with pytest.raises(ValueError):
+            template.boot_args("missing")
+        
+        key = manager.snapshot_key(template)
+        template.default_boot_profile = "full"
+        assert manager.snapshot_key(template) != key
+    
+    async def test_read_only_rootfs_with_overlay(self, tmp_path):
+        """Komprimovaný read-only rootfs dostane výchozí overlay disk"""
+        import json
+        template_dir = self._make_template(tmp_path)
+        (template_dir / "rootfs.erofs").write_bytes(b"erofs")
+        (template_dir / "config.json").write_text(json.dumps({
+            "required_files": ["vmlinux"],
+            "rootfs": {"format": "erofs"}
+        }))
+        manager = TemplateManager(str(tmp_path))
+        template = manager.get_template("tpl")
+        
+        assert template.read_only_rootfs
+        assert template.rootfs_image == "rootfs.erofs"
+        assert "rootfs.erofs" in template.file_paths
+        assert template.overlay_size_mb == 256
+        
+        if shutil.which("mke2fs") is None:
+            pytest.skip("mke2fs not available")
+        image = await manager.ensure_overlay_image(16)
+        assert await manager.ensure_overlay_image(16) == image
+        with open(image, "rb") as f:
+            f.seek(1024 + 0x38)
+            assert f.read(2) == b"\x53\xef"  # ext4 magic
+    
+    async def test_golden_snapshot_created_once(self, tmp_path):
+        """Snapshot se vytvoří jednou a po změně souboru šablony znovu"""
+        import json
+        from unittest.mock import AsyncMock, MagicMock
+        template_dir = self._make_template(tmp_path)
+        (template_dir / "config.json").write_text(json.dumps({
+            "required_files": ["vmlinux"],
+            "rootfs": {"format": "erofs"},
+            "golden_snapshot": {"enabled": True, "preload_modules": ["json"]}
+        }))
+        manager = TemplateManager(str(tmp_path))
+        
+        async def fake_snapshot(template, snapshot):
+            Path(snapshot.snapshot_path).write_bytes(b"state")
+            Path(snapshot.mem_file_path).write_bytes(b"memory")
+        hypervisor = MagicMock()
+        hypervisor.create_golden_snapshot = AsyncMock(side_effect=fake_snapshot)
+        
+        first, again = await asyncio.gather(
+            manager.ensure_golden_snapshot("tpl", hypervisor),
+            manager.ensure_golden_snapshot("tpl", hypervisor),
+        )
+        assert first is again
+        assert hypervisor.create_golden_snapshot.await_count == 1
+        
+        # Restart control-plane - snapshot se načte z disku
+        restarted = TemplateManager(str(tmp_path))
+        assert restarted.get_golden_snapshot("tpl").key == first.key
+        
+        (template_dir / "vmlinux").write_bytes(b"new kernel")
+        manager.register_template("tpl")
+        second = await manager.ensure_golden_snapshot("tpl", hypervisor)
+        assert second.key != first.key
+        assert hypervisor.create_golden_snapshot.await_count == 2
+        assert not Path(first.snapshot_path).exists()
+    
+    async def test_golden_snapshot_requires_read_only_rootfs(self, tmp_path):
+        """Šablona se zapisovatelným ext4 rootfs se nesnapshotuje"""
+        import json
+        from unittest.mock import AsyncMock, MagicMock
+        template_dir = self._make_template(tmp_path)
+        (template_dir / "config.json").write_text(json.dumps({
+            "required_files": ["vmlinux"],
+            "golden_snapshot": {"enabled": True}
+        }))
+        manager = TemplateManager(str(tmp_path))
+        hypervisor = MagicMock()
+        hypervisor.create_golden_snapshot = AsyncMock()
+        
+        assert not manager.get_template("tpl").snapshot_capable
+        assert await manager.ensure_golden_snapshot("tpl", hypervisor) is None
+        hypervisor.create_golden_snapshot.assert_not_awaited()
+    
+    async def test_golden_snapshot_failure_backs_off(self, tmp_path):
+        """Neúspěšný snapshot se nezkouší při každém create, ale po backoffu"""
+        import json
+        import time
+        from unittest.mock import AsyncMock, MagicMock, patch
+        template_dir = self._make_template(tmp_path)
+        (template_dir / "config.json").write_text(json.dumps({
+            "required_files": ["vmlinux"],
+            "rootfs": {"format": "erofs"},
+            "golden_snapshot": {"enabled": True}
+        }))
+        manager = TemplateManager(str(tmp_path))
+        hypervisor = MagicMock()
+        hypervisor.create_golden_snapshot = AsyncMock(side_effect=RuntimeError("no agent"))
+        
+        assert await manager.ensure_golden_snapshot("tpl", hypervisor) is None
+        assert await manager.ensure_golden_snapshot("tpl", hypervisor) is None
+        assert hypervisor.create_golden_snapshot.await_count == 1
+        
+        now = time.monotonic()
+        with patch("core.template_manager.time.monotonic", return_value=now + 31):
+            assert await manager.ensure_golden_snapshot("tpl", hypervisor) is None
+        assert hypervisor.create_golden_snapshot.await_count == 2
+        # Druhý neúspěch zdvojí čekání
+        retry_at, failures = next(iter(manager._snapshot_failures.values()))
+        assert failures == 2 and retry_at - (now + 31) == pytest.approx(60.0)
+
+
+class TestTemplateBuilder:
+    """Testy rootless sestavení šablon"""
+    
+    def _base_tarball(self, tmp_path):
+        import io
+        import tarfile
+        tarball = tmp_path / "base.tar.gz"
+        with tarfile.open(tarball, "w:gz") as tar:
+            for name, data in (("etc/os-release", b"alpine"), ("bin/sh", b"#!")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return tarball
+    
+    @pytest.mark.asyncio
+    async def test_only_changed_top_layer_is_rebuilt(self, tmp_path):
+        """Změna horní vrstvy nesestavuje znovu základní vrstvu"""
+        import tarfile
+        from core.template_builder import TemplateBuilder, TemplateBuildSpec, BuildLayer
+        templates = tmp_path / "templates"
+        templates.mkdir()
+        agent = tmp_path / "agent.py"
+        agent.write_text("v1")
+        builder = TemplateBuilder(TemplateManager(str(templates)),
+                                  cache_dir=str(tmp_path / "cache"))
+        spec = TemplateBuildSpec(
+            template_id="tpl",
+            layers=[BuildLayer(tarball=str(self._base_tarball(tmp_path))),
+                    BuildLayer(files={"/opt/agent.py": str(agent)})],
+            kernel_path=str(agent)
+        )
+        
+        first = await builder.build_layers(spec)
+        with tarfile.open(first[1]) as tar:
+            assert tar.getmember("opt/agent.py").uid == 0
+        
+        agent.write_text("v2")
+        built = []
+        original = builder._build_layer
+        
+        async def tracking_build(layer, *args):
+            built.append(layer)
+            await original(layer, *args)
+        
+        builder._build_layer = tracking_build
+        second = await builder.build_layers(spec)
+        
+        assert second[0] == first[0]
+        assert second[1] != first[1]
+        assert built == [spec.layers[1]]
+    
+    def test_merged_tar_keeps_owner_and_mode(self, tmp_path):
+        """Sloučený tarball zachová vlastníka i setuid bit a aplikuje whiteouty"""
+        import io
+        import tarfile
+        from core.template_builder import TemplateBuilder, WHITEOUT_FILE
+        
+        def layer(name, entries):
+            path = tmp_path / name
+            with tarfile.open(path, "w") as tar:
+                for member_name, data, uid, mode in entries:
+                    info = tarfile.TarInfo(member_name)
+                    info.size, info.uid, info.gid, info.mode = len(data), uid, uid, mode
+                    tar.addfile(info, io.BytesIO(data))
+            return path
+        
+        base = layer("base.tar", [("bin/su", b"su", 0, 0o4755),
+                                  ("home/user/notes", b"n", 1000, 0o600),
+                                  ("tmp/old", b"o", 0, 0o644)])
+        top = layer("top.tar", [(WHITEOUT_FILE, b"tmp/old", 0, 0o644),
+                                ("bin/su", b"su2", 0, 0o4755)])
+        builder = TemplateBuilder(TemplateManager(str(tmp_path / "templates")),
+                                  cache_dir=str(tmp_path / "cache"))
+        merged = tmp_path / "merged.tar"
+        builder._write_merged_tar([base, top], merged)
+        
+        with tarfile.open(merged) as tar:
+            members = {m.name: m for m in tar.getmembers()}
+            assert set(members) == {"bin/su", "home/user/notes"}
+            assert members["bin/su"].mode == 0o4755
+            assert tar.extractfile("bin/su").read() == b"su2"
+            assert (members["home/user/notes"].uid, members["home/user/notes"].mode) == (1000, 0o600)
+    
+    def test_snapshot_detects_mode_change(self, tmp_path):
+        """Změna jen mode bitů se v diffu vrstvy projeví"""
+        from core.template_builder import TemplateBuilder
+        (tmp_path / "root").mkdir()
+        script = tmp_path / "root" / "run.sh"
+        script.write_text("echo")
+        before = TemplateBuilder._snapshot(tmp_path / "root")
+        script.chmod(0o755)
+        assert TemplateBuilder._snapshot(tmp_path / "root") != before
+    
+    @pytest.mark.asyncio
+    @pytest.mark.skipif(shutil.which("mke2fs") is None, reason="mke2fs not available")
+    async def test_build_registers_template(self, tmp_path):
+        """Sestavená šablona je zaregistrována v TemplateManageru"""
+        from core.template_builder import TemplateBuilder, TemplateBuildSpec, BuildLayer
+        templates = tmp_path / "templates"
+        templates.mkdir()
+        kernel = tmp_path / "vmlinux"
+        kernel.write_bytes(b"kernel")
+        manager = TemplateManager(str(templates))
+        builder = TemplateBuilder(manager, cache_dir=str(tmp_path / "cache"))
+        
+        template = await builder.build(TemplateBuildSpec(
+            template_id="built",
+            layers=[BuildLayer(tarball=str(self._base_tarball(tmp_path)))],
+            kernel_path=str(kernel),
+            size_mb=8
+        ))
+        
+        assert template is not None
+        assert "built" in manager.list_templates()
+        assert set(template.files) == {"vmlinux", "rootfs.ext4"}
+        assert manager.validate_template("built")
+
+
+class TestTemplatePrefetcher:
+    """Testy zahřívání page cache"""
+    
+    def test_warm_and_residency(self, tmp_path):
+        """Po zahřátí je šablona v page cache"""
+        import json
+        import mmap
+        from core.prefetch import TemplatePrefetcher
+        template_dir = tmp_path / "tpl"
+        template_dir.mkdir()
+        (template_dir / "rootfs.ext4").write_bytes(b"r" * 64 * 1024)
+        (template_dir / "config.json").write_text(json.dumps({"required_files": ["rootfs.ext4"]}))
+        prefetcher = TemplatePrefetcher(TemplateManager(str(tmp_path)))
+        
+        assert prefetcher.warm("tpl") == 1
+        report = prefetcher.residency("tpl")
+        
+        assert report["rootfs.ext4"]["total_pages"] == 64 * 1024 // mmap.PAGESIZE
+        assert report["rootfs.ext4"]["ratio"] == 1.0
+    
+    def test_burst_prediction(self):
+        """Burst se hlásí jednou po překročení prahu"""
+        from unittest.mock import MagicMock
+        from core.prefetch import TemplatePrefetcher
+        prefetcher = TemplatePrefetcher(MagicMock(), burst_threshold=2.5)
+        
+        results = [prefetcher.record_use("hot") for _ in range(3)]
+        prefetcher.record_use("cold")
+        
+        assert results == [False, False, True]
+        assert prefetcher.ranked_templates() == ["hot", "cold"]
+
+
+class TestContentStore:
+    """Testy content-addressed úložiště"""
+    
+    def test_hash_file_matches_hashlib(self, tmp_path):
+        """Test mmap hashování včetně prázdného souboru"""
+        import hashlib
+        import os
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        (tmp_path / "big").write_bytes(data)
+        (tmp_path / "empty").write_bytes(b"")
+        
+        assert hash_file(str(tmp_path / "big")) == hashlib.sha256(data).hexdigest()
+        assert hash_file(str(tmp_path / "empty")) == hashlib.sha256(b"").hexdigest()
+    
+    def test_hash_cache_survives_restart(self, tmp_path):
+        """Test, že po restartu se nezměněné soubory znovu nečtou"""
+        from unittest.mock import patch
+        image = tmp_path / "rootfs.ext4"
+        image.write_bytes(b"x" * 4096)
+        
+        digest = ContentStore(str(tmp_path / "store")).hash_files([str(image)])[str(image)]
+        
+        store = ContentStore(str(tmp_path / "store"))
+        with patch("core.template_store.hash_file") as mocked:
+            assert store.hash_files([str(image)])[str(image)] == digest
+            mocked.assert_not_called()
+    
+    def test_writable_files_are_never_hardlinked(self, tmp_path):
+        """Zápis do jednoho zapisovatelného obrazu nezmění druhý ani blob"""
+        import os
+        first, second = tmp_path / "a.ext4", tmp_path / "b.ext4"
+        first.write_bytes(b"r" * 8192)
+        second.write_bytes(b"r" * 8192)
+        store = ContentStore(str(tmp_path / "store"))
+        
+        digests = store.ingest([str(first), str(second)], writable=[str(first), str(second)])
+        assert digests[str(first)] == digests[str(second)]
+        assert not os.path.samefile(first, second)
+        
+        first.write_bytes(b"w" * 8192)
+        assert second.read_bytes() == b"r" * 8192
+        blob = store.blob_path(digests[str(second)])
+        assert not blob.exists() or blob.read_bytes() == b"r" * 8192
+    
+    def test_legacy_hardlink_is_split_for_writable(self, tmp_path):
+        """Zapisovatelný soubor hardlinkovaný starší verzí dostane vlastní inode"""
+        import os
+        image = tmp_path / "rootfs.ext4"
+        image.write_bytes(b"r" * 8192)
+        store = ContentStore(str(tmp_path / "store"))
+        digest = store.ingest([str(image)])[str(image)]
+        assert os.path.samefile(image, store.blob_path(digest))
+        
+        store.ingest([str(image)], writable=[str(image)])
+        assert not os.path.samefile(image, store.blob_path(digest))
+        assert image.read_bytes() == b"r" * 8192
+    
+    def test_sparse_copy_keeps_holes(self, tmp_path):
+        """Řídká kopie zachová obsah i díry"""
+        import os
+        src = tmp_path / "overlay.ext4"
+        with open(src, "wb") as f:
+            f.truncate(64 * 1024 * 1024)
+            f.seek(1024)
+            f.write(b"superblock")
+            f.seek(32 * 1024 * 1024)
+            f.write(b"inode table")
+        dst = tmp_path / "copy.ext4"
+        
+        sparse_copy(str(src), str(dst))
+        
+        assert dst.read_bytes() == src.read_bytes()
+        assert os.stat(dst).st_blocks <= os.stat(src).st_blocks
+
+
+class TestRateLimiter:
+    """Testy token bucket rate limiteru"""
+    
+    def test_burst_and_refill(self):
+        """Po vyčerpání kbelíku se tokeny doplňují podle limitu"""
+        now = [0.0]
+        limiter = RateLimiter(limit_per_second=10, clock=lambda: now[0])
+        
+        assert all(limiter.is_allowed("sb", "net") for _ in range(10))
+        assert not limiter.is_allowed("sb", "net")
+        assert limiter.is_allowed("sb", "other")
+        
+        now[0] = 0.25
+        assert [limiter.is_allowed("sb", "net") for _ in range(3)] == [True, True, False]
+    
+    def test_keys_are_bounded(self):
+        """LRU limit počtu klíčů a vyřazení nečinných klíčů"""
+        now = [0.0]
+        limiter = RateLimiter(limit_per_second=5, max_keys=100, idle_ttl_s=10,
+                              clock=lambda: now[0])
+        
+        results = limiter.allow_many(("sb", f"net:{i}") for i in range(1000))
+        assert all(results)
+        assert len(limiter) == 100
+        
+        now[0] = 11.0
+        limiter.is_allowed("sb", "fresh")
+        assert len(limiter) == 1
+    
+    def test_idle_eviction_does_not_refill_early(self):
+        """idle_ttl_s je nejméně doba doplnění kbelíku - vyřazení limit neobejde"""
+        now = [0.0]
+        limiter = RateLimiter(limit_per_second=1, burst=100, idle_ttl_s=1,
+                              clock=lambda: now[0])
+        assert limiter.idle_ttl_s == 100
+        
+        assert all(limiter.is_allowed("sb", "net") for _ in range(100))
+        now[0] = 5.0
+        limiter.is_allowed("sb", "other")  # Spustí úklid nečinných klíčů
+        assert [limiter.is_allowed("sb", "net") for _ in range(6)] == [True] * 5 + [False]
+
+
+class TestSyscallAuditLog:
+    """Testy kruhového auditního logu syscallů"""
+    
+    def test_ring_buffer_wraps(self):
+        """Starší záznamy se přepisují, čítače zůstávají přesné"""
+        log = SyscallAuditLog(capacity=4)
+        for i in range(10):
+            log.append("read" if i % 2 else "write", allowed=i != 9, timestamp=float(i))
+        
+        entries = list(log.entries())
+        assert len(log) == 4 and log.dropped == 6
+        assert [e["timestamp"] for e in entries] == [6.0, 7.0, 8.0, 9.0]
+        assert entries[-1] == {"syscall": "read", "timestamp": 9.0, "allowed": False}
+        assert log.counts() == {
+            "write": {"allowed": 5, "denied": 0},
+            "read": {"allowed": 4, "denied": 1},
+        }
+        assert [e["timestamp"] for e in log.entries(limit=2)] == [8.0, 9.0]
+    
+    def test_security_manager_memory_is_bounded(self):
+        """STRICT politika loguje do bufferu pevné velikosti"""
+        import dataclasses
+        from core.security import SandboxSecurityManager, DEFAULT_POLICIES, SecurityLevel
+        policy = dataclasses.replace(DEFAULT_POLICIES[SecurityLevel.STRICT], audit_sample_rate=1.0)
+        manager = SandboxSecurityManager("sb", policy, syscall_log_capacity=1000)
+        size = manager._syscall_log.memory_bytes()
+        for _ in range(5000):
+            manager.check_syscall("openat")
+        manager.check_syscall("not_a_real_syscall")
+        
+        summary = manager.get_violations_summary()
+        assert summary["syscall_log_size"] == 1000
+        assert summary["syscall_log_total"] == 5001
+        assert summary["syscall_counts"]["openat"]["allowed"] == 5000
+        assert summary["syscall_counts"]["not_a_real_syscall"]["allowed"] == 1
+        assert manager._syscall_log.memory_bytes() == size
+
+
+class TestAuditSampling:
+    """Testy vzorkovaného auditu"""
+    
+    def test_sampler_rate_and_batches(self):
+        """Vzorek odpovídá rate, dávkové vzorkování vybírá stejné události"""
+        from core.syscall_audit import AuditSampler
+        sampler = AuditSampler(0.01, seed=7)
+        hits = sum(sampler.sample() for _ in range(100_000))
+        assert 800 < hits < 1200
+        
+        sequential = AuditSampler(0.1, seed=3)
+        picked = [i for i in range(5000) if sequential.sample()]
+        assert AuditSampler(0.1, seed=3).sample_many(5000) == picked
+        assert AuditSampler(1.0).sample_many(3) == [0, 1, 2]
+        assert AuditSampler(0.0).sample_many(1000) == []
+        with pytest.raises(ValueError):
+            AuditSampler(1.5)
+    
+    def test_violations_always_recorded(self):
+        """Porušení jsou v logu vždy, povolené události ve vzorku, čítače přesně"""
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        policy = SecurityPolicy(allowed_syscalls={"read", "write"}, log_syscalls=True,
+                                kill_on_violation=False, audit_sample_rate=0.01)
+        manager = SandboxSecurityManager("sb", policy, sample_seed=1)
+        for i in range(20_000):
+            manager.check_syscall("read" if i % 5000 else "ptrace")
+        manager.check_syscalls(["write"] * 10_000 + ["mount"] * 2)
+        
+        counts = manager._syscall_log.counts()
+        assert counts["read"]["allowed"] == 19_996
+        assert counts["write"]["allowed"] == 10_000
+        assert counts["ptrace"]["denied"] == 4 and counts["mount"]["denied"] == 2
+        
+        entries = list(manager._syscall_log.entries())
+        denied = [e["syscall"] for e in entries if not e["allowed"]]
+        assert denied == ["ptrace"] * 4 + ["mount"] * 2
+        assert 200 < len(entries) < 400
+    
+    def test_network_audit_and_warning_throttle(self, caplog):
+        """Síťový audit počítá přesně, warning logy jsou omezené na klíč"""
+        from core.security import SandboxSecurityManager, SecurityPolicy, WarningThrottle
+        policy = SecurityPolicy(blocked_ips={"10.0.0.0/8"}, log_network=True,
+                                audit_sample_rate=0.0)
+        manager = SandboxSecurityManager("sb", policy)
+        with caplog.at_level(logging.WARNING, logger="core.security"):
+            for _ in range(50):
+                manager.check_network_access("10.1.2.3", 443)
+                manager.check_network_access("1.1.1.1", 443)
+        
+        summary = manager.get_violations_summary()
+        assert summary["network_counts"]["allowed"] == 50
+        assert summary["network_counts"]["blocked_ip"] == 50
+        assert summary["network_log_size"] == 50  # Jen porušení
+        assert summary["total_violations"] == 50
+        assert len([r for r in caplog.records if "Blocked IP" in r.message]) == 5
+        assert summary["suppressed_warnings"] == 45
+        
+        now = [0.0]
+        throttle = WarningThrottle(per_second=1.0, burst=1, clock=lambda: now[0])
+        assert throttle.log("k", "first")
+        assert not throttle.log("k", "second")
+        now[0] = 1.0
+        with caplog.at_level(logging.WARNING, logger="core.security"):
+            assert throttle.log("k", "third")
+        assert caplog.records[-1].message == "third (1 similar suppressed)"
+
+
+class TestSyscallPolicy:
+    """Testy bitové mapy syscall politiky"""
+    
+    def test_compiled_policy_is_shared(self):
+        """Stejná množina syscallů sdílí jednu zkompilovanou mapu"""
+        a = compile_syscall_policy({"read", "write"})
+        b = compile_syscall_policy(["write", "read"])
+        assert a is b
+        assert a.allows_name("read") and not a.allows_name("execve")
+        assert compile_syscall_policy(None).allows_name("execve")
+    
+    def test_batch_check_records_violations(self):
+        """Dávková kontrola odpovídá jednotlivým kontrolám"""
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        policy = SecurityPolicy(allowed_syscalls={"read", "write", "futex"},
+                                log_syscalls=True)
+        manager = SandboxSecurityManager("sb", policy)
+        batch = ["read", "execve", 1, "futex", "ptrace"] * 200
+        
+        mask = manager.check_syscalls(batch, timestamps=[float(i) for i in range(len(batch))])
+        
+        assert [bool(ok) for ok in mask] == [True, False, True, True, False] * 200
+        assert len(manager.violations) == 400
+        assert manager.violations[1] == {
+            "type": "syscall_violation", "syscall": "ptrace", "timestamp": 4.0
+        }
+        counts = manager._syscall_log.counts()
+        assert counts["write"] == {"allowed": 200, "denied": 0}
+        assert counts["execve"] == {"allowed": 0, "denied": 200}
+        assert list(manager._syscall_log.entries(limit=1))[0]["timestamp"] == 999.0
+    
+    def test_out_of_range_numbers_are_rejected(self):
+        """Čísla mimo rozsah se odmítnou, nepřetečou na jiný syscall"""
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        manager = SandboxSecurityManager("sb", SecurityPolicy(allowed_syscalls={"read"}))
+        policy = compile_syscall_policy({"read"})
+        
+        for bad in ([65536], [-1], [0, 1 << 20]):
+            with pytest.raises(ValueError):
+                manager.check_syscalls(bad)
+            with pytest.raises(ValueError):
+                policy.check_batch(bad)
+        assert manager.violations == []
+    
+    def test_numpy_batch_paths(self):
+        """Vektorizovaná kontrola a audit s NumPy odpovídají skalárním kontrolám"""
+        np = pytest.importorskip("numpy")
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        from core.syscall_audit import SyscallAuditLog
+        from core.syscalls import syscall_number
+        policy = compile_syscall_policy({"read", "write"})
+        numbers = np.array([syscall_number(n) for n in ("read", "execve", "write")] * 100,
+                           dtype=np.int64)
+        
+        mask = policy.check_batch(numbers)
+        assert isinstance(mask, np.ndarray) and mask.dtype == bool
+        assert mask.tolist() == [policy.allows(int(nr)) for nr in numbers]
+        assert compile_syscall_policy(None).check_batch(numbers).all()
+        with pytest.raises(ValueError):
+            policy.check_batch(np.array([70_000]))
+        
+        log = SyscallAuditLog(capacity=8)
+        log.extend_numbers(numbers.astype(np.uint16), mask, [float(i) for i in range(300)])
+        assert log.counts()["read"] == {"allowed": 100, "denied": 0}
+        assert log.counts()["execve"] == {"allowed": 0, "denied": 100}
+        assert [e["timestamp"] for e in log.entries()][-1] == 299.0
+        
+        manager = SandboxSecurityManager("sb", SecurityPolicy(
+            allowed_syscalls={"read", "write"}, log_syscalls=True, kill_on_violation=False
+        ))
+        manager.check_syscalls(numbers)
+        assert len(manager.violations) == 100
+        assert manager._syscall_log.counts()["write"]["allowed"] == 100
+
+
+class TestNetworkPolicy:
+    """Testy předkompilované síťové politiky"""
+    
+    def test_cidr_ranges_and_ports(self):
+        """CIDR rozsahy IPv4/IPv6, sloučení intervalů a bitmapa portů"""
+        from core.network_policy import compile_network_policy
+        policy = compile_network_policy(
+            {"10.0.0.0/8", "10.1.0.0/16", "192.168.1.7", "fd00::/8", "metadata.internal"},
+            {80, 443}
+        )
+        
+        assert policy.range_count == 3
+        assert policy.is_ip_blocked("10.255.0.1")
+        assert policy.is_ip_blocked("192.168.1.7")
+        assert not policy.is_ip_blocked("192.168.1.8")
+        assert policy.is_ip_blocked("fd12::1")
+        assert policy.is_ip_blocked("::ffff:10.0.0.1")
+        assert policy.is_ip_blocked("metadata.internal")
+        assert not policy.is_ip_blocked("not-an-ip")
+        assert policy.check("8.8.8.8", 443) is None
+        assert policy.check("8.8.8.8", 22) == "port_not_allowed"
+        assert policy.check("10.0.0.1", 443) == "blocked_ip"
+        assert compile_network_policy(["10.1.0.0/16", "10.0.0.0/8", "192.168.1.7",
+                                       "fd00::/8", "metadata.internal"], [443, 80]) is policy
+    
+    def test_security_manager_blocks_cidr(self):
+        """check_network_access používá CIDR rozsahy"""
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        manager = SandboxSecurityManager("sb", SecurityPolicy(blocked_ips={"169.254.0.0/16"}))
+        
+        assert not manager.check_network_access("169.254.169.254", 80)
+        assert manager.check_network_access("1.1.1.1", 80)
+        assert manager.violations[0]["reason"] == "blocked_ip"
+
+
+class TestPathPolicy:
+    """Testy trie politiky přístupu k souborům"""
+    
+    def test_traversal_tricks(self):
+        """Normalizace `..`, `.` a `//` nepustí ven z pravidla"""
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        manager = SandboxSecurityManager("sb", SecurityPolicy())
+        
+        for path in ["/host", "/host/etc/passwd", "/a/../../host", "//host//etc",
+                     "/./host/.", "host/x", "/../../../host", "/tmp/../host/shadow"]:
+            assert not manager.check_file_access(path), path
+        for path in ["/hostname", "/etc/passwd", "/../../../etc/passwd", "/tmp/host"]:
+            assert manager.check_file_access(path), path
+        assert {v["reason"] for v in manager.violations} == {"host_breakout_attempt"}
+    
+    def test_subtree_rules_and_batch(self):
+        """Pravidla pro podstromy - nejdelší prefix vyhrává"""
+        from core.path_policy import PathPolicy
+        policy = PathPolicy({"/": "readonly", "/tmp": "allow", "/proc/sys": "deny",
+                             "/tmp/locked": "deny"})
+        
+        assert policy.check_many(
+            ["/etc/hosts", "/tmp/x", "/tmp/locked/y", "/proc/sys/kernel", "/proc/1", "/tmp\0/x"],
+            mode="write"
+        ) == ["read_only", None, "denied", "denied", "read_only", "denied"]
+        assert policy.check("/etc/hosts", "read") is None
+        assert policy.check("/tmp/\0", "read") == "denied"
+    
+    def test_fuzz_normalization(self):
+        """Náhodné kombinace komponent odpovídají posixpath.normpath v kořeni"""
+        import posixpath
+        import random
+        from core.path_policy import normalize_path, PathPolicy
+        policy = PathPolicy({"/host": "deny"})
+        rng = random.Random(1234)
+        parts = ["..", ".", "", "host", "etc", "a", "b"]
+        
+        for _ in range(5000):
+            path = "/".join(rng.choice(parts) for _ in range(rng.randint(1, 10)))
+            normalized = normalize_path(path)
+            # Reference: normpath s odstraněním `..` nad kořenem
+            reference = posixpath.normpath("/" + path)
+            while reference.startswith("/.."):
+                reference = posixpath.normpath(reference[3:] or "/")
+            reference = "/" + reference.lstrip("/")
+            assert normalized == reference, path
+            expected = "denied" if normalized.split("/")[1:2] == ["host"] else None
+            assert policy.check(path) == expected, path
+
+
+class TestSeccompCompiler:
+    """Testy kompilace seccomp filtrů"""
+    
+    def test_bpf_tree_matches_allowlist(self):
+        """BPF strom povolí přesně syscally z filtru, i s dlouhými skoky"""
+        from core.seccomp import compile_bpf, run_bpf, SECCOMP_ACTIONS
+        from core.syscalls import SYSCALL_NUMBERS
+        allowed = sorted(SYSCALL_NUMBERS)[::2]  # ~190 syscallů - vynutí JA trampolíny
+        program = compile_bpf({
+            "default_action": "trap",
+            "filter_action": "allow",
+            "filter": [{"syscall": name} for name in allowed],
+        })
+        allowed_numbers = {SYSCALL_NUMBERS[name] for name in allowed}
+        
+        assert all(jt <= 255 and jf <= 255 for _, jt, jf, _ in program)
+        for nr in range(0, 600):
+            expected = "allow" if nr in allowed_numbers else "trap"
+            assert run_bpf(program, nr) == SECCOMP_ACTIONS[expected], nr
+        assert run_bpf(program, 0, arch=0x40000003) == SECCOMP_ACTIONS["kill_process"]
+    
+    def test_custom_filter_is_cached(self, tmp_path):
+        """Vlastní filtr se kompiluje jednou a povolí přesně syscally ze specifikace"""
+        import json
+        import struct
+        from unittest.mock import patch
+        from core.seccomp import SeccompCompiler, compile_bpf, run_bpf, SECCOMP_ACTIONS
+        from core.syscalls import syscall_number
+        thread = {
+            "default_action": "trap",
+            "filter_action": "allow",
+            "filter": [{"syscall": name} for name in ("read", "write", "ioctl")],
+        }
+        spec_file = tmp_path / "filter.json"
+        spec_file.write_text(json.dumps({"vmm": thread, "api": thread, "vcpu": thread}))
+        
+        program = compile_bpf(thread)
+        assert run_bpf(program, syscall_number("ioctl")) == SECCOMP_ACTIONS["allow"]
+        assert run_bpf(program, syscall_number("ptrace")) == SECCOMP_ACTIONS["trap"]
+        
+        path = SeccompCompiler(str(tmp_path / "cache")).compile_file(str(spec_file))
+        data = open(path, "rb").read()
+        assert struct.unpack_from("<Q", data)[0] == 3
+        
+        with patch("core.seccomp.compile_bpf") as mocked:
+            assert SeccompCompiler(str(tmp_path / "cache")).compile_file(str(spec_file)) == path
+            mocked.assert_not_called()
+        
+        # Filtry argumentů kompilátor neumí - raději odmítne, než by je zahodil
+        with pytest.raises(ValueError):
+            compile_bpf({**thread, "filter": [{"syscall": "ioctl", "args": [{"index": 1}]}]})
+
+
+class TestCgroupManager:
+    """Testy cgroup v2 správy nad falešným cgroupfs"""
+    
+    def _manager(self, tmp_path, clock):
+        root = tmp_path / "novasandbox"
+        root.mkdir()
+        (root / "cgroup.controllers").write_text("cpuset cpu io memory pids\n")
+        return CgroupManager(str(root), sample_interval_s=1.0, clock=lambda: clock[0])
+    
+    def test_limits_from_policy(self, tmp_path):
+        """Limity respektují politiku i konfiguraci a zapíší se do cgroup"""
+        from core.security import DEFAULT_POLICIES, SecurityLevel, HostSecurityHardening
+        policy = DEFAULT_POLICIES[SecurityLevel.STRICT]
+        config = SandboxConfig(memory_mb=4096, vcpus=1, security_level=SecurityLevel.STRICT)
+        
+        files = limits_from_policy(policy, config, io_device="8:0").to_files()
+        assert files["memory.max"] == str((1024 + 64) * 1024 * 1024)
+        assert files["cpu.max"] == "100000 100000"
+        assert files["pids.max"] == "17"
+        assert files["io.max"] == (
+            "8:0 rbps=209715200 riops=5000 wbps=209715200 wiops=5000"
+        )
+        assert "io.max" not in HostSecurityHardening.get_cgroup_limits(config)
+        
+        clock = [0.0]
+        manager = self._manager(tmp_path, clock)
+        path = manager.create("sb1", limits_from_policy(policy, config))
+        assert (manager.root / "cgroup.subtree_control").read_text() == "+cpu +memory +pids +io"
+        assert (path / "cpu.weight").read_text() == "100"
+        assert "sb1" in manager
+    
+    def test_batched_sampling(self, tmp_path):
+        """Statistiky se čtou jednou za interval přes otevřené deskriptory"""
+        clock = [0.0]
+        manager = self._manager(tmp_path, clock)
+        path = manager.create("sb1", CgroupLimits(memory_max=1 << 30))
+        (path / "memory.current").write_text("104857600\n")
+        (path / "cpu.stat").write_text("usage_usec 1000000\nuser_usec 600000\nsystem_usec 400000\n")
+        (path / "io.stat").write_text("8:0 rbytes=4096 wbytes=0 rios=1 wios=0\n"
+                                      "8:16 rbytes=4096 wbytes=8192 rios=1 wios=2\n")
+        
+        stats = manager.stats("sb1")
+        assert stats["memory_usage_mb"] == 100
+        assert stats["cpu_usage_us"] == 1000000
+        assert stats["io_read_bytes"] == 8192 and stats["io_write_ops"] == 2
+        
+        # V rámci intervalu se soubory znovu nečtou
+        (path / "cpu.stat").write_text("usage_usec 1500000\n")
+        assert manager.stats("sb1")["cpu_usage_us"] == 1000000
+        
+        clock[0] = 1.0
+        stats = manager.stats("sb1")
+        assert stats["cpu_usage_us"] == 1500000
+        assert stats["cpu_percent"] == pytest.approx(50.0)
+        
+        manager.remove("sb1")
+        assert "sb1" not in manager
+        assert manager.stats("sb1") == {}
+    
+    @pytest.mark.skipif(not os.environ.get("NOVASANDBOX_CGROUP_TEST_ROOT"),
+                        reason="needs a delegated cgroup v2 (NOVASANDBOX_CGROUP_TEST_ROOT)")
+    def test_delegated_cgroup(self):
+        """Proces spuštěný přes spawn_into běží ve vlastní cgroup"""
+        import subprocess
+        manager = CgroupManager(os.path.join(
+            os.environ["NOVASANDBOX_CGROUP_TEST_ROOT"], f"test-{os.getpid()}"
+        ))
+        manager.setup()
+        manager.create("sb1", CgroupLimits(memory_max=64 * 1024 * 1024, pids_max=4))
+        with manager.spawn_into("sb1") as preexec_fn:
+            process = subprocess.Popen(["sleep", "5"], preexec_fn=preexec_fn)
+        try:
+            with open(f"/proc/{process.pid}/cgroup") as f:
+                assert f.read().strip().endswith(f"test-{os.getpid()}/sb1")
+            assert manager.stats("sb1")["memory_bytes"] > 0
+        finally:
+            process.kill()
+            process.wait()
+            manager.remove("sb1", kill=True)
+            os.rmdir(manager.root)
+
+
+class TestSecurityPolicy:
+    """Testy neměnných a sdílených politik"""
+    
+    def test_policy_is_frozen_and_hashable(self):
+        """Politika je neměnná, hashovatelná a přežije serializaci"""
+        import dataclasses
+        from core.security import SecurityPolicy
+        policy = SecurityPolicy(blocked_ips={"10.0.0.0/8"}, path_rules={"/data": "readonly"})
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            policy.max_vcpus = 64
+        with pytest.raises(TypeError):
+            policy.path_rules["/host"] = "allow"
+        
+        same = SecurityPolicy(blocked_ips=["10.0.0.0/8"], path_rules={"/data": "readonly"})
+        assert policy == same and hash(policy) == hash(same)
+        assert SecurityPolicy.from_dict(policy.to_dict()) == policy
+        assert dataclasses.replace(policy, max_vcpus=1) != policy
+    
+    def test_configs_share_compiled_policy(self):
+        """Sandboxy se stejnou politikou sdílí instanci i zkompilované kontroly"""
+        from core.security import SecurityPolicy, SecurityLevel, SandboxSecurityManager
+        configs = [
+            SandboxConfig(custom_security_policy=SecurityPolicy(blocked_ips={"10.0.0.1"}))
+            for _ in range(100)
+        ]
+        policies = {id(config.get_security_policy()) for config in configs}
+        assert len(policies) == 1
+        
+        policy = configs[0].get_security_policy()
+        manager = SandboxSecurityManager("sb", SecurityPolicy(blocked_ips={"10.0.0.1"}))
+        assert manager.policy is policy
+        assert manager._network_policy is policy.compiled.network
+        assert SandboxConfig.from_dict(configs[0].to_dict()).get_security_policy() is policy
+        
+        standard = SandboxConfig(security_level=SecurityLevel.STANDARD).get_security_policy()
+        assert standard is SandboxConfig().get_security_policy()
+    
+    def test_unused_policies_are_freed(self):
+        """Intern tabulka ani cache zkompilovaných kontrol nedrží nepoužívané politiky"""
+        import gc
+        import weakref
+        from core.security import SecurityPolicy, intern_policy
+        policy = intern_policy(SecurityPolicy(blocked_ips={"10.9.8.7"}, allowed_syscalls={"read"},
+                                              path_rules={"/freed": "deny"}))
+        compiled = policy.compiled
+        refs = [weakref.ref(policy), weakref.ref(compiled.syscalls),
+                weakref.ref(compiled.network), weakref.ref(compiled.paths)]
+        del policy, compiled
+        gc.collect()
+        assert all(ref() is None for ref in refs)
+
+    def test_host_mount_rule_follows_policy(self):
+        """allow_host_mount odstraní pravidlo /host jen ze zkompilované politiky"""
+        from core.security import SecurityPolicy
+        policy = SecurityPolicy(allow_host_mount=True)
+        assert policy.path_rules == {"/host": "deny"}
+        assert policy.compiled.paths.decide("/host/etc") == "allow"
+        assert SecurityPolicy().compiled.paths.decide("/host/etc") == "deny"
+
+
+class TestEventLog:
+    """Testy trvalého logu událostí"""
+    
+    def test_filters_and_sparse_index(self, tmp_path):
+        """Čtení filtruje podle sandboxu, času a typu přes sparse index"""
+        from core.event_log import EventLog
+        log = EventLog(str(tmp_path), block_bytes=512, segment_bytes=8192)
+        for i in range(600):
+            log.append("state" if i % 2 else "violation", f"sb{i % 3}",
+                       {"i": i}, timestamp=1000.0 + i)
+        assert log.flush(timeout=5)
+        
+        reader = log.reader()
+        assert [e.data["i"] for e in reader.read(sandbox_id="sb1")] == list(range(1, 600, 3))
+        window = list(reader.read(since=1100.0, until=1109.0, event_types=["violation"]))
+        assert [e.data["i"] for e in window] == [100, 102, 104, 106, 108]
+        assert window[0].sandbox_id == "sb1" and window[0].event_type == "violation"
+        
+        segments = sorted(tmp_path.glob("events-*.log"))
+        assert len(segments) > 1
+        assert all(seg.with_suffix(".idx").stat().st_size > 0 for seg in segments[:-1])
+        log.close()
+        assert not log.append("state", "sb0")
+    
+    def test_recovers_torn_tail(self, tmp_path):
+        """Nedokončený zápis na konci segmentu se při otevření ořízne"""
+        from core.event_log import EventLog, EventLogReader
+        log = EventLog(str(tmp_path), block_bytes=256)
+        for i in range(50):
+            log.append("exec", "sb", {"i": i})
+        log.close()
+        segment = next(tmp_path.glob("events-*.log"))
+        segment.with_suffix(".idx").write_bytes(b"")  # Index se nestihl zapsat
+        with open(segment, "ab") as f:
+            f.write(b"\x10\x00\x00\x00garbage")
+        
+        log = EventLog(str(tmp_path), block_bytes=256)
+        log.append("exec", "sb", {"i": 50})
+        log.close()
+        events = list(EventLogReader(str(tmp_path)).read(sandbox_id="sb"))
+        assert [e.data["i"] for e in events] == list(range(51))
+        assert segment.with_suffix(".idx").stat().st_size > 0
+    
+    def test_failed_commit_is_rolled_back(self, tmp_path):
+        """Neúspěšný zápis nezanechá částečný rámec a flush() ho ohlásí"""
+        from unittest.mock import patch
+        from core.event_log import EventLog, EventLogReader
+        log = EventLog(str(tmp_path), block_bytes=256)
+        for i in range(10):
+            log.append("exec", "sb", {"i": i})
+        assert log.flush(timeout=5)
+        segment = next(tmp_path.glob("events-*.log"))
+        size, index_size = segment.stat().st_size, segment.with_suffix(".idx").stat().st_size
+    
+        with patch("core.event_log.os.fdatasync", side_effect=OSError("EIO")):
+            for i in range(10, 20):
+                log.append("exec", "sb", {"i": i})
+            assert not log.flush(timeout=5)
+        assert segment.stat().st_size == size
+        assert segment.with_suffix(".idx").stat().st_size == index_size
+        assert log.get_metrics()["errors"] == 1
+    
+        for i in range(20, 30):
+            log.append("exec", "sb", {"i": i})
+        assert log.flush(timeout=5)
+        log.close()
+        events = list(EventLogReader(str(tmp_path)).read(sandbox_id="sb"))
+        assert [e.data["i"] for e in events] == list(range(10)) + list(range(20, 30))
+    
+    def test_violations_are_persisted(self, tmp_path):
+        """Porušení security manageru jdou do logu bez blokování"""
+        from core.event_log import EventLog
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        log = EventLog(str(tmp_path), flush_interval_ms=1)
+        manager = SandboxSecurityManager(
+            "sb", SecurityPolicy(blocked_ips={"10.0.0.0/8"}), event_log=log
+        )
+        manager.check_network_access("10.0.0.1", 80)
+        manager.check_file_access("/host/etc/shadow")
+        assert log.flush(timeout=5)
+        
+        events = list(log.reader().read(sandbox_id="sb", event_types=["violation"]))
+        assert [e.data["type"] for e in events] == ["network_violation", "file_access_violation"]
+        assert log.get_metrics()["fsyncs"] >= 1
+        log.close()
+
+
+class TestEventBus:
+    """Testy sběrnice událostí"""
+    
+    async def test_filters_by_topic_sandbox_and_labels(self):
+        """Odběr dostane jen události odpovídající filtrům"""
+        from core.event_bus import EventBus
+        bus = EventBus()
+        assert bus.publish("state", "sb1", {"state": "running"}) == 0
+        
+        by_sandbox = bus.subscribe(sandbox_id="sb1")
+        by_label = bus.subscribe(topics=["violation"], labels={"team": "ml"})
+        assert bus.has_subscribers("stats") and not EventBus().has_subscribers("stats")
+        
+        bus.publish("state", "sb1", {"state": "running"}, {"team": "web"})
+        bus.publish("violation", "sb2", {"type": "x"}, {"team": "ml"})
+        bus.publish("violation", "sb3", {"type": "y"}, {"team": "web"})
+        
+        assert [e.topic for e in by_sandbox.drain()] == ["state"]
+        event = await asyncio.wait_for(by_label.get(), 1)
+        assert event.sandbox_id == "sb2" and by_label.get_nowait() is None
+        
+        by_label.close()
+        by_sandbox.close()
+        assert bus.get_metrics()["subscriptions"] == 0
+        assert bus.publish("violation", "sb2", {}, {"team": "ml"}) == 0
+    
+    async def test_drop_policies_and_close(self):
+        """Plná fronta zahazuje podle politiky, close() ukončí iteraci"""
+        from core.event_bus import EventBus, DROP_NEWEST
+        bus = EventBus()
+        oldest = bus.subscribe(maxsize=2)
+        newest = bus.subscribe(maxsize=2, drop_policy=DROP_NEWEST)
+        for i in range(5):
+            bus.publish("stats", "sb", {"i": i})
+        assert [e.data["i"] for e in oldest.drain()] == [3, 4]
+        assert [e.data["i"] for e in newest.drain()] == [0, 1]
+        assert oldest.dropped == newest.dropped == 3
+        
+        async def consume():
+            return [event async for event in oldest]
+        
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0)
+        bus.publish("stats", "sb", {"i": 5})
+        await asyncio.sleep(0)
+        oldest.close()
+        events = await asyncio.wait_for(task, 1)
+        assert [e.data["i"] for e in events] == [5]
+    
+    async def test_state_changes_and_violations_are_published(self):
+        """Změna stavu sandboxu a porušení politiky se publikují"""
+        from unittest.mock import MagicMock
+        from core.event_bus import EventBus
+        from core.security import SandboxSecurityManager, SecurityPolicy
+        bus = EventBus()
+        subscription = bus.subscribe(labels={"env": "test"})
+        hypervisor = MagicMock()
+        hypervisor.event_bus = bus
+        sandbox = Sandbox(
+            sandbox_id="sb", config=SandboxConfig(labels={"env": "test"}),
+            hypervisor=hypervisor, state=SandboxState.RUNNING
+        )
+        sandbox.state = SandboxState.PAUSED
+        sandbox.state = SandboxState.PAUSED
+        
+        manager = SandboxSecurityManager(
+            "sb", SecurityPolicy(blocked_ips={"10.0.0.0/8"}),
+            event_bus=bus, labels={"env": "test"}
+        )
+        manager.check_network_access("10.0.0.1", 80)
+        
+        events = subscription.drain()
+        assert [(e.topic, e.data.get("state")) for e in events] == [
+            ("state", "running"), ("state", "paused"), ("violation", None)
+        ]
+        assert events[1].data["previous"] == "running"
+        assert events[2].data["type"] == "network_violation"
+
+
+class TestSandboxRegistry:
+    """Testy indexovaného registru sandboxů"""
+    
+    def _registry(self):
+        from unittest.mock import MagicMock
+        from core.registry import SandboxRegistry
+        hypervisor = MagicMock(event_bus=None)
+        hypervisor.registry = hypervisor._sandboxes = SandboxRegistry()
+        for i, (team, env) in enumerate([("ml", "dev"), ("ml", "prod"), ("web", "dev"), ("web", None)]):
+            labels = {"team": team, **({"env": env} if env else {})}
+            hypervisor.registry[f"sb{i}"] = Sandbox(
+                sandbox_id=f"sb{i}",
+                config=SandboxConfig(template_id="alpine" if i % 2 else "ubuntu", labels=labels),
+                hypervisor=hypervisor,
+                state=SandboxState.RUNNING
+            )
+        return hypervisor.registry
+    
+    def test_selectors(self):
+        """Selektory ve stylu Kubernetes"""
+        registry = self._registry()
+        
+        def ids(*args, **kwargs):
+            return sorted(s.sandbox_id for s in registry.select(*args, **kwargs))
+        
+        assert ids("team=ml") == ["sb0", "sb1"]
+        assert ids("team==web,env") == ["sb2"]
+        assert ids("env in (dev, prod),team!=ml") == ["sb2"]
+        assert ids("!env") == ["sb3"]
+        assert ids("env notin (dev)") == ["sb1", "sb3"]
+        assert ids({"team": "web"}, template_id="alpine") == ["sb3"]
+        assert ids("team=nobody") == []
+        with pytest.raises(ValueError):
+            registry.select("team=(x")
+    
+    def test_state_index_follows_sandbox(self):
+        """Změna stavu a odebrání sandboxu aktualizují indexy"""
+        registry = self._registry()
+        snapshot = registry.snapshot()
+        registry["sb1"].state = SandboxState.PAUSED
+        assert registry.count(state=SandboxState.RUNNING) == 3
+        assert [s.sandbox_id for s in registry.select("team=ml", state=SandboxState.PAUSED)] == ["sb1"]
+        
+        for sandbox_id in registry:
+            if sandbox_id != "sb1":
+                del registry[sandbox_id]
+        assert registry.snapshot() is not snapshot and len(snapshot) == 4
+        assert registry.get_metrics()["by_state"] == {"paused": 1}
+        assert registry.select("team=web") == []
+
+
+class TestLeases:
+    """Testy timer wheelu a leasů sandboxů"""
+    
+    def test_timer_wheel_matches_reference(self):
+        """Časovače přes všechny úrovně vyprší přesně v termínu"""
+        import random
+        from core.timer_wheel import TimerWheel
+        now = [0.0]
+        wheel = TimerWheel(tick_s=1.0, slot_bits=4, levels=3, clock=lambda: now[0])
+        rng = random.Random(7)
+        deadlines = {i: float(rng.randrange(1, 6000)) for i in range(2000)}
+        for key, deadline in deadlines.items():
+            wheel.schedule(key, deadline)
+        for key in range(0, 2000, 10):
+            wheel.cancel(key)
+            del deadlines[key]
+        wheel.schedule(1, 50.0)
+        deadlines[1] = 50.0
+        
+        fired = {}
+        while now[0] < 6000:
+            now[0] += rng.choice([1, 3, 17, 64])
+            for key in wheel.advance():
+                fired[key] = now[0]
+        assert fired.keys() == deadlines.keys() and len(wheel) == 0
+        assert all(deadlines[key] <= at and (at - deadlines[key]) < 64 for key, at in fired.items())
+    
+    async def test_ttl_idle_and_renew(self):
+        """TTL i nečinnost vyprší, aktivita a renew je odsouvají"""
+        from unittest.mock import AsyncMock, MagicMock
+        from core.leases import LeaseManager
+        from core.registry import SandboxRegistry
+        now = [1000.0]
+        hypervisor = MagicMock(event_bus=None)
+        hypervisor._sandboxes = SandboxRegistry()
+        hypervisor.stop_sandboxes = AsyncMock(side_effect=lambda ids, force: {i: True for i in ids})
+        leases = hypervisor.leases = LeaseManager(hypervisor, tick_s=1.0, clock=lambda: now[0])
+        
+        configs = {"ttl": SandboxConfig(ttl_s=60), "idle": SandboxConfig(idle_timeout_s=10),
+                   "none": SandboxConfig()}
+        for sandbox_id, config in configs.items():
+            sandbox = Sandbox(sandbox_id=sandbox_id, config=config, hypervisor=hypervisor,
+                              created_at=now[0])
+            hypervisor._sandboxes[sandbox_id] = sandbox
+            leases.track(sandbox)
+        assert len(leases) == 2 and leases.remaining("none") is None
+        
+        now[0] += 8
+        leases.touch("idle")
+        assert await leases.reap_once() == 0
+        now[0] += 9
+        assert await leases.reap_once() == 0  # Aktivita odsunula idle timeout
+        assert hypervisor._sandboxes["ttl"].renew(100) == 100
+        now[0] += 5
+        assert await leases.reap_once() == 1
+        hypervisor.stop_sandboxes.assert_awaited_with(["idle"], force=True)
+        
+        now[0] += 95
+        assert await leases.reap_once() == 1
+        assert leases.get_metrics()["expired_ttl"] == 1
+        assert leases.get_metrics()["expired_idle"] == 1
+        assert leases.get_metrics()["active"] == 0
+    
+    async def test_failed_stop_is_retried(self):
+        """Sandbox, který se nepodařilo zastavit, se zastaví znovu po odstupu"""
+        from unittest.mock import AsyncMock, MagicMock
+        from core.leases import LeaseManager, LEASE_RETRY_BASE_S
+        from core.registry import SandboxRegistry
+        now = [1000.0]
+        hypervisor = MagicMock(event_bus=None)
+        hypervisor._sandboxes = SandboxRegistry()
+        outcomes = iter([False, False, True])
+        hypervisor.stop_sandboxes = AsyncMock(
+            side_effect=lambda ids, force: {i: next(outcomes) for i in ids}
+        )
+        leases = hypervisor.leases = LeaseManager(hypervisor, tick_s=1.0, clock=lambda: now[0])
+        sandbox = Sandbox(sandbox_id="sb", config=SandboxConfig(ttl_s=10), hypervisor=hypervisor,
+                          created_at=now[0])
+        hypervisor._sandboxes["sb"] = sandbox
+        leases.track(sandbox)
+    
+        now[0] += 11
+        assert await leases.reap_once() == 0
+        assert "sb" in leases
+        now[0] += LEASE_RETRY_BASE_S - 1
+        assert await leases.reap_once() == 0
+        assert hypervisor.stop_sandboxes.await_count == 1
+        now[0] += 2
+        assert await leases.reap_once() == 0
+        now[0] += LEASE_RETRY_BASE_S  # Druhý odstup je dvojnásobný
+        assert await leases.reap_once() == 0
+        now[0] += LEASE_RETRY_BASE_S + 1
+        assert await leases.reap_once() == 1
+    
+        metrics = leases.get_metrics()
+        assert hypervisor.stop_sandboxes.await_count == 3
+        assert metrics["expired_ttl"] == 1 and metrics["retries"] == 2 and metrics["active"] == 0
 
 
 class TestSandboxState:
@@ -146,6 +1506,261 @@ class TestSandboxObject:
         
         sandbox.state = SandboxState.STOPPED
         assert sandbox.is_running() is False
+    
+    def test_compact_representation(self):
+        """Sloty místo __dict__, sdílené výchozí kontejnery a typovaná metadata"""
+        from unittest.mock import MagicMock
+        from core.sandbox import SandboxMetadata
+        first, second = SandboxConfig(), SandboxConfig(labels={})
+        assert first.labels is second.labels and first.extra_drives is second.extra_drives
+        with pytest.raises(TypeError):
+            first.labels["app"] = "x"
+        
+        sandbox = Sandbox(
+            sandbox_id="test_123", config=first, hypervisor=MagicMock(),
+            metadata={"boot_time_ms": 12.5, "config_file": None, "disk_path": "/d"}
+        )
+        assert not hasattr(sandbox, "__dict__") and not hasattr(first, "__dict__")
+        assert isinstance(sandbox.metadata, SandboxMetadata)
+        assert sandbox.metadata.boot_time_ms == 12.5
+        assert dict(sandbox.metadata) == {"boot_time_ms": 12.5, "disk_path": "/d"}
+        assert sandbox.metadata.get("pid") is None and "config_file" not in sandbox.metadata
+        
+        sandbox.metadata["pid"] = 42
+        del sandbox.metadata["disk_path"]
+        assert {**sandbox.metadata} == {"boot_time_ms": 12.5, "pid": 42}
+    
+    async def test_reset(self):
+        """Reset deleguje na hypervisor a vrátí sandbox do běhu"""
+        from unittest.mock import AsyncMock, MagicMock
+        hypervisor = MagicMock()
+        hypervisor.reset_sandbox = AsyncMock(return_value=True)
+        sandbox = Sandbox(
+            sandbox_id="test_123", config=SandboxConfig(), hypervisor=hypervisor,
+            state=SandboxState.ERROR
+        )
+        assert await sandbox.reset() is True
+        hypervisor.reset_sandbox.assert_awaited_once_with("test_123")
+        assert sandbox.is_running()
+
+
+class TestSandboxStateStore:
+    """Testy perzistentního úložiště stavu"""
+    
+    def test_config_roundtrip(self):
+        """Test serializace konfigurace"""
+        from core.security import SecurityLevel, SecurityPolicy
+        config = SandboxConfig(
+            memory_mb=1024,
+            labels={"team": "x"},
+            security_level=SecurityLevel.STRICT,
+            custom_security_policy=SecurityPolicy(blocked_ips={"10.0.0.1"})
+        )
+        
+        restored = SandboxConfig.from_dict(config.to_dict())
+        
+        assert restored == config
+    
+    def test_put_load_delete(self, tmp_path):
+        """Test uložení, načtení a smazání záznamů"""
+        store = SandboxStateStore(str(tmp_path / "state.db"))
+        for i in range(3):
+            store.put(SandboxRecord(
+                sandbox_id=f"fc_{i}",
+                pid=1000 + i,
+                api_socket=f"/tmp/fc_{i}/api.socket",
+                tap_name=f"tap_{i}",
+                config=SandboxConfig().to_dict()
+            ))
+        store.update_state("fc_1", "paused")
+        store.delete_many(["fc_0", "fc_2"])
+        store.close()
+        
+        # Záznamy přežijí znovuotevření databáze
+        store = SandboxStateStore(str(tmp_path / "state.db"))
+        records = store.load_all()
+        
+        assert [r.sandbox_id for r in records] == ["fc_1"]
+        assert records[0].state == "paused"
+        assert records[0].pid == 1001
+        assert SandboxConfig.from_dict(records[0].config) == SandboxConfig()
+
+
+class TestOrphanReconciler:
+    """Testy reconcileru osiřelých prostředků"""
+    
+    @pytest.mark.asyncio
+    async def test_reclaims_only_confirmed_orphans(self, tmp_path):
+        """Osiřelý adresář se smaže až ve druhém průchodu, vlastněný nikdy"""
+        from unittest.mock import MagicMock
+        owned_dir = tmp_path / "fc_owned"
+        orphan_dir = tmp_path / "fc_orphan"
+        other_dir = tmp_path / "unrelated"
+        for d in (owned_dir, orphan_dir, other_dir):
+            d.mkdir()
+        
+        hypervisor = MagicMock()
+        hypervisor.get_owned_resources.return_value = {
+            "dirs": {str(owned_dir)}, "taps": set(), "pids": set()
+        }
+        reconciler = OrphanReconciler(
+            hypervisor,
+            tmp_dir=str(tmp_path),
+            sys_net_dir=str(tmp_path / "no_net"),
+            proc_dir=str(tmp_path / "no_proc"),
+            min_age_s=0
+        )
+        
+        first = await reconciler.reconcile_once()
+        assert first["dirs"] == 0
+        assert orphan_dir.exists()
+        
+        second = await reconciler.reconcile_once()
+        assert second["dirs"] == 1
+        assert not orphan_dir.exists()
+        assert owned_dir.exists() and other_dir.exists()
+        
+        metrics = reconciler.get_metrics()
+        assert metrics["runs"] == 2
+        assert metrics["orphan_dirs_reclaimed"] == 1
+    
+    def test_scans_only_taps_with_own_alias(self, tmp_path):
+        """Cizí TAP rozhraní (jiný nebo žádný alias) se za osiřelá nepovažují"""
+        from unittest.mock import MagicMock
+        net_dir = tmp_path / "net"
+        for name, alias in (("tap_ours", "novasandbox:abc\n"),
+                            ("tap_other", "novasandbox:xyz\n"),
+                            ("tap_plain", None)):
+            (net_dir / name).mkdir(parents=True)
+            if alias is not None:
+                (net_dir / name / "ifalias").write_text(alias)
+        
+        hypervisor = MagicMock()
+        hypervisor.get_owned_resources.return_value = {
+            "dirs": set(), "taps": set(), "pids": set()
+        }
+        reconciler = OrphanReconciler(
+            hypervisor,
+            tmp_dir=str(tmp_path / "no_tmp"),
+            sys_net_dir=str(net_dir),
+            proc_dir=str(tmp_path / "no_proc"),
+            tap_alias=tap_alias("abc")
+        )
+        assert reconciler.find_orphans()["taps"] == {"tap_ours"}
+        
+        # Bez aliasu instance se TAP rozhraní neuklízí vůbec
+        unscoped = OrphanReconciler(hypervisor, sys_net_dir=str(net_dir), tap_alias="")
+        assert unscoped._scan_taps() == set()
+
+
+class TestFirecrackerReset:
+    """Testy resetu sandboxu ze snapshotu (bez Firecrackeru, VMM je mock)"""
+    
+    def _setup(self, tmp_path, snapshot_capable=True, overlay_path="golden"):
+        from unittest.mock import AsyncMock, MagicMock
+        firecracker = _import_from_package("providers.firecracker")
+        core = _import_from_package("core")
+        store = _import_from_package("core.state_store").SandboxStateStore(str(tmp_path / "state.db"))
+        
+        template = MagicMock(snapshot_capable=snapshot_capable, overlay_size_mb=64,
+                             memory_mb=512, vcpus=2, default_boot_profile="full")
+        golden = tmp_path / "golden.ext4"
+        golden.write_bytes(b"clean overlay")
+        snapshot = MagicMock(key="snap1", overlay_path=str(golden) if overlay_path else None)
+        manager = MagicMock()
+        manager.get_template.return_value = template
+        manager.ensure_golden_snapshot = AsyncMock(return_value=snapshot)
+        
+        hypervisor = firecracker.FirecrackerHypervisor(
+            state_store=store, template_manager=manager, instance_id="test"
+        )
+        hypervisor._spawn_vmm = AsyncMock(return_value=MagicMock(pid=4242))
+        hypervisor._load_snapshot = AsyncMock()
+        
+        sock_dir = tmp_path / "fc_reset"
+        sock_dir.mkdir()
+        (sock_dir / firecracker.OVERLAY_IMAGE_NAME).write_bytes(b"dirty overlay of previous job")
+        old_vmm = MagicMock(returncode=None, wait=AsyncMock())
+        sandbox = core.Sandbox(
+            sandbox_id="fc_reset",
+            config=core.SandboxConfig(template_id="t", boot_profile="full"),
+            hypervisor=hypervisor,
+            state=core.SandboxState.RUNNING,
+            process=old_vmm,
+            metadata={"api_socket": str(sock_dir / "api.socket"), "snapshot_key": "snap1"}
+        )
+        hypervisor._sandboxes["fc_reset"] = sandbox
+        hypervisor._tap_interfaces["fc_reset"] = "tap_reset"
+        return hypervisor, sandbox, snapshot, sock_dir, old_vmm, firecracker
+    
+    async def test_reset_respawns_vmm_with_clean_overlay(self, tmp_path):
+        """Reset zabije VMM, obnoví overlay ze snapshotu, načte snapshot a uloží stav"""
+        hypervisor, sandbox, snapshot, sock_dir, old_vmm, firecracker = self._setup(tmp_path)
+        
+        assert await hypervisor.reset_sandbox("fc_reset")
+        old_vmm.kill.assert_called_once()
+        api_socket = str(sock_dir / "api.socket")
+        assert hypervisor._spawn_vmm.await_args.args[0][:2] == ["--api-sock", api_socket]
+        hypervisor._load_snapshot.assert_awaited_once_with(api_socket, snapshot, "tap_reset")
+        assert (sock_dir / firecracker.OVERLAY_IMAGE_NAME).read_bytes() == b"clean overlay"
+        assert sandbox.process.pid == 4242 and sandbox.state.value == "running"
+        
+        record = hypervisor.state_store.get("fc_reset")
+        assert record.pid == 4242 and record.tap_name == "tap_reset"
+        assert record.metadata["snapshot_key"] == "snap1"
+    
+    @pytest.mark.parametrize("snapshot_capable, overlay_path", [(False, "golden"), (True, None)])
+    async def test_reset_requires_restored_overlay(self, tmp_path, snapshot_capable, overlay_path):
+        """Bez read-only rootfs a overlay ze snapshotu se reset odmítne a VMM zůstane"""
+        hypervisor, sandbox, _, sock_dir, old_vmm, firecracker = self._setup(
+            tmp_path, snapshot_capable, overlay_path
+        )
+        
+        with pytest.raises(RuntimeError):
+            await hypervisor.reset_sandbox("fc_reset")
+        old_vmm.kill.assert_not_called()
+        hypervisor._spawn_vmm.assert_not_awaited()
+        assert sandbox.state.value == "running"
+        overlay = sock_dir / firecracker.OVERLAY_IMAGE_NAME
+        assert overlay.read_bytes() == b"dirty overlay of previous job"
+
+
+class TestApiServer:
+    """Testy REST API (jen s nainstalovaným FastAPI)"""
+    
+    @pytest.mark.parametrize("state", [SandboxState.PAUSED, SandboxState.ERROR])
+    async def test_delete_stops_non_running_sandbox(self, monkeypatch, state):
+        """Smazání pozastaveného sandboxu zastaví VMM přes hypervisor, registr nemění API"""
+        pytest.importorskip("fastapi")
+        import importlib
+        from unittest.mock import AsyncMock, MagicMock
+        from core.registry import SandboxRegistry
+        monkeypatch.setitem(sys.modules, "providers", _import_from_package("providers"))
+        api_server = importlib.import_module("examples.api_server")
+        registry = SandboxRegistry()
+        hypervisor = MagicMock(event_bus=None, registry=registry)
+        
+        async def stop_sandbox(sandbox_id, force=False):
+            del registry[sandbox_id]
+            return True
+        
+        hypervisor.stop_sandbox = AsyncMock(side_effect=stop_sandbox)
+        monkeypatch.setattr(api_server, "hypervisor", hypervisor)
+        monkeypatch.setattr(api_server, "sandboxes_registry", registry)
+        registry["sb"] = Sandbox(sandbox_id="sb", config=SandboxConfig(),
+                                 hypervisor=hypervisor, state=state)
+        
+        await api_server.delete_sandbox("sb")
+        hypervisor.stop_sandbox.assert_awaited_once_with("sb", force=True)
+        assert "sb" not in registry
+        
+        registry["sb"] = Sandbox(sandbox_id="sb", config=SandboxConfig(),
+                                 hypervisor=hypervisor, state=state)
+        hypervisor.stop_sandbox = AsyncMock(return_value=False)
+        with pytest.raises(api_server.HTTPException) as exc_info:
+            await api_server.delete_sandbox("sb")
+        assert exc_info.value.status_code == 500
+        assert "sb" in registry  # Nezastavený VMM zůstává sledovaný
 
 
 @pytest.mark.asyncio